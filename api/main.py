@@ -1,11 +1,18 @@
 from fastapi import FastAPI, UploadFile, File,Form, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from typing import List, Dict, Any, Optional
 from pathlib import Path
+from functools import lru_cache
+from contextlib import asynccontextmanager, contextmanager
 import os
+import json
+import time
+import uuid
+import asyncio
+import structlog
 
 from src.document_ingestion.data_ingestion import (
     DocumentHandler, 
@@ -14,15 +21,50 @@ from src.document_ingestion.data_ingestion import (
     ChatIngestor
 )
 
+from src.document_ingestion.index_jobs import get_index_job_queue
 from src.document_analyzer.data_analysis import DocumentAnalyzer
+from src.document_analyzer.batch_analysis import BatchAnalyzer, BatchItem, collect_directory, fail_orphaned_batches
 from src.document_compare.document_comparer import DocumentComparerLLM
+from src.document_compare.page_diff import page_sort_key
 from src.document_chat.retrieval import ConversationRAG
+from src.document_chat.chat_memory import get_chat_memory
+from utils.vectorstore_cache import get_vectorstore_cache
+from utils.concurrency import run_blocking
+from utils.file_io import UploadTooLargeError
+from utils.result_cache import get_result_cache
+from utils.job_store import get_job_store, FINISHED, DONE, CANCELLED
+from utils.file_io import new_session_id, validate_session_id, InvalidSessionIdError
+from utils.config_loader import load_config
+from utils.metrics import observe_http, render_latest
+from utils.storage_manager import get_storage_manager
+from utils.chunker import chunk_config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+UPLOAD_BASE = os.getenv("UPLOAD_BASE", str(BASE_DIR / "data"))
+FAISS_BASE = os.getenv("FAISS_BASE", str(BASE_DIR / "faiss_index"))
 
 
 
-app = FastAPI(title = "Document Portal API", version="0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ## background indexing workers of this process (every uvicorn worker runs its own pool)
+    queue = get_index_job_queue()
+    queue.start()
+    ## batches of a worker that died never finish: report them as failed
+    await run_blocking(fail_orphaned_batches)
+    ## session storage eviction (TTL, then LRU over the global quota); one worker sweeps at a time
+    storage = get_storage_manager()
+    sweeper = None
+    if storage is not None:
+        interval = float((load_config().get("storage") or {}).get("sweep_interval_s", 300))
+        sweeper = asyncio.create_task(storage.run_sweeper(interval))
+    yield
+    if sweeper is not None:
+        sweeper.cancel()
+        await asyncio.gather(sweeper, return_exceptions=True)
+    await queue.stop()
+
+app = FastAPI(title = "Document Portal API", version="0.1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,6 +74,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+## per-request trace id in every log line of the request (X-Request-ID is honoured and echoed)
+TRACE_IDS = bool((load_config().get("metrics") or {}).get("trace_ids", True))
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    trace_id = None
+    if TRACE_IDS:
+        trace_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        structlog.contextvars.bind_contextvars(trace_id=trace_id)
+    try:
+        response = await call_next(request)
+    finally:
+        if TRACE_IDS:
+            structlog.contextvars.unbind_contextvars("trace_id")
+    ## route template, not the raw path, keeps the label set bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    observe_http(request.method, route, response.status_code, time.perf_counter() - start)
+    if trace_id:
+        response.headers["X-Request-ID"] = trace_id
+    return response
+
 ## serving static and the templates
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
 templates = Jinja2Templates(directory=BASE_DIR / "templates")
@@ -41,83 +105,350 @@ async def serve_ui(request : Request):
     ## renders template/index.html
     return templates.TemplateResponse("index.html",{"request": request})
 
+@app.get("/metrics")
+def metrics() -> Response:
+    """Prometheus metrics: stage and request latencies, LLM calls/tokens/cost, cache hits"""
+    try:
+        data, content_type = render_latest()
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return Response(content=data, media_type=content_type)
+
+@app.get("/storage/stats")
+async def storage_stats(top: int = 10) -> Any:
+    """Disk usage of session uploads and indexes, quotas, largest sessions and the last sweep"""
+    storage = get_storage_manager()
+    if storage is None:
+        return {"enabled": False}
+    return {"enabled": True, **await run_blocking(storage.stats, top)}
+
 @app.get("/health")
 def health() -> Dict[str,str]:
     return {"status":"ok", "service": "document-portal"}
 
+## analyzer and comparer hold no per-request state, so one instance per process is
+## shared by every request (their llm clients and chains come from the ModelLoader registry)
+@lru_cache(maxsize=1)
+def get_analyzer() -> DocumentAnalyzer:
+    return DocumentAnalyzer()
+
+@lru_cache(maxsize=1)
+def get_comparer() -> DocumentComparerLLM:
+    return DocumentComparerLLM()
+
+@lru_cache(maxsize=1)
+def get_batch_analyzer() -> BatchAnalyzer:
+    return BatchAnalyzer(get_analyzer())
+
+## strong references to running background jobs (the event loop only keeps weak ones)
+_background_tasks: set = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 class FastAPIFileAdapter:
-    """Adapt FastAPI UploadFile -> .name + .getbuffer() API"""
+    """Adapt FastAPI UploadFile -> .name + .size + .stream() API (.getbuffer() kept for compatibility)"""
     
     def __init__(self, uf: UploadFile):
         self._uf = uf
         self.name = uf.filename
+        self.size = uf.size
+    
+    def stream(self):
+        """Binary file object of the (spooled) upload, read in chunks by utils.file_io.save_upload"""
+        self._uf.file.seek(0)
+        return self._uf.file
         
     def getbuffer(self) -> bytes:
         self._uf.file.seek(0)
         return self._uf.file.read()
 
-def _read_pdf_via_handler(handler: DocumentHandler, path:str) ->str:
-    """Utility function to read pdf via DocumentHandler
+async def _read_pdf_via_handler(handler: DocumentHandler, path:str, file_hash: Optional[str] = None) ->str:
+    """Utility function to read pdf via DocumentHandler (off the event loop)
     """
     try:
-        pass
+        return await handler.aread_pdf(path, file_hash)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading PDF : {str(e)}")
 
+async def _cached_result(key: str) -> Optional[Any]:
+    """Result cache lookup off the event loop, None on a miss or when the cache is disabled"""
+    cache = get_result_cache()
+    return await run_blocking(cache.get, key) if cache is not None else None
+
+async def _store_result(key: str, value: Any, kind: str):
+    cache = get_result_cache()
+    if cache is not None:
+        await run_blocking(cache.put, key, value, kind)
+
+async def _chat_history(session_id: Optional[str]) -> list:
+    """Token-budgeted history of a chat session (empty without a session or with memory disabled)"""
+    memory = get_chat_memory()
+    if memory is None or not session_id:
+        return []
+    return await run_blocking(memory.history, session_id)
+
+async def _remember_turn(session_id: Optional[str], question: str, answer: str):
+    """Store the turn, then summarize old turns in the background if the session is over budget"""
+    memory = get_chat_memory()
+    if memory is None or not session_id:
+        return
+    await run_blocking(memory.append, session_id, question, answer)
+    _spawn(memory.acompact(session_id))
+
+def _ndjson(obj: Any) -> str:
+    """One newline delimited JSON record"""
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+@contextmanager
+def _session_in_use(session_id: Optional[str], index_path: str):
+    """Mark a session as used and keep its index from being evicted while a query runs"""
+    storage = get_storage_manager()
+    if storage is None or not session_id:
+        yield
+        return
+    storage.touch(session_id)
+    with storage.pin(index_path):
+        yield
+
+def _checked_session_id(session_id: Optional[str]) -> Optional[str]:
+    """Client supplied session id (it names directories): 400 unless validate_session_id accepts it"""
+    if not session_id:
+        return None
+    try:
+        return validate_session_id(session_id)
+    except InvalidSessionIdError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _sse(data: Any, event: Optional[str] = None) -> str:
+    """One Server-Sent Events message"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/analyze")
 async def analyze_documents(file: UploadFile = File(...)) -> Any:
     try:
         ## object of document handler
         dh = DocumentHandler()
-        ## saving the uploaded file
-        save_path = dh.save_pdf(FastAPIFileAdapter(file))
-        ## reading the file content
-        text = _read_pdf_via_handler(dh, save_path)
+        ## streaming the upload to disk, its content hash is computed in the same pass
+        saved = await dh.asave_pdf_with_hash(FastAPIFileAdapter(file))
+        
+        ## shared document analyzer
+        analyzer = get_analyzer()
+        ## same content, prompts and model config analyzed before: skip extraction and the LLM
+        key = analyzer.result_key(saved.sha256)
+        cached = await _cached_result(key)
+        if cached is not None:
+            return JSONResponse(content=cached, headers={"X-Cache": "hit"})
         
-        ## object of document analyzer
-        analyzer = DocumentAnalyzer()
+        ## reading the file content
+        text = await _read_pdf_via_handler(dh, str(saved.path), saved.sha256)
         ## analyzing the document
-        result = analyzer.analyze_document(text)
+        result = await analyzer.aanalyze_document(text)
+        await _store_result(key, result, "analysis")
         
         ## returning the response as JSON response
-        return JSONResponse(content=result)
+        return JSONResponse(content=result, headers={"X-Cache": "miss"})
         
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
+
+
+@app.post("/analyze/stream")
+async def analyze_documents_stream(file: UploadFile = File(...)) -> Any:
+    """Same as /analyze, streamed as NDJSON: partial metadata records, then a final one"""
+    try:
+        dh = DocumentHandler()
+        saved = await dh.asave_pdf_with_hash(FastAPIFileAdapter(file))
+        analyzer = get_analyzer()
+        key = analyzer.result_key(saved.sha256)
+        cached = await _cached_result(key)
+        text = None if cached is not None else await _read_pdf_via_handler(dh, str(saved.path), saved.sha256)
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
     
+    async def _stream():
+        if cached is not None:
+            yield _ndjson({"result": cached, "done": True, "cached": True})
+            return
+        last = None
+        try:
+            async for partial in analyzer.astream_analysis(text):
+                last = partial
+                yield _ndjson({"partial": partial})
+            await _store_result(key, last, "analysis")
+            yield _ndjson({"result": last, "done": True})
+        except Exception as e:
+            yield _ndjson({"error": f"Analysis failed: {e}", "done": True})
     
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+    
+    
+@app.post("/analyze/batch")
+async def analyze_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    directory: Optional[str] = Form(None),
+) -> Any:
+    """Submit many PDFs (uploads and/or an allowed server-side directory) as one background job"""
+    try:
+        batch = get_batch_analyzer()
+        ## directory files are hashed by the job itself, uploads while they stream to disk
+        items = await run_blocking(collect_directory, directory, batch.allowed_dirs) if directory else []
+        handler = DocumentHandler(session_id=new_session_id("batch"))
+        for f in files or []:
+            saved = await handler.asave_pdf_with_hash(FastAPIFileAdapter(f))
+            items.append(BatchItem(name=f.filename, path=saved.path, sha256=saved.sha256))
+        
+        job_id = await run_blocking(batch.submit, items)
+        _spawn(batch.run(job_id, items, handler))
+        return {"job_id": job_id, "total": len(items), "status_url": f"/analyze/batch/{job_id}",
+                "results_url": f"/analyze/batch/{job_id}/results"}
+        
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch submission failed: {e}")
+
+
+@app.get("/analyze/batch/{job_id}")
+async def analyze_batch_status(job_id: str) -> Any:
+    job = await run_blocking(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+@app.get("/analyze/batch/{job_id}/results")
+async def analyze_batch_results(job_id: str, after: int = 0, follow: bool = True) -> Any:
+    """NDJSON of finished documents in completion order; with follow, stays open until the job ends.
+    `after` resumes from the last seen result id."""
+    store = get_job_store()
+    if await run_blocking(store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    async def _stream():
+        last = after
+        while True:
+            ## status read before results, so nothing appended in between is missed
+            job = await run_blocking(store.get, job_id)
+            rows = await run_blocking(store.results, job_id, last)
+            for rid, item in rows:
+                last = rid
+                yield _ndjson({"id": rid, **item})
+            if rows:
+                continue
+            if not follow or job["status"] in FINISHED:
+                yield _ndjson({"job_id": job_id, "status": job["status"], "done": job["done"],
+                               "failed": job["failed"], "total": job["total"], "end": True})
+                return
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
 @app.post("/compare")
 async def compare_documents(reference: UploadFile = File(...), actual: UploadFile = File(...)) -> Any:
     try:
         dc = DocumentComparator()
         
-        ref_path, act_path = dc.save_uploaded_files(FastAPIFileAdapter(reference), FastAPIFileAdapter(actual))
+        ref, act = await dc.asave_uploads(FastAPIFileAdapter(reference), FastAPIFileAdapter(actual))
         
-        _ = ref_path, act_path
-        combined_test = dc.combine_documents()
+        comp = get_comparer()
+        key = comp.result_key(ref.sha256, act.sha256)
+        cached = await _cached_result(key)
+        if cached is not None:
+            return JSONResponse(content={'rows': cached, "session_id": dc.session_id}, headers={"X-Cache": "hit"})
         
-        comp = DocumentComparerLLM()
-        df = comp.compare_documents(combined_test)
+        ## page level text, identical pages are resolved locally and only changed pages reach the LLM
+        ref_pages = await dc.aread_pdf_pages(ref.path, ref.sha256)
+        act_pages = await dc.aread_pdf_pages(act.path, act.sha256)
         
-        return {'rows': df.to_dict(orient='records'), "session_id": dc.session_id}
+        df = await comp.acompare_pages(ref_pages, act_pages)
+        rows = df.to_dict(orient='records')
+        await _store_result(key, rows, "page_comparison")
         
+        return JSONResponse(content={'rows': rows, "session_id": dc.session_id}, headers={"X-Cache": "miss"})
+        
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Comparison failed: {e}")
+
+
+@app.post("/compare/stream")
+async def compare_documents_stream(reference: UploadFile = File(...), actual: UploadFile = File(...)) -> Any:
+    """Same as /compare, streamed as NDJSON: NO CHANGE rows first, then each changed page's row as soon as it is ready"""
+    try:
+        dc = DocumentComparator()
+        ref, act = await dc.asave_uploads(FastAPIFileAdapter(reference), FastAPIFileAdapter(actual))
+        comp = get_comparer()
+        key = comp.result_key(ref.sha256, act.sha256)
+        cached = await _cached_result(key)
+        if cached is None:
+            ref_pages = await dc.aread_pdf_pages(ref.path, ref.sha256)
+            act_pages = await dc.aread_pdf_pages(act.path, act.sha256)
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Comparison failed: {e}")
     
+    async def _stream():
+        if cached is not None:
+            for row in cached:
+                yield _ndjson({"row": row})
+            yield _ndjson({"session_id": dc.session_id, "done": True, "cached": True})
+            return
+        try:
+            rows = []
+            async for row in comp.astream_page_rows(ref_pages, act_pages):
+                rows.append(row)
+                yield _ndjson({"row": row})
+            ## cached in page order, as /compare returns them
+            await _store_result(key, sorted(rows, key=lambda r: page_sort_key(r["Page"])), "page_comparison")
+            yield _ndjson({"session_id": dc.session_id, "done": True})
+        except Exception as e:
+            yield _ndjson({"error": f"Comparison failed: {e}", "session_id": dc.session_id, "done": True})
+    
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+    
     
 @app.post("/chat/index")
 async def chat_built_index(
         files: List[UploadFile] = File(...),
         session_id: Optional[str] = Form(None),
         use_session_dirs: bool = Form(True),
-        chunk_size: int = Form(1000),
-        chunk_overlap: int = Form(200),
-        k: int = Form(5)
+        chunk_size: Optional[int] = Form(None),
+        chunk_overlap: Optional[int] = Form(None),
+        k: int = Form(5),
+        wait: bool = Form(False),
 ) -> Any:
+    """Save the uploads and queue indexing as a background job (202 + job id).
+    With wait=true the request waits for the job and answers 200 once the index is written.
+    chunk_size/chunk_overlap are in the configured chunking unit (tokens by default)."""
+    session_id = _checked_session_id(session_id)
+    try:
+        chunk_config(chunk_size, chunk_overlap)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     try:  
         wrapped = [FastAPIFileAdapter(f) for f in files]
         ci = ChatIngestor(
@@ -127,37 +458,75 @@ async def chat_built_index(
             session_id = session_id or None,
         )
         
-        ci.built_retriever(wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k)
+        ## only the upload happens in the request, parsing/embedding/writing run in the worker pool
+        saved = await ci.asave_uploads(wrapped, isolated=True)
+        queue = get_index_job_queue()
+        job_id = await run_blocking(queue.enqueue, ci, saved, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        if wait:
+            ## through the queue too, so writes to one session index stay serialized
+            job = await queue.wait(job_id)
+            if job is None or job["status"] != DONE:
+                status = 409 if job and job["status"] == CANCELLED else 500
+                detail = (job or {}).get("error") or (job or {}).get("status", "job lost")
+                raise HTTPException(status_code=status, detail=f"Indexing failed: {detail}")
+            return {"session_id":ci.session_id, "k":k, "use_session_dirs": use_session_dirs, "job_id": job_id}
         
-        return {"session_id":ci.session_id, "k":k, "use_session_dirs": use_session_dirs}
+        return JSONResponse(status_code=202, content={
+            "session_id": ci.session_id, "k": k, "use_session_dirs": use_session_dirs,
+            "job_id": job_id, "status": "queued", "status_url": f"/chat/index/jobs/{job_id}",
+        })
         
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Indexing failed: {e}")
     
 
-@app.post("chat/query")
+@app.get("/chat/index/jobs/{job_id}")
+async def chat_index_job_status(job_id: str) -> Any:
+    """Status and stage progress (parsed pages, chunks embedded, vectors written) of an indexing job"""
+    job = await run_blocking(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+@app.post("/chat/index/jobs/{job_id}/cancel")
+async def chat_index_job_cancel(job_id: str) -> Any:
+    """Cancel a queued job, or stop a running one before it writes to the index"""
+    job = await run_blocking(get_job_store().request_cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+@app.post("/chat/query")
 async def chat_query(
     question: str = Form(...),
     session_id: Optional[str]  =Form(None),
     use_session_dirs: bool = Form(True),
     k: int = Form(5),
 )->Any:
+    session_id = _checked_session_id(session_id)
     try:
         if use_session_dirs and not session_id:
             raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs is True")
         
         ## Prepare FAISS index path
         index_path = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
-        if not os.path.isdir(index_path):
+        if index_path not in get_vectorstore_cache() and not os.path.isdir(index_path):
             raise HTTPException(status_code=400, detail=f"FAISS index not found at {index_path}")
         
-        ## Initialize LCEL-style RAG pipeline
-        rag = ConversationRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(index_path)
-        
-        response = rag.invoke(question, chat_history=[])
+        ## Initialize LCEL-style RAG pipeline, vector store comes from the process cache
+        with _session_in_use(session_id if use_session_dirs else None, index_path):
+            rag = ConversationRAG(session_id=session_id)
+            await run_blocking(rag.load_retriever_from_faiss, index_path, k=k)
+            
+            history = await _chat_history(session_id)
+            response = await rag.ainvoke(question, chat_history=history)
+        await _remember_turn(session_id, question, response)
         
         return {
             "answer": response,
@@ -168,4 +537,55 @@ async def chat_query(
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+
+@app.post("/chat/query/stream")
+async def chat_query_stream(
+    question: str = Form(...),
+    session_id: Optional[str]  =Form(None),
+    use_session_dirs: bool = Form(True),
+    k: int = Form(5),
+)->Any:
+    """Same as /chat/query, answer tokens streamed as Server-Sent Events"""
+    session_id = _checked_session_id(session_id)
+    try:
+        if use_session_dirs and not session_id:
+            raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs is True")
+        
+        index_path = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
+        if index_path not in get_vectorstore_cache() and not os.path.isdir(index_path):
+            raise HTTPException(status_code=400, detail=f"FAISS index not found at {index_path}")
+        
+        with _session_in_use(session_id if use_session_dirs else None, index_path):
+            rag = ConversationRAG(session_id=session_id)
+            await run_blocking(rag.load_retriever_from_faiss, index_path, k=k)
+        history = await _chat_history(session_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+    
+    async def _stream():
+        ## pinned again for as long as tokens are streamed
+        with _session_in_use(session_id if use_session_dirs else None, index_path):
+            try:
+                answer = []
+                async for token in rag.astream(question, chat_history=history):
+                    answer.append(token)
+                    yield _sse({"token": token})
+                await _remember_turn(session_id, question, "".join(answer))
+                yield _sse({"session_id": session_id, "k": k, "engine": "LCEL-RAG"}, event="end")
+            except Exception as e:
+                yield _sse({"error": f"Query failed: {e}"}, event="error")
+    
+    return StreamingResponse(_stream(), media_type="text/event-stream")
+
+
+@app.delete("/chat/history/{session_id}")
+async def chat_history_clear(session_id: str) -> Any:
+    """Forget the conversation of a session (its index is kept)"""
+    memory = get_chat_memory()
+    if memory is not None:
+        await run_blocking(memory.clear, session_id)
+    return {"session_id": session_id, "cleared": memory is not None}
@@ -0,0 +1,90 @@
+"""Latency of DocumentAnalyzer single-shot vs map-reduce analysis as page count grows.
+
+Runs offline against the `fake` LLM provider from config.yaml, whose latency grows with
+prompt and reply tokens like a hosted model. Usage (from the repo root):
+
+    python -m benchmarks.bench_analysis_mapreduce --pages 5 20 50 100 200 400
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+## the fake provider needs no credentials, placeholders satisfy ModelLoader's env check
+os.environ["LLM_PROVIDER"] = "fake"
+for _key in ("GOOGLE_API_KEY", "GROQ_API_KEY", "OPENAI_API_KEY"):
+    os.environ.setdefault(_key, "offline")
+
+from utils.model_loader import get_model_loader
+from utils.tokens import count_tokens
+from src.document_analyzer.data_analysis import DocumentAnalyzer
+
+## context window of the production model (gpt-4o-mini)
+CONTEXT_WINDOW_TOKENS = 128_000
+
+FAKE_METADATA = json.dumps({
+    "Summary": ["Synthetic report section covering quarterly operations and outlook."],
+    "Title": "Synthetic Report", "Author": "Benchmark", "DateCreated": "2024-01-01",
+    "LastModifiedDate": "2024-01-01", "Publisher": "Unknown", "Language": "English",
+    "PageCount": "Unknown", "SentimentTone": "Neutral",
+})
+
+PARAGRAPH = ("The committee reviewed operating results, capital allocation and risk exposure for the period. "
+             "Revenue grew in the core segments while costs were held flat through procurement savings. ")
+
+
+def synthetic_document(pages: int, words_per_page: int = 400) -> str:
+    repeats = max(1, words_per_page // len(PARAGRAPH.split()))
+    return "\n".join(f"\n--- Page {n} ---\n" + PARAGRAPH * repeats for n in range(1, pages + 1))
+
+
+async def time_analysis(analyzer: DocumentAnalyzer, text: str, single_shot: bool) -> float:
+    saved = analyzer.single_shot_max_tokens
+    if single_shot:
+        analyzer.single_shot_max_tokens = float("inf")
+    try:
+        start = time.perf_counter()
+        await analyzer.aanalyze_document(text)
+        return time.perf_counter() - start
+    finally:
+        analyzer.single_shot_max_tokens = saved
+
+
+async def main(pages_list, section_tokens):
+    llm = get_model_loader().load_llm()
+    llm.responder = lambda prompt: FAKE_METADATA
+    analyzer = DocumentAnalyzer()
+    if section_tokens:
+        analyzer.section_tokens = section_tokens
+
+    results = []
+    for pages in pages_list:
+        text = synthetic_document(pages)
+        tokens = count_tokens(text)
+        single = await time_analysis(analyzer, text, single_shot=True)
+        calls_before = llm.calls
+        auto = await time_analysis(analyzer, text, single_shot=False)
+        results.append({
+            "pages": pages,
+            "document_tokens": tokens,
+            "single_shot_s": round(single, 3),
+            "single_shot_fits_context": tokens < CONTEXT_WINDOW_TOKENS,
+            "auto_s": round(auto, 3),
+            "auto_mode": "map_reduce" if analyzer._is_large(text) else "single_shot",
+            "auto_llm_calls": llm.calls - calls_before,
+        })
+        print(json.dumps(results[-1]), flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 50, 100, 200, 400])
+    parser.add_argument("--section-tokens", type=int, default=None, help="override document_analysis.section_tokens")
+    args = parser.parse_args()
+    asyncio.run(main(args.pages, args.section_tokens))
@@ -0,0 +1,94 @@
+"""Chunking throughput: LangChain RecursiveCharacterTextSplitter vs. utils.chunker.TokenChunker.
+
+Generates pages of contract-like text (paragraphs of varying length, some long lines
+without paragraph breaks) and splits them with both splitters at the same nominal size:
+chunk_size tokens for the token chunker, chunk_size * CHARS_PER_TOKEN characters for the
+character splitter. With tiktoken installed the LangChain splitter is also run measuring
+tokens (from_tiktoken_encoder). Prints one JSON line per splitter: MB/s, chunks/s,
+chunk count and the largest chunk in tokens. Usage (from the repo root):
+
+    python -m benchmarks.bench_chunking --mb 20 --chunk-size 256 --chunk-overlap 48
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from utils.chunker import TokenChunker
+from utils.tokens import CHARS_PER_TOKEN, _encoding, count_tokens
+
+WORDS = ("the supplier shall deliver goods described in schedule within thirty days of each purchase order "
+         "and the buyer may terminate this agreement upon written notice if payment is not received").split()
+
+
+def build_pages(mb: float, page_chars: int = 3000, seed: int = 7):
+    rng = random.Random(seed)
+    pages, size = [], 0
+    while size < mb * 1024 * 1024:
+        paragraphs, length = [], 0
+        while length < page_chars:
+            sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 30))).capitalize() + "."
+                         for _ in range(rng.randint(1, 8))]
+            ## every fifth paragraph is one long line, as in PDFs without paragraph breaks
+            paragraph = " ".join(sentences) if len(paragraphs) % 5 else "\n".join(sentences)
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        text = "\n\n".join(paragraphs)
+        pages.append(Document(page_content=text, metadata={"source": "bench.pdf", "page": len(pages)}))
+        size += len(text.encode("utf-8"))
+    return pages, size
+
+
+def run(name: str, split, pages, size: int, encoding: str) -> dict:
+    start = time.perf_counter()
+    chunks = list(split(iter(pages)))
+    elapsed = time.perf_counter() - start
+    return {
+        "splitter": name,
+        "pages": len(pages),
+        "mb": round(size / 1024 / 1024, 2),
+        "chunks": len(chunks),
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size / 1024 / 1024 / elapsed, 2) if elapsed else None,
+        "chunks_per_s": round(len(chunks) / elapsed, 1) if elapsed else None,
+        "max_chunk_tokens": max(count_tokens(c.page_content, encoding) for c in chunks) if chunks else 0,
+    }
+
+
+def main(mb: float, chunk_size: int, chunk_overlap: int, encoding: str):
+    pages, size = build_pages(mb)
+    splitters = {
+        "recursive_chars": lambda docs: RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size * CHARS_PER_TOKEN, chunk_overlap=chunk_overlap * CHARS_PER_TOKEN,
+            add_start_index=True).split_documents(list(docs)),
+    }
+    if _encoding(encoding) is not None:
+        splitters["recursive_tiktoken"] = lambda docs: RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=encoding, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+            add_start_index=True).split_documents(list(docs))
+    splitters["token_chunker"] = lambda docs: TokenChunker(chunk_size, chunk_overlap, encoding).split_documents(docs)
+
+    results = []
+    for name, split in splitters.items():
+        result = run(name, split, pages, size, encoding)
+        result["tokenizer"] = encoding if _encoding(encoding) is not None else "estimate"
+        results.append(result)
+        print(json.dumps(result), flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=20)
+    parser.add_argument("--chunk-size", type=int, default=256, help="tokens")
+    parser.add_argument("--chunk-overlap", type=int, default=48, help="tokens")
+    parser.add_argument("--encoding", default="o200k_base")
+    args = parser.parse_args()
+    main(args.mb, args.chunk_size, args.chunk_overlap, args.encoding)
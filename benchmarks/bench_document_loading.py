@@ -0,0 +1,110 @@
+"""Multi-format document loading: serial vs. the process pool pipeline of utils.document_ops.
+
+Builds a folder of mixed PDF/TXT/DOCX files (1,000 by default, a few corrupt ones
+included) and loads it serially and with process pools of increasing size. Prints one
+JSON line per run: wall time, files/s, documents, failures and speedup over serial.
+The page text cache is disabled so every run parses. Usage (from the repo root):
+
+    python -m benchmarks.bench_document_loading --files 1000 --workers 1 2 4 8
+"""
+import sys
+import json
+import time
+import zipfile
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fitz
+
+import utils.document_ops as document_ops
+import utils.pdf_extractor as pdf_extractor
+from utils.document_ops import LoadReport, iter_documents
+
+LINE = "Clause {n}. The supplier shall deliver the goods described in schedule {n} within thirty days."
+
+
+def build_pdf(path: Path, pages: int, lines_per_page: int = 30):
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        text = "\n".join(LINE.format(n=p * lines_per_page + i) for i in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=8)
+    doc.save(str(path))
+    doc.close()
+
+
+def build_docx(path: Path, paragraphs: int):
+    body = "".join(f"<w:p><w:r><w:t>{escape(LINE.format(n=i))}</w:t></w:r></w:p>" for i in range(paragraphs))
+    xml = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+           f"<w:body>{body}</w:body></w:document>")
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("word/document.xml", xml)
+
+
+def build_corpus(folder: Path, files: int, pdf_pages: int, corrupt: int):
+    '''Mixed corpus: pdf/txt/docx in rotation, each file type built once and copied'''
+    templates = {".pdf": folder / "template.pdf.src", ".docx": folder / "template.docx.src",
+                 ".txt": folder / "template.txt.src"}
+    build_pdf(templates[".pdf"], pdf_pages)
+    build_docx(templates[".docx"], 60 * pdf_pages)
+    templates[".txt"].write_text("\n".join(LINE.format(n=i) for i in range(60 * pdf_pages)), encoding="utf-8")
+    data = {ext: p.read_bytes() for ext, p in templates.items()}
+    paths = []
+    for i in range(files):
+        ext = (".pdf", ".txt", ".docx")[i % 3]
+        path = folder / f"doc_{i:05d}{ext}"
+        ## corrupt files exercise failure isolation
+        path.write_bytes(b"not a valid file" if i < corrupt and ext != ".txt" else data[ext])
+        paths.append(path)
+    return paths
+
+
+def run(name: str, paths, parallel: bool, workers: int, baseline: float = None) -> dict:
+    report = LoadReport()
+    start = time.perf_counter()
+    docs = sum(1 for _ in iter_documents(paths, parallel=parallel, report=report))
+    elapsed = time.perf_counter() - start
+    return {
+        "run": name,
+        "workers": workers,
+        "files": len(paths),
+        "documents": docs,
+        "failed": len(report.failed),
+        "seconds": round(elapsed, 3),
+        "files_per_s": round(len(paths) / elapsed, 1) if elapsed else None,
+        "speedup": round(baseline / elapsed, 2) if baseline and elapsed else None,
+    }
+
+
+def main(files: int, workers, pdf_pages: int, corrupt: int):
+    pdf_extractor.get_page_cache = lambda: None
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_corpus(Path(tmp), files, pdf_pages, corrupt)
+        results = [run("serial", paths, parallel=False, workers=1)]
+        print(json.dumps(results[-1]), flush=True)
+        baseline = results[0]["seconds"]
+        for n in workers:
+            executor = ProcessPoolExecutor(max_workers=n)
+            document_ops.get_process_executor = lambda: executor
+            ## first task of each worker pays the imports: warm the pool up outside the timing
+            list(executor.map(abs, range(n)))
+            results.append(run("process_pool", paths, parallel=True, workers=n, baseline=baseline))
+            executor.shutdown()
+            print(json.dumps(results[-1]), flush=True)
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pdf-pages", type=int, default=4)
+    parser.add_argument("--corrupt", type=int, default=5)
+    args = parser.parse_args()
+    main(args.files, args.workers, args.pdf_pages, args.corrupt)
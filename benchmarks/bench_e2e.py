@@ -0,0 +1,300 @@
+"""End-to-end API benchmark: /analyze, /compare, /chat/index and /chat/query in-process.
+
+Fully offline: the `fake` LLM and embedding providers from config.yaml stand in for the
+hosted models (ModelLoader selects them through LLM_PROVIDER / EMBEDDING_PROVIDER), with
+latency and token rates set from the command line. Requests go through the real FastAPI
+app (lifespan included) over an in-process ASGI transport, with synthetic PDFs of each
+page count, at each concurrency level. Result, embedding and page caches are off, so
+every request does the full work.
+
+One JSON line per (scenario, pages, concurrency): throughput, p50/p99 latency, peak RSS
+and per-stage timings from the /metrics instruments. Usage (from the repo root):
+
+    python -m benchmarks.bench_e2e --pages 5 50 --concurrency 1 8 --requests 16
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fitz
+
+SCENARIOS = ("analyze", "compare", "chat_index", "chat_query")
+
+LINE = "Clause {n}. The supplier shall deliver the goods described in schedule {n} within {d} days of the order."
+
+FAKE_METADATA = json.dumps({
+    "Summary": ["Synthetic supply agreement covering delivery schedules and obligations."],
+    "Title": "Synthetic Agreement", "Author": "Benchmark", "DateCreated": "2024-01-01",
+    "LastModifiedDate": "2024-01-01", "Publisher": "Unknown", "Language": "English",
+    "PageCount": "Unknown", "SentimentTone": "Neutral",
+})
+
+QUESTIONS = [
+    "clause 12",
+    "What are the delivery obligations of the supplier?",
+    "schedule 40",
+    "Within how many days must the goods described in schedule 7 be delivered?",
+]
+
+
+def build_pdf(pages: int, seed: int, changed_every: int = 0, lines_per_page: int = 30) -> bytes:
+    '''Synthetic contract; seed makes every document unique, changed_every>0 edits every n-th page'''
+    doc = fitz.open()
+    for p in range(pages):
+        days = 30 + seed
+        if changed_every and p % changed_every == 0:
+            days += 15
+        text = "\n".join(LINE.format(n=p * lines_per_page + i, d=days) for i in range(lines_per_page))
+        doc.new_page().insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def responder(prompt: str) -> str:
+    '''Replies of the fake LLM, shaped like the real ones for each prompt'''
+    if "Changed Pages" in prompt:
+        return json.dumps([{"Page": "1", "changes": "Delivery period extended by fifteen days."}])
+    if "Return Only Valid JSON" in prompt:
+        return FAKE_METADATA
+    if "standalone question" in prompt:
+        return "What are the delivery obligations of the supplier?"
+    return ("The supplier must deliver the goods described in the schedule within the agreed number of days "
+            "after the order, as stated in the referenced clause of the agreement.")
+
+
+def prepare_environment(workdir: Path, args) -> Path:
+    '''Benchmark config (fake providers, caches off, state under workdir); must run before the app is imported'''
+    config = yaml.safe_load((ROOT / "config" / "config.yaml").read_text())
+    config["llm"]["fake"].update(latency_s=args.llm_latency, prompt_tokens_per_second=args.prompt_tps,
+                                 tokens_per_second=args.output_tps)
+    config["embedding_model"].setdefault("fake", {}).update(latency_s=args.embed_latency, texts_per_second=args.embed_tps)
+    config["embedding_cache"]["enabled"] = False
+    config["result_cache"].update(enabled=False, path=str(workdir / "results.sqlite"))
+    config["chat_memory"].update(enabled=False, path=str(workdir / "chat_memory.sqlite"))
+    config["pdf_extraction"]["page_cache"] = False
+    config["jobs"]["path"] = str(workdir / "jobs.sqlite")
+    config["chat_index_jobs"]["poll_interval_s"] = 0.02
+    config["logging"]["level"] = args.log_level
+    path = workdir / "config.yaml"
+    path.write_text(yaml.safe_dump(config))
+
+    os.environ.update(
+        CONFIG_PATH=str(path),
+        LLM_PROVIDER="fake",
+        EMBEDDING_PROVIDER="fake",
+        FAISS_BASE=str(workdir / "faiss_index"),
+        UPLOAD_BASE=str(workdir / "data"),
+    )
+    ## relative paths (data/, cache/, logs/) land in the scratch directory
+    os.chdir(workdir)
+    return path
+
+
+class RssSampler:
+    """Peak resident set size while a level runs (sampled from /proc, else ru_maxrss)."""
+
+    def __init__(self, interval_s: float = 0.02):
+        self.interval_s = interval_s
+        self.peak = 0
+        self._task = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, self.current())
+            await asyncio.sleep(self.interval_s)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.peak = max(self.peak, self.current())
+
+
+def stage_totals() -> Dict[str, List[float]]:
+    '''{component.stage or llm.chain: [seconds, count]} from the metrics registry'''
+    try:
+        import prometheus_client
+    except ImportError:
+        return {}
+    totals: Dict[str, List[float]] = {}
+    for metric in prometheus_client.REGISTRY.collect():
+        if metric.name not in ("docportal_stage_seconds", "docportal_llm_call_seconds"):
+            continue
+        for sample in metric.samples:
+            kind = sample.name.rsplit("_", 1)[-1]
+            if kind not in ("sum", "count"):
+                continue
+            labels = sample.labels
+            name = f"{labels['component']}.{labels['stage']}" if "stage" in labels else f"llm.{labels['chain']}"
+            entry = totals.setdefault(name, [0.0, 0.0])
+            entry[0 if kind == "sum" else 1] += sample.value
+    return totals
+
+
+def stage_delta(before: Dict[str, List[float]], after: Dict[str, List[float]]) -> Dict[str, Any]:
+    out = {}
+    for name, (seconds, count) in sorted(after.items()):
+        b_seconds, b_count = before.get(name, (0.0, 0.0))
+        calls = int(count - b_count)
+        if calls:
+            total = seconds - b_seconds
+            out[name] = {"calls": calls, "total_s": round(total, 4), "mean_ms": round(total / calls * 1000, 2)}
+    return out
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def run_level(scenario: str, pages: int, concurrency: int, requests: List[Callable]) -> Dict[str, Any]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def one(request):
+        async with sem:
+            start = time.perf_counter()
+            try:
+                await request()
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(str(e)[:200])
+
+    before = stage_totals()
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(r) for r in requests))
+        elapsed = time.perf_counter() - start
+    return {
+        "scenario": scenario,
+        "pages": pages,
+        "concurrency": concurrency,
+        "requests": len(requests),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 1),
+        "peak_rss_mb": round(rss.peak / 1e6, 1),
+        "stages": stage_delta(before, stage_totals()),
+    }
+
+
+def _check(response, expected=(200,)):
+    if response.status_code not in expected:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+    return response
+
+
+async def main(args):
+    workdir = Path(tempfile.mkdtemp(prefix="docportal-bench-"))
+    prepare_environment(workdir, args)
+
+    import httpx
+    from api.main import app
+    from utils.model_loader import get_model_loader
+
+    llm = get_model_loader().load_llm()
+    llm.responder = responder
+    out = open(args.out, "a") if args.out else None
+    seed = iter(range(1, 10**9))
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+            async def index_job(session_id: str, pdf: bytes):
+                r = _check(await client.post("/chat/index", files=[("files", (f"{session_id}.pdf", pdf, "application/pdf"))],
+                                             data={"session_id": session_id}), (200, 202))
+                job_id = r.json()["job_id"]
+                while True:
+                    job = _check(await client.get(f"/chat/index/jobs/{job_id}")).json()
+                    if job["status"] in ("done", "failed", "cancelled"):
+                        if job["status"] != "done":
+                            raise RuntimeError(f"indexing job {job['status']}: {job.get('error')}")
+                        return
+                    await asyncio.sleep(0.02)
+
+            for pages in args.pages:
+                query_session = None
+                for scenario in args.scenarios:
+                    if scenario == "chat_query" and query_session is None:
+                        query_session = f"bench-q-{pages}"
+                        await index_job(query_session, build_pdf(pages, next(seed)))
+                    for concurrency in args.concurrency:
+                        requests: List[Callable] = []
+                        for i in range(args.requests):
+                            if scenario == "analyze":
+                                pdf = build_pdf(pages, next(seed))
+                                requests.append(lambda pdf=pdf: _post_checked(
+                                    client, "/analyze", files={"file": ("doc.pdf", pdf, "application/pdf")}))
+                            elif scenario == "compare":
+                                s = next(seed)
+                                ref, act = build_pdf(pages, s), build_pdf(pages, s, changed_every=5)
+                                requests.append(lambda ref=ref, act=act: _post_checked(
+                                    client, "/compare", files={"reference": ("ref.pdf", ref, "application/pdf"),
+                                                               "actual": ("act.pdf", act, "application/pdf")}))
+                            elif scenario == "chat_index":
+                                s = next(seed)
+                                pdf = build_pdf(pages, s)
+                                requests.append(lambda s=s, pdf=pdf: index_job(f"bench-i-{s}", pdf))
+                            elif scenario == "chat_query":
+                                question = QUESTIONS[i % len(QUESTIONS)]
+                                requests.append(lambda q=question: _post_checked(
+                                    client, "/chat/query", data={"question": q, "session_id": query_session}))
+                        result = await run_level(scenario, pages, concurrency, requests)
+                        print(json.dumps(result), flush=True)
+                        if out is not None:
+                            out.write(json.dumps(result) + "\n")
+                            out.flush()
+    if out is not None:
+        out.close()
+
+
+async def _post_checked(client, url: str, **kwargs):
+    _check(await client.post(url, **kwargs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--requests", type=int, default=16, help="requests per (scenario, pages, concurrency)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake LLM seconds per call")
+    parser.add_argument("--prompt-tps", type=float, default=20000, help="fake LLM prompt tokens/s (prefill)")
+    parser.add_argument("--output-tps", type=float, default=200, help="fake LLM generated tokens/s")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedder seconds per request")
+    parser.add_argument("--embed-tps", type=float, default=5000, help="fake embedder texts/s")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--out", default=None, help="also append the JSON lines to this file")
+    asyncio.run(main(parser.parse_args()))
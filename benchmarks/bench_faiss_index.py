@@ -0,0 +1,108 @@
+"""FAISS index types: recall@k vs query latency vs memory on synthetic vectors.
+
+Generates clustered, L2-normalised vectors (like text embeddings), computes exact
+neighbours with a Flat index and, for every index factory and search setting, reports
+build time, serialized index size, recall@k and per-query latency as JSON lines.
+Usage (from the repo root):
+
+    python -m benchmarks.bench_faiss_index --n 50000 --dim 3072 --queries 200 --k 10
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import faiss
+import numpy as np
+
+from utils.faiss_index import build_index, min_train_vectors
+
+## (factory, search settings to sweep)
+FACTORIES = [
+    ("Flat", [{}]),
+    ("HNSW32", [{"efSearch": 16}, {"efSearch": 64}, {"efSearch": 256}]),
+    ("IVF{nlist},Flat", [{"nprobe": 1}, {"nprobe": 8}, {"nprobe": 32}]),
+    ("IVF{nlist},PQ{m}", [{"nprobe": 8}, {"nprobe": 32}]),
+    ("SQfp16", [{}]),
+    ("SQ8", [{}]),
+]
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    x = centers[labels] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f[:k]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(factory: str, settings, base: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int):
+    if base.shape[0] < min_train_vectors(factory):
+        print(json.dumps({"factory": factory, "skipped": "too few vectors to train"}), flush=True)
+        return []
+    start = time.perf_counter()
+    index = build_index(factory, base)
+    build_s = time.perf_counter() - start
+    size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+    results = []
+    params = faiss.ParameterSpace()
+    for setting in settings:
+        for name, value in setting.items():
+            params.set_index_parameter(index, name, value)
+        ## one query at a time, as the chat retriever issues them
+        latencies = []
+        found = np.empty((len(queries), k), dtype=np.int64)
+        for i, q in enumerate(queries):
+            t = time.perf_counter()
+            _, ids = index.search(q[None, :], k)
+            latencies.append(time.perf_counter() - t)
+            found[i] = ids[0]
+        lat = np.array(latencies) * 1000
+        results.append({
+            "factory": factory,
+            **setting,
+            "build_s": round(build_s, 2),
+            "index_mb": round(size_mb, 1),
+            f"recall@{k}": round(recall_at_k(found, truth), 4),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        })
+        print(json.dumps(results[-1]), flush=True)
+    return results
+
+
+def main(n: int, dim: int, n_queries: int, k: int, nlist: int, pq_m: int):
+    data = synthetic_vectors(n + n_queries, dim, clusters=max(16, n // 500))
+    base, queries = data[:n], data[n:]
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(base)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for template, settings in FACTORIES:
+        factory = template.format(nlist=nlist, m=pq_m)
+        results.extend(run(factory, settings, base, queries, truth, k))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=256, help="IVF lists (about sqrt(n) to 4*sqrt(n))")
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ sub-quantizers, must divide dim")
+    args = parser.parse_args()
+    main(args.n, args.dim, args.queries, args.k, args.nlist, args.pq_m)
@@ -0,0 +1,77 @@
+"""PDF text extraction: LangChain PyPDFLoader vs the PyMuPDF page-streaming extractor.
+
+Builds a synthetic PDF (500 pages by default) and reports wall time, pages/s and peak
+Python heap (tracemalloc) for each path, as JSON lines. Usage (from the repo root):
+
+    python -m benchmarks.bench_pdf_extraction --pages 500
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fitz
+from langchain_community.document_loaders import PyPDFLoader
+
+from utils.pdf_extractor import PageTextCache, extract_pdf_pages, iter_pdf_pages
+import utils.pdf_extractor as pdf_extractor
+
+LINE = "Clause {n}. The supplier shall deliver the goods described in schedule {n} within thirty days."
+
+
+def build_pdf(path: Path, pages: int, lines_per_page: int = 40):
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        text = "\n".join(LINE.format(n=p * lines_per_page + i) for i in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=8)
+    doc.save(str(path))
+    doc.close()
+
+
+def measure(name: str, fn, pages: int) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "extractor": name,
+        "pages": count,
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(pages / elapsed, 1) if elapsed else None,
+        "peak_heap_mb": round(peak / 1e6, 2),
+    }
+
+
+def main(pages: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "synthetic.pdf"
+        build_pdf(pdf, pages)
+        cache = PageTextCache(str(Path(tmp) / "pages"))
+        pdf_extractor.get_page_cache = lambda: cache
+
+        runs = [
+            ("pypdfloader", lambda: len(PyPDFLoader(str(pdf)).load())),
+            ("pymupdf_stream", lambda: sum(1 for _ in iter_pdf_pages(str(pdf)))),
+            ("pymupdf_process_pool", lambda: sum(1 for _ in extract_pdf_pages(str(pdf), use_cache=False, parallel=True))),
+            ("page_cache_cold", lambda: sum(1 for _ in extract_pdf_pages(str(pdf)))),
+            ("page_cache_warm", lambda: sum(1 for _ in extract_pdf_pages(str(pdf)))),
+        ]
+        results = []
+        for name, fn in runs:
+            results.append(measure(name, fn, pages))
+            print(json.dumps(results[-1]), flush=True)
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    main(parser.parse_args().pages)
@@ -1,42 +1,109 @@
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
+import random
+import threading
 from datetime import datetime
 import structlog
-class CustomLogger:
-    def __init__(self, log_dir = 'logs'):
-        ## insures logs directory exists
-        self.logs_dir = os.path.join(os.getcwd(),log_dir)
-        ## creating the directory, if exists will use that
-        os.makedirs(self.logs_dir, exist_ok=True)
-        
-        ## Create timestamped log filename
-        log_file = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-        self.log_file_path = os.path.join(self.logs_dir, log_file)
-        
-        
-    
-    def get_logger(self, name=__file__):
-        logger_name = os.path.basename(name)
-        
-        ## configure logging for Console + file (JSON)
-        file_handler = logging.FileHandler(self.log_file_path)
-        file_handler.setLevel(logging.INFO)
+
+from utils.config_loader import load_config
+
+## process wide logging state: configured by the first CustomLogger, shared by every later one
+_configure_lock = threading.Lock()
+_listener = None
+_log_file_path = None
+_log_dir = None
+## forked children (process pool workers) send their records to the parent through this queue
+_child_queue = None
+_child_listener = None
+_forwarding = False
+
+
+def _truncate(value, max_chars: int):
+    '''Bounded log field: long strings are cut, containers/objects (DataFrames...) are logged as a cut repr'''
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= max_chars:
+        ## short lists/dicts stay structured in the JSON output
+        return value
+    return f"{text[:max_chars]}...(+{len(text) - max_chars} chars)"
+
+
+class _PayloadLimits:
+    """structlog processor: truncates oversized fields and samples noisy events."""
+
+    def __init__(self, max_field_chars: int, sample_rates: dict):
+        self.max_field_chars = max_field_chars
+        self.sample_rates = sample_rates
+
+    def __call__(self, logger, method_name, event_dict):
+        rate = self.sample_rates.get(event_dict.get("event"))
+        ## errors are never sampled away
+        if rate is not None and method_name not in ("error", "exception", "critical") and random.random() >= rate:
+            raise structlog.DropEvent
+        for key, value in event_dict.items():
+            if key != "event":
+                event_dict[key] = _truncate(value, self.max_field_chars)
+        return event_dict
+
+
+def _configure(log_dir: str) -> str:
+    '''Configure stdlib logging and structlog once per process, return the log file path.
+    Records go through a QueueHandler, a background listener thread does the console/file I/O.
+    '''
+    global _listener, _log_file_path, _log_dir, _child_queue, _child_listener
+    with _configure_lock:
+        if _listener is not None or _forwarding:
+            return _log_file_path
+        _log_dir = log_dir
+        cfg = load_config().get("logging") or {}
+        level = getattr(logging, str(cfg.get("level", "INFO")).upper(), logging.INFO)
+
+        ## one timestamped file per process (forked pool workers write to it too), rotated by size
+        os.makedirs(log_dir, exist_ok=True)
+        _log_file_path = os.path.join(log_dir, f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}_{os.getpid()}.log")
+        file_handler = logging.handlers.RotatingFileHandler(
+            _log_file_path,
+            maxBytes=int(float(cfg.get("max_file_mb", 50)) * 1024 * 1024),
+            backupCount=int(cfg.get("backup_count", 5)),
+            ## no file until the first record (forked pool workers that never log leave none)
+            delay=True,
+        )
         file_handler.setFormatter(logging.Formatter("%(message)s"))
-        
         consol_handler = logging.StreamHandler()
-        consol_handler.setLevel(logging.INFO)
         consol_handler.setFormatter(logging.Formatter('%(message)s'))
-        
-        ## Configure Logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(message)s", # Structlog will handle JSON rendering
-            handlers=[consol_handler,file_handler]
-        )
-        
+
+        ## callers only enqueue; a full queue drops records instead of blocking a request
+        log_queue = queue.Queue(maxsize=int(cfg.get("queue_size", 10000)))
+        queue_handler = _DroppingQueueHandler(log_queue)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, consol_handler, file_handler, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        ## records of forked workers end up in this process's file instead of one file per worker
+        if hasattr(os, "register_at_fork"):
+            _child_queue = multiprocessing.get_context("fork").Queue(maxsize=int(cfg.get("queue_size", 10000)))
+            _child_listener = logging.handlers.QueueListener(_child_queue, consol_handler, file_handler,
+                                                             respect_handler_level=False)
+            _child_listener.start()
+            atexit.register(_child_listener.stop)
+
         ## Configuration for structlog for JSON structured logging
         structlog.configure(
             processors=[
+                ## request scoped fields (trace_id) bound by the API middleware
+                structlog.contextvars.merge_contextvars,
+                _PayloadLimits(int(cfg.get("max_field_chars", 2000)), dict(cfg.get("sample_rates") or {})),
                 structlog.processors.TimeStamper(fmt='iso', utc=True,key='timestamp'),
                 structlog.processors.add_log_level,
                 structlog.processors.EventRenamer(to='event'),
@@ -45,10 +112,55 @@ class CustomLogger:
             logger_factory=structlog.stdlib.LoggerFactory(),
             cache_logger_on_first_use=True
         )
-        
+        return _log_file_path
+
+
+def _after_fork_in_child():
+    '''A forked worker (process pool) has the queue but not the writer thread: forward its records
+    to the parent, whose listener writes them to the parent's log file
+    '''
+    global _configure_lock, _listener, _child_listener, _forwarding
+    _configure_lock = threading.Lock()
+    if _listener is None:
+        return
+    _listener = _child_listener = None
+    if _child_queue is None:
+        _configure(_log_dir)
+        return
+    _forwarding = True
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DroppingQueueHandler(_child_queue))
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped while the writer is behind."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+class CustomLogger:
+    def __init__(self, log_dir = 'logs'):
+        ## logs directory relative to the working directory, configured once per process
+        self.logs_dir = os.path.join(os.getcwd(),log_dir)
+        self.log_file_path = _configure(self.logs_dir)
+
+    def get_logger(self, name=__file__):
+        logger_name = os.path.basename(name)
         return structlog.get_logger(logger_name)
-    
+
 if __name__ == '__main__':
     logger = CustomLogger()
     logger  =logger.get_logger(__file__)
-    logger.info("User uploaded a file", user_id=123, filename="report.pdf")
\ No newline at end of file
+    logger.info("User uploaded a file", user_id=123, filename="report.pdf")
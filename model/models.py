@@ -23,7 +23,11 @@ class SummaryResponse(RootModel[list[ChangeFormat]]):
 
 class PromptType(str,Enum):
     DOCUMENT_ANALYSIS = 'document_analysis'
+    DOCUMENT_ANALYSIS_MAP = 'document_analysis_map'
+    DOCUMENT_ANALYSIS_REDUCE = 'document_analysis_reduce'
     DOCUMENT_COMPARISION = 'document_comparision'
+    DOCUMENT_PAGE_COMPARISION = 'document_page_comparision'
     CONTEXTUALIZE_QUESTION = "contextualize_question"
     CONTEXT_QA = "context_qa"
+    CHAT_HISTORY_SUMMARY = "chat_history_summary"
     
\ No newline at end of file
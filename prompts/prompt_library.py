@@ -10,6 +10,34 @@ Analyze this document:
 {document_text}
 """)
 
+## map step of the map-reduce analysis of large documents
+document_analysis_map_prompt = ChatPromptTemplate.from_template("""
+You are a highly capable assistant trained to analyze and summarize documents.
+You are given one section ({section_number} of {section_count}) of a larger document.
+Extract whatever metadata this section contains and summarize it.
+Use "Unknown" for fields this section does not mention.
+Return Only Valid JSON matching the exact schema below
+
+{format_instructions}
+
+Document section:
+{document_text}
+""")
+
+## reduce step: merge the per-section results into the final metadata
+document_analysis_reduce_prompt = ChatPromptTemplate.from_template("""
+You are a highly capable assistant trained to analyze and summarize documents.
+Below are partial analyses of consecutive sections of one document, in order.
+Merge them into a single analysis of the whole document: prefer known values over "Unknown",
+and write a concise summary of the entire document rather than concatenating the partial summaries.
+Return Only Valid JSON matching the exact schema below
+
+{format_instructions}
+
+Partial analyses:
+{partial_analyses}
+""")
+
 document_comparision_prompt = ChatPromptTemplate.from_template("""
 You will be provided with content form two pdfs. Your tasks are as follows:
 
@@ -27,6 +55,25 @@ Your response should follow this format:
 {format_instruction}
 """)
 
+## prompt for comparing only the pages that differ (page level diff pre-pass)
+document_page_comparision_prompt = ChatPromptTemplate.from_template("""
+You will be provided with the pages that differ between a reference and an actual version of a PDF.
+Modified pages are given as unified diffs (lines starting with '-' were removed, '+' were added),
+added or removed pages are given in full. Your tasks are as follows:
+
+1. Describe the changes on every page provided.
+2. Use exactly the page label given for each page as the page number.
+3. Return one entry per page provided and no entries for any other page.
+
+Changed Pages:
+
+{changed_pages}
+
+Your response should follow this format:
+
+{format_instruction}
+""")
+
 ## prompt for contextual question rewriting
 contextualize_question_prompt = ChatPromptTemplate.from_messages([
     ("system", (
@@ -49,9 +96,26 @@ context_qa_prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}"),
 ])
 
+## incremental compaction of chat session memory: previous summary + oldest turns -> new summary
+chat_history_summary_prompt = ChatPromptTemplate.from_template("""
+You maintain a running summary of a conversation between a user and an assistant about their documents.
+Extend the current summary with the new conversation turns below. Keep facts, names, numbers and open
+questions the user may refer back to; drop pleasantries. Write at most {max_words} words of plain prose.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+""")
+
 PROMPT_REGISTRY = {
     'document_analysis': document_analysis_prompt,
+    'document_analysis_map': document_analysis_map_prompt,
+    'document_analysis_reduce': document_analysis_reduce_prompt,
     'document_comparision': document_comparision_prompt,
+    'document_page_comparision': document_page_comparision_prompt,
     'contextualize_question': contextualize_question_prompt,
-    'context_qa' : context_qa_prompt
+    'context_qa' : context_qa_prompt,
+    'chat_history_summary': chat_history_summary_prompt
 }
\ No newline at end of file
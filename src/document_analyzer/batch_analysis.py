@@ -0,0 +1,152 @@
+import sys
+import random
+import asyncio
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+from utils.concurrency import run_blocking
+from utils.file_io import file_sha256
+from utils.job_store import JobStore, get_job_store, RUNNING, DONE, FAILED
+from utils.result_cache import get_result_cache
+from utils.storage_manager import get_storage_manager
+from src.document_analyzer.data_analysis import DocumentAnalyzer
+from src.document_ingestion.data_ingestion import DocumentHandler
+
+
+@dataclass
+class BatchItem:
+    """One PDF of a batch; sha256 is filled in by the job if it was not known at submit time."""
+    name: str
+    path: Path
+    sha256: Optional[str] = None
+
+
+def collect_directory(directory: str, allowed_dirs: List[str]) -> List[BatchItem]:
+    '''PDFs under a server-side directory, which must lie inside one of allowed_dirs'''
+    root = Path(directory).resolve()
+    allowed = [Path(d).resolve() for d in allowed_dirs]
+    if not any(root == a or a in root.parents for a in allowed):
+        raise ValueError(f"Directory not allowed for batch analysis: {directory}")
+    if not root.is_dir():
+        raise ValueError(f"Directory not found: {directory}")
+    return [BatchItem(name=str(p.relative_to(root)), path=p)
+            for p in sorted(root.rglob("*.pdf")) if p.is_file()]
+
+
+BATCH_KIND = "analysis_batch"
+
+
+def _batch_config() -> dict:
+    return load_config().get("batch_analysis") or {}
+
+
+def fail_orphaned_batches(store: Optional[JobStore] = None) -> int:
+    '''Mark batch jobs whose worker stopped (no heartbeat for stale_after_s) as failed,
+    at startup'''
+    stale_after_s = float(_batch_config().get("stale_after_s", 300))
+    return (store or get_job_store()).fail_stale(BATCH_KIND, stale_after_s,
+                                                 "Batch worker stopped before the job finished")
+
+
+class BatchAnalyzer:
+    """Analyze many PDFs as one job with the shared DocumentAnalyzer.
+
+    At most max_concurrency documents are in flight, failed analyses are retried with
+    exponential backoff and jitter, and every finished document is appended to the job
+    store immediately so results can be streamed while the batch runs. A running batch
+    touches its job every heartbeat_s; fail_orphaned_batches() fails the ones that stopped.
+    """
+
+    def __init__(self, analyzer: DocumentAnalyzer, store: Optional[JobStore] = None):
+        self.log = CustomLogger().get_logger(__name__)
+        self.analyzer = analyzer
+        self.store = store or get_job_store()
+        cfg = _batch_config()
+        self.heartbeat_s = float(cfg.get("heartbeat_s", 30))
+        self.max_concurrency = max(1, int(cfg.get("max_concurrency", 8)))
+        self.max_retries = int(cfg.get("max_retries", 3))
+        self.backoff_s = float(cfg.get("backoff_s", 2.0))
+        self.allowed_dirs = list(cfg.get("allowed_dirs") or [])
+
+    async def _analyze_with_retry(self, text: str, name: str) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.analyzer.aanalyze_document(text)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_s * (2 ** attempt) * (0.5 + random.random())
+                self.log.warning("Batch analysis retry", file=name, attempt=attempt + 1,
+                                 delay_s=round(delay, 2), error=str(e))
+                await asyncio.sleep(delay)
+
+    async def _analyze_item(self, handler: DocumentHandler, item: BatchItem) -> Dict[str, Any]:
+        if item.sha256 is None:
+            item.sha256 = await run_blocking(file_sha256, item.path)
+        cache = get_result_cache()
+        key = self.analyzer.result_key(item.sha256)
+        cached = await run_blocking(cache.get, key) if cache is not None else None
+        if cached is not None:
+            return {"file": item.name, "sha256": item.sha256, "result": cached, "cached": True}
+
+        text = await handler.aread_pdf(str(item.path), item.sha256)
+        result = await self._analyze_with_retry(text, item.name)
+        if cache is not None:
+            await run_blocking(cache.put, key, result, "analysis")
+        return {"file": item.name, "sha256": item.sha256, "result": result, "cached": False}
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.heartbeat_s)
+            try:
+                await run_blocking(self.store.heartbeat, job_id)
+            except Exception as e:
+                self.log.warning("Batch heartbeat failed", job_id=job_id, error=str(e))
+
+    async def run(self, job_id: str, items: List[BatchItem], handler: DocumentHandler):
+        '''Process a submitted batch to completion, recording progress in the job store'''
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _one(item: BatchItem):
+            async with semaphore:
+                try:
+                    record = await self._analyze_item(handler, item)
+                    await run_blocking(self.store.add_result, job_id, record)
+                except Exception as e:
+                    self.log.error("Batch item failed", job_id=job_id, file=item.name, error=str(e))
+                    await run_blocking(self.store.add_result, job_id,
+                                       {"file": item.name, "sha256": item.sha256,
+                                        "error": str(e)}, True)
+
+        storage = get_storage_manager()
+        ## from the start: a batch waiting for the pool stays queued and must not look orphaned
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await run_blocking(self.store.set_status, job_id, RUNNING)
+            ## uploads of a running batch are never evicted
+            with storage.pin(handler.session_path) if storage is not None else nullcontext():
+                await asyncio.gather(*(_one(item) for item in items))
+            await run_blocking(self.store.set_status, job_id, DONE)
+            self.log.info("Batch analysis finished", job_id=job_id, files=len(items))
+        except Exception as e:
+            self.log.error("Batch analysis failed", job_id=job_id, error=str(e))
+            await run_blocking(self.store.set_status, job_id, FAILED, str(e))
+        finally:
+            heartbeat.cancel()
+
+    def submit(self, items: List[BatchItem]) -> str:
+        '''Create the job record and return its id; the caller schedules run()'''
+        try:
+            if not items:
+                raise ValueError("No PDF files to analyze")
+            return self.store.create(BATCH_KIND, total=len(items))
+        except ValueError:
+            raise
+        except Exception as e:
+            self.log.error("Failed to submit batch analysis", error=str(e))
+            raise DocumentPortalException("Failed to submit batch analysis", sys)
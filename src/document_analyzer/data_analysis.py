@@ -1,5 +1,14 @@
 import os
-from utils.model_loader import ModelLoader
+import re
+import sys
+import json
+import asyncio
+from typing import AsyncIterator, Dict, Any, List
+from utils.model_loader import get_model_loader
+from utils.metrics import span
+from utils.concurrency import llm_slot, run_blocking
+from utils.tokens import count_tokens, CHARS_PER_TOKEN
+from utils.result_cache import result_key
 from exception.custom_exception import DocumentPortalException
 from logger.custom_logger import CustomLogger
 from model.models import *
@@ -9,15 +18,22 @@ from langchain_core.output_parsers import JsonOutputParser
 from langchain.output_parsers import OutputFixingParser
 
 
+## page markers written by DocumentHandler.read_pdf, sections are cut at page boundaries
+PAGE_BOUNDARY = re.compile(r"(?=\n--- Page \d+ ---\n)")
+
+
 class DocumentAnalyzer:
     """Analyze document using a pre-trained model.
     Automatically logs all action and supports session-based organization.
+    Documents larger than the single-shot token budget are analyzed map-reduce style:
+    per-section extraction in parallel, then a reduce step into one Metadata.
     """
     
     def __init__(self):
         self.log = CustomLogger().get_logger(__name__)
         try:
-            self.loader = ModelLoader()
+            ## shared loader, llm client comes from the process wide registry
+            self.loader = get_model_loader()
             self.llm = self.loader.load_llm()
             
             self.parser = JsonOutputParser(pydantic_object=Metadata)
@@ -25,33 +41,226 @@ class DocumentAnalyzer:
             
             self.prompt = PROMPT_REGISTRY['document_analysis']
             
+            ## creating a chain which has prompt, llm and parser (built once per llm config)
+            self.chain = self.loader.get_chain('document_analysis',
+                                               lambda llm: self.prompt | llm | self.parser)
+
+            ## map-reduce chains and budgets for large documents
+            self.map_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_ANALYSIS_MAP.value]
+            self.reduce_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_ANALYSIS_REDUCE.value]
+            self.map_chain = self.loader.get_chain(
+                PromptType.DOCUMENT_ANALYSIS_MAP.value,
+                lambda llm: self.map_prompt | llm | self.parser)
+            self.reduce_chain = self.loader.get_chain(
+                PromptType.DOCUMENT_ANALYSIS_REDUCE.value,
+                lambda llm: self.reduce_prompt | llm | self.parser)
+            analysis_cfg = self.loader.config.get('document_analysis') or {}
+            self.single_shot_max_tokens = int(analysis_cfg.get('single_shot_max_tokens', 12000))
+            self.section_tokens = int(analysis_cfg.get('section_tokens', 6000))
+            self.max_parallel_sections = int(analysis_cfg.get('max_parallel_sections', 8))
+
             self.log.info("DocumentAnalyzer initialized successfully")
             
         except Exception as e:
-            self.log.error("Error initializing DocumentAnalyzer: {e}")
-            raise DocumentAnalyzer("Error initializing DocumentAnalyzer",e)
+            self.log.error("Error initializing DocumentAnalyzer", error=str(e))
+            raise DocumentPortalException("Error initializing DocumentAnalyzer",sys)
+
+    def _is_large(self, document_text:str) -> bool:
+        return count_tokens(document_text) > self.single_shot_max_tokens
+
+    def _sections(self, document_text:str) -> List[str]:
+        """Cut the text into sections of at most section_tokens, at page (else paragraph)
+        boundaries.
+        """
+        units = [u for u in PAGE_BOUNDARY.split(document_text) if u.strip()]
+        if len(units) <= 1:
+            units = [u for u in document_text.split("\n\n") if u.strip()]
+
+        sections: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+        max_chars = self.section_tokens * CHARS_PER_TOKEN
+        for unit in units:
+            unit_tokens = count_tokens(unit)
+            ## a single oversized page is hard split by length
+            if unit_tokens > self.section_tokens:
+                if current:
+                    sections.append("\n".join(current))
+                    current, current_tokens = [], 0
+                sections.extend(unit[i:i + max_chars] for i in range(0, len(unit), max_chars))
+                continue
+            if current and current_tokens + unit_tokens > self.section_tokens:
+                sections.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens
+        if current:
+            sections.append("\n".join(current))
+        return sections
+
+    def _map_inputs(self, document_text:str) -> List[Dict[str, Any]]:
+        sections = self._sections(document_text)
+        self.log.info("Map-reduce analysis", sections=len(sections),
+                      section_tokens=self.section_tokens)
+        return [
+            {
+                "format_instructions":self.parser.get_format_instructions(),
+                "section_number":i,
+                "section_count":len(sections),
+                "document_text":section,
+            }
+            for i, section in enumerate(sections, start=1)
+        ]
+
+    def _reduce_inputs(self, partials: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Group consecutive partial results into reduce inputs that fit the section budget.
+        """
+        groups: List[List[str]] = []
+        group_tokens = 0
+        for partial in partials:
+            text = json.dumps(partial, ensure_ascii=False)
+            tokens = count_tokens(text)
+            ## at least two partials per group so every round shrinks the list
+            if groups and (len(groups[-1]) < 2 or group_tokens + tokens <= self.section_tokens):
+                groups[-1].append(text)
+                group_tokens += tokens
+            else:
+                groups.append([text])
+                group_tokens = tokens
+        return [
+            {
+                "format_instructions":self.parser.get_format_instructions(),
+                "partial_analyses":"\n\n".join(group),
+            }
+            for group in groups
+        ]
+
+    def _map_reduce(self, document_text:str) -> Dict[str, Any]:
+        config = {"max_concurrency": self.max_parallel_sections}
+        partials = self.map_chain.batch(self._map_inputs(document_text), config=config)
+        groups = self._reduce_inputs(partials)
+        while len(groups) > 1:
+            partials = self.reduce_chain.batch(groups, config=config)
+            groups = self._reduce_inputs(partials)
+        return self.reduce_chain.invoke(groups[0])
+
+    async def _abatch(self, chain, inputs: List[Dict[str, Any]]) -> List[Any]:
+        """Run chain over inputs concurrently, bounded by max_parallel_sections and the worker
+        LLM limit.
+        """
+        sem = asyncio.Semaphore(self.max_parallel_sections)
+
+        async def _one(item):
+            async with sem:
+                async with llm_slot():
+                    return await chain.ainvoke(item)
+
+        return await asyncio.gather(*(_one(i) for i in inputs))
+
+    async def _afinal_reduce_input(self, document_text:str) -> Dict[str, Any]:
+        """Map step plus intermediate reduce rounds, until one final reduce input remains.
+        """
+        ## tokenizing and cutting a large document is CPU work: keep it off the event loop
+        inputs = await run_blocking(self._map_inputs, document_text)
+        partials = await self._abatch(self.map_chain, inputs)
+        groups = await run_blocking(self._reduce_inputs, partials)
+        while len(groups) > 1:
+            partials = await self._abatch(self.reduce_chain, groups)
+            groups = await run_blocking(self._reduce_inputs, partials)
+        return groups[0]
+
+    def result_key(self, document_sha256:str) -> str:
+        """Result cache key: document content, analysis prompt versions, llm config and
+        map-reduce budgets
+        """
+        prompts = [PromptType.DOCUMENT_ANALYSIS.value, PromptType.DOCUMENT_ANALYSIS_MAP.value,
+                   PromptType.DOCUMENT_ANALYSIS_REDUCE.value]
+        settings = {"single_shot_max_tokens": self.single_shot_max_tokens,
+                    "section_tokens": self.section_tokens}
+        return result_key("analysis", [document_sha256], prompts, self.loader.llm_key(), settings)
     
     def analyze_document(self, document_text:str):
         """Analyze a document's text and extract structured metadata & summary.
+        Large documents go through the map-reduce path, small ones through a single call.
         """
         try:
-            ## creating a chain which has prompt, llm and parser
-            chain = self.prompt | self.llm | self.parser
+            with span("analyzer", "analyze"):
+                if self._is_large(document_text):
+                    response = self._map_reduce(document_text)
+                    self.log.info("Metadata extraction successful", mode="map_reduce",
+                                  keys = list(response.keys()))
+                    return response
+
+                ## invoking the chain and getting the response
+                response = self.chain.invoke(
+                    {
+                        "format_instructions":self.parser.get_format_instructions(),
+                        "document_text":document_text
+                    }
+                )
+
+                self.log.info("Metadata extraction successful", keys = list(response.keys()))
+
+                return response
             
-            self.log.info("Metadata analysis chain initialized.")
+        except Exception as e:
+            self.log.error("Metadata analysis Failed", error=str(e))
+            raise DocumentPortalException("Metadata analysis Failed",sys)
+
+    async def aanalyze_document(self, document_text:str):
+        """Async version of analyze_document, bounded by the per-worker LLM concurrency limit.
+        """
+        try:
+            with span("analyzer", "analyze"):
+                if await run_blocking(self._is_large, document_text):
+                    final_input = await self._afinal_reduce_input(document_text)
+                    async with llm_slot():
+                        response = await self.reduce_chain.ainvoke(final_input)
+                    self.log.info("Metadata extraction successful", mode="map_reduce",
+                                  keys = list(response.keys()))
+                    return response
             
-            ## invoking the chain and getting th
-            response = chain.invoke(
-                {
+                async with llm_slot():
+                    response = await self.chain.ainvoke(
+                        {
+                            "format_instructions":self.parser.get_format_instructions(),
+                            "document_text":document_text
+                        }
+                    )
+
+                self.log.info("Metadata extraction successful", keys = list(response.keys()))
+
+                return response
+
+        except Exception as e:
+            self.log.error("Metadata analysis Failed", error=str(e))
+            raise DocumentPortalException("Metadata analysis Failed",sys)
+
+    async def astream_analysis(self, document_text:str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the metadata while the LLM generates it.
+        Yields progressively completed partial dicts, the last one is the full result.
+        """
+        try:
+            ## large documents: run the map step first, then stream the final reduce
+            if await run_blocking(self._is_large, document_text):
+                chain = self.reduce_chain
+                inputs = await self._afinal_reduce_input(document_text)
+            else:
+                chain = self.chain
+                inputs = {
                     "format_instructions":self.parser.get_format_instructions(),
                     "document_text":document_text
                 }
-            )
             
-            self.log.info("Metadata extraction successful", keys = list(response.keys()))
+            last = None
+            async with llm_slot():
+                async for partial in chain.astream(inputs):
+                    if partial and partial != last:
+                        last = partial
+                        yield partial
             
-            return response
+            self.log.info("Metadata streaming successful", keys = list((last or {}).keys()))
             
         except Exception as e:
-            self.log.error("Metadata analysis Failed: {e}")
-            raise DocumentAnalyzer("Metadata analysis Failed",e)
\ No newline at end of file
+            self.log.error("Metadata streaming Failed", error=str(e))
+            raise DocumentPortalException("Metadata streaming Failed",sys)
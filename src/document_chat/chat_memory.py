@@ -0,0 +1,265 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+from utils.concurrency import run_blocking, llm_slot
+from utils.model_loader import get_model_loader
+from utils.tokens import count_tokens
+from prompts.prompt_library import PROMPT_REGISTRY
+from model.models import PromptType
+
+HUMAN, AI = "human", "ai"
+
+
+@dataclass
+class SessionState:
+    """Summary and recent turns of one chat session."""
+    version: int = 0
+    summary: str = ""
+    summary_tokens: int = 0
+    ## id of the newest turn already folded into the summary
+    summarized_through: int = 0
+    ## (turn id, role, content, tokens), oldest first
+    turns: List[Tuple[int, str, str, int]] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        '''Tokens of the summary and the kept turns'''
+        return self.summary_tokens + sum(t[3] for t in self.turns)
+
+
+class ChatMemory:
+    """Per-session chat history with a token budget.
+
+    Turns are written to SQLite (shared by all workers) and the hot sessions are kept
+    in an in-memory LRU, revalidated by a per-session version number. Once a session
+    exceeds max_tokens its oldest turns are folded into a running summary by the LLM,
+    so the history sent with each question stays bounded.
+    """
+
+    def __init__(self, db_path: str, max_tokens: int = 2000, keep_recent_messages: int = 4,
+                 summary_max_words: int = 200, max_sessions: int = 1000, ttl_s: float = 72 * 3600):
+        self.log = CustomLogger().get_logger(__name__)
+        self.max_tokens = max_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.summary_max_words = summary_max_words
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._compacting: set = set()
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS chat_sessions "
+                            "(session_id TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0, "
+                            "summary TEXT NOT NULL DEFAULT '', "
+                            "summary_tokens INTEGER NOT NULL DEFAULT 0, "
+                            "summarized_through INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS chat_turns "
+                            "(id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+                            "role TEXT NOT NULL, content TEXT NOT NULL, tokens INTEGER NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_chat_turns_session "
+                            "ON chat_turns(session_id, id)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated "
+                            "ON chat_sessions(updated)")
+            self.db.commit()
+            self.purge_expired()
+        except Exception as e:
+            self.log.error("Failed to open chat memory", error=str(e), db_path=db_path)
+            raise DocumentPortalException("Failed to open chat memory", sys)
+
+    def purge_expired(self) -> int:
+        '''Delete sessions idle for ttl_s; run at startup and by the storage sweep'''
+        cutoff = time.time() - self.ttl_s
+        with self._lock:
+            self.db.execute("DELETE FROM chat_turns WHERE session_id IN "
+                            "(SELECT session_id FROM chat_sessions WHERE updated<?)", (cutoff,))
+            removed = self.db.execute("DELETE FROM chat_sessions WHERE updated<?",
+                                      (cutoff,)).rowcount
+            self.db.commit()
+        if removed:
+            self.log.info("Expired chat sessions removed", sessions=removed)
+        return removed
+
+    def _state(self, session_id: str) -> SessionState:
+        '''Current state of a session: the cached copy unless another worker changed it since'''
+        with self._lock:
+            row = self.db.execute("SELECT version, summary, summary_tokens, summarized_through "
+                                  "FROM chat_sessions WHERE session_id=?", (session_id,)).fetchone()
+            if row is None:
+                self._sessions.pop(session_id, None)
+                return SessionState()
+            cached = self._sessions.get(session_id)
+            if cached is not None and cached.version == row[0]:
+                self._sessions.move_to_end(session_id)
+                return cached
+            turns = self.db.execute("SELECT id, role, content, tokens FROM chat_turns "
+                                    "WHERE session_id=? ORDER BY id",
+                                    (session_id,)).fetchall()
+            state = SessionState(version=row[0], summary=row[1], summary_tokens=row[2],
+                                 summarized_through=row[3], turns=[tuple(t) for t in turns])
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            ## cold sessions spill: they stay in SQLite only
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return state
+
+    def history(self, session_id: str) -> List[BaseMessage]:
+        '''Messages to send with the next question: the summary (if any) then the newest turns
+        within the budget'''
+        state = self._state(session_id)
+        budget = self.max_tokens - state.summary_tokens
+        recent: List[Tuple[int, str, str, int]] = []
+        ## hard cap, also when compaction is behind: newest turns first until the budget is spent
+        for turn in reversed(state.turns):
+            if recent and budget - turn[3] < 0:
+                break
+            budget -= turn[3]
+            recent.append(turn)
+        if recent and recent[-1][1] == AI:
+            ## never start the window with an orphaned answer
+            recent.pop()
+        messages: List[BaseMessage] = []
+        if state.summary:
+            messages += [HumanMessage(content="Summarize our conversation so far."),
+                         AIMessage(content=state.summary)]
+        for _, role, content, _ in reversed(recent):
+            messages.append(HumanMessage(content=content) if role == HUMAN
+                            else AIMessage(content=content))
+        return messages
+
+    def append(self, session_id: str, question: str, answer: str):
+        '''Record one question/answer turn'''
+        now = time.time()
+        with self._lock:
+            self.db.execute("INSERT INTO chat_sessions(session_id, updated) VALUES (?,?) "
+                            "ON CONFLICT(session_id) DO UPDATE SET version=version+1, "
+                            "updated=excluded.updated",
+                            (session_id, now))
+            version = self.db.execute("SELECT version FROM chat_sessions WHERE session_id=?",
+                                      (session_id,)).fetchone()[0]
+            turns = []
+            for role, content in ((HUMAN, question), (AI, answer)):
+                tokens = count_tokens(content)
+                cur = self.db.execute("INSERT INTO chat_turns(session_id, role, content, tokens) "
+                                      "VALUES (?,?,?,?)",
+                                      (session_id, role, content, tokens))
+                turns.append((cur.lastrowid, role, content, tokens))
+            self.db.commit()
+            ## keep the cached copy current when it was current before this write
+            cached = self._sessions.get(session_id)
+            if cached is not None and cached.version == version - 1:
+                cached.turns = cached.turns + turns
+                cached.version = version
+
+    def clear(self, session_id: str):
+        '''Delete the history of the session'''
+        with self._lock:
+            self.db.execute("DELETE FROM chat_turns WHERE session_id=?", (session_id,))
+            self.db.execute("DELETE FROM chat_sessions WHERE session_id=?", (session_id,))
+            self.db.commit()
+            self._sessions.pop(session_id, None)
+
+    def _to_fold(self, state: SessionState) -> List[Tuple[int, str, str, int]]:
+        '''Oldest turns to summarize: down to half the budget (so not every turn triggers a
+        summary), always keeping the newest keep_recent_messages turns verbatim
+        '''
+        if state.tokens <= self.max_tokens:
+            return []
+        foldable = state.turns[:max(0, len(state.turns) - self.keep_recent_messages)]
+        remaining = state.tokens
+        fold = []
+        for turn in foldable:
+            if remaining <= self.max_tokens // 2:
+                break
+            fold.append(turn)
+            remaining -= turn[3]
+        ## fold whole question/answer pairs
+        if fold and fold[-1][1] == HUMAN and len(fold) < len(foldable):
+            fold.append(foldable[len(fold)])
+        return fold
+
+    def _apply_compaction(self, session_id: str, through: int, summary: str,
+                          expected_through: int) -> bool:
+        with self._lock:
+            ## another worker compacted meanwhile: keep its summary, ours is discarded
+            updated = self.db.execute("UPDATE chat_sessions SET summary=?, summary_tokens=?, "
+                                      "summarized_through=?, version=version+1 "
+                                      "WHERE session_id=? AND summarized_through=?",
+                                      (summary, count_tokens(summary), through, session_id,
+                                       expected_through)).rowcount
+            if updated:
+                self.db.execute("DELETE FROM chat_turns WHERE session_id=? AND id<=?",
+                                (session_id, through))
+            self.db.commit()
+        return bool(updated)
+
+    def _summarizer(self):
+        loader = get_model_loader()
+        prompt = PROMPT_REGISTRY[PromptType.CHAT_HISTORY_SUMMARY.value]
+        return loader.get_chain(PromptType.CHAT_HISTORY_SUMMARY.value,
+                                lambda llm: prompt | llm | StrOutputParser())
+
+    async def acompact(self, session_id: str):
+        '''Fold the oldest turns of an over-budget session into its summary (one LLM call)'''
+        with self._lock:
+            if session_id in self._compacting:
+                return
+            self._compacting.add(session_id)
+        try:
+            state = await run_blocking(self._state, session_id)
+            fold = self._to_fold(state)
+            if not fold:
+                return
+            turns = "\n".join(f"{'User' if role == HUMAN else 'Assistant'}: {content}"
+                              for _, role, content, _ in fold)
+            async with llm_slot():
+                summary = await self._summarizer().ainvoke({
+                    "summary": state.summary or "(none)",
+                    "turns": turns,
+                    "max_words": self.summary_max_words,
+                })
+            applied = await run_blocking(self._apply_compaction, session_id, fold[-1][0],
+                                         summary.strip(), state.summarized_through)
+            self.log.info("Chat history compacted", session_id=session_id, turns_folded=len(fold),
+                          applied=applied)
+        except Exception as e:
+            ## history stays within budget through the hard cap in history(), retried after the
+            ## next turn
+            self.log.error("Chat history compaction failed", session_id=session_id, error=str(e))
+        finally:
+            with self._lock:
+                self._compacting.discard(session_id)
+
+
+@lru_cache(maxsize=1)
+def get_chat_memory() -> Optional[ChatMemory]:
+    '''Shared chat memory for the process, None when disabled in config'''
+    cfg = load_config().get("chat_memory") or {}
+    if not cfg.get("enabled", True):
+        return None
+    return ChatMemory(
+        os.getenv("CHAT_MEMORY_PATH", cfg.get("path", "cache/chat_memory.sqlite")),
+        max_tokens=int(cfg.get("max_history_tokens", 2000)),
+        keep_recent_messages=int(cfg.get("keep_recent_messages", 4)),
+        summary_max_words=int(cfg.get("summary_max_words", 200)),
+        max_sessions=int(cfg.get("max_sessions_in_memory", 1000)),
+        ttl_s=float(cfg.get("ttl_hours", 72)) * 3600,
+    )
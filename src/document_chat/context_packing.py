@@ -0,0 +1,181 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from utils.bm25_index import tokenize
+from utils.tokens import count_tokens, CHARS_PER_TOKEN
+
+## chunks this close (characters, e.g. the whitespace the splitter stripped) count as adjacent
+MAX_GAP = 2
+## word n-grams compared between passages of different sources
+SHINGLE = 3
+
+
+@dataclass
+class Passage:
+    """Contiguous text of one source page built from one or more retrieved chunks."""
+    source: str
+    page: Optional[int]
+    start: Optional[int]
+    text: str
+    ## best (lowest) retrieval rank of the chunks it was built from
+    rank: int
+    terms: frozenset = field(default_factory=frozenset)
+    shingles: frozenset = field(default_factory=frozenset)
+
+    @property
+    def end(self) -> Optional[int]:
+        '''End offset in the source, when the start is known'''
+        return None if self.start is None else self.start + len(self.text)
+
+    @property
+    def label(self) -> str:
+        '''Citation label: file name and 1-based page'''
+        name = os.path.basename(self.source) if self.source else "unknown"
+        return name if self.page is None else f"{name}, page {int(self.page) + 1}"
+
+
+def _passages(docs: Sequence[Document]) -> List[Passage]:
+    out = []
+    for rank, d in enumerate(docs):
+        md = d.metadata or {}
+        start = md.get("start_index")
+        out.append(Passage(
+            source=str(md.get("source") or md.get("file_path") or ""),
+            page=md.get("page"),
+            start=start if isinstance(start, int) and start >= 0 else None,
+            text=d.page_content,
+            rank=rank,
+        ))
+    return out
+
+
+def merge_adjacent(passages: List[Passage]) -> List[Passage]:
+    '''Merge overlapping or adjacent chunks of the same source page, the overlap is kept once'''
+    merged: List[Passage] = []
+    positioned: Dict[tuple, List[Passage]] = {}
+    for p in passages:
+        if p.start is None:
+            merged.append(p)
+        else:
+            positioned.setdefault((p.source, p.page), []).append(p)
+    for group in positioned.values():
+        group.sort(key=lambda p: p.start)
+        cur = group[0]
+        for p in group[1:]:
+            if p.start > cur.end + MAX_GAP:
+                merged.append(cur)
+                cur = p
+                continue
+            if p.end > cur.end:
+                tail = p.text[cur.end - p.start:] if p.start <= cur.end else " " + p.text
+                cur = Passage(cur.source, cur.page, cur.start, cur.text + tail,
+                              min(cur.rank, p.rank))
+            else:
+                cur = Passage(cur.source, cur.page, cur.start, cur.text, min(cur.rank, p.rank))
+        merged.append(cur)
+    return sorted(merged, key=lambda p: p.rank)
+
+
+def _similarity(a: Passage, b: Passage) -> float:
+    '''Overlap of term sets relative to the smaller one, so a passage contained in another
+    scores 1'''
+    if not a.terms or not b.terms:
+        return 0.0
+    return len(a.terms & b.terms) / min(len(a.terms), len(b.terms))
+
+
+def _shingles(terms: List[str]) -> frozenset:
+    if len(terms) < SHINGLE:
+        return frozenset([tuple(terms)]) if terms else frozenset()
+    return frozenset(tuple(terms[i:i + SHINGLE]) for i in range(len(terms) - SHINGLE + 1))
+
+
+def _is_duplicate(a: Passage, b: Passage, threshold: float) -> bool:
+    '''Within a source, one passage contained in the other; across sources only (nearly) the same
+    text, by symmetric Jaccard of word n-grams, so a short clause of another document is kept
+    '''
+    if a.source == b.source:
+        return _similarity(a, b) >= threshold
+    if not a.shingles or not b.shingles:
+        return False
+    return len(a.shingles & b.shingles) / len(a.shingles | b.shingles) >= threshold
+
+
+def drop_near_duplicates(passages: List[Passage], threshold: float) -> List[Passage]:
+    '''Keep the best ranked of every group of near-identical passages'''
+    kept: List[Passage] = []
+    for p in passages:
+        if not any(_is_duplicate(p, k, threshold) for k in kept):
+            kept.append(p)
+    return kept
+
+
+def mmr_order(passages: List[Passage], lambda_mult: float) -> List[Passage]:
+    '''Maximal marginal relevance over term overlap: rank relevance vs. similarity to what is
+    already picked'''
+    remaining = list(passages)
+    picked: List[Passage] = []
+    while remaining:
+        def score(p: Passage) -> float:
+            redundancy = max((_similarity(p, q) for q in picked), default=0.0)
+            return lambda_mult / (p.rank + 1) - (1 - lambda_mult) * redundancy
+        best = max(remaining, key=score)
+        picked.append(best)
+        remaining.remove(best)
+    return picked
+
+
+def pack_context(docs: Sequence[Document], max_tokens: int = 3000, dedup_threshold: float = 0.85,
+                 mmr_lambda: Optional[float] = None, label_sources: bool = True) -> str:
+    '''Assemble retrieved chunks into the LLM context: merge adjacent chunks, drop near duplicates,
+    optionally diversify (MMR), keep the best passages that fit max_tokens and order them by
+    position in their source.
+    '''
+    passages = merge_adjacent(_passages(docs))
+    for p in passages:
+        terms = tokenize(p.text)
+        p.terms = frozenset(terms)
+        p.shingles = _shingles(terms)
+    passages = drop_near_duplicates(passages, dedup_threshold)
+    if mmr_lambda is not None:
+        passages = mmr_order(passages, mmr_lambda)
+
+    selected: List[Passage] = []
+    budget = max_tokens
+    for p in passages:
+        block = f"[Source: {p.label}]\n{p.text}" if label_sources else p.text
+        tokens = count_tokens(block)
+        if tokens > budget:
+            if selected:
+                continue
+            ## the best passage alone is over budget: keep its beginning
+            p.text = p.text[:max(0, budget * CHARS_PER_TOKEN - len(block) + len(p.text))]
+            tokens = budget
+        selected.append(p)
+        budget -= tokens
+
+    ## sources in order of their best passage, passages in reading order within a source
+    source_rank: Dict[str, int] = {}
+    for p in selected:
+        source_rank[p.source] = min(source_rank.get(p.source, p.rank), p.rank)
+    selected.sort(key=lambda p: (source_rank[p.source], p.source,
+                                 p.page if p.page is not None else -1,
+                                 p.start if p.start is not None else -1, p.rank))
+    if label_sources:
+        return "\n\n".join(f"[Source: {p.label}]\n{p.text}" for p in selected)
+    return "\n\n".join(p.text for p in selected)
+
+
+def packing_settings(cfg: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    '''pack_context keyword arguments from the context_packing config block'''
+    cfg = cfg or {}
+    mmr = cfg.get("mmr_lambda")
+    return {
+        "max_tokens": int(cfg.get("max_tokens", 3000)),
+        "dedup_threshold": float(cfg.get("dedup_threshold", 0.85)),
+        "mmr_lambda": None if mmr is None else float(mmr),
+        "label_sources": bool(cfg.get("label_sources", True)),
+    }
@@ -0,0 +1,152 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import ConfigDict
+from langchain_core.callbacks import (CallbackManagerForRetrieverRun,
+                                      AsyncCallbackManagerForRetrieverRun)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+
+from utils.bm25_index import BM25Index, get_bm25_index
+from utils.concurrency import run_blocking
+from utils.config_loader import load_config
+from utils.metrics import span
+
+## a query starting with one of these is a question or an instruction, never a keyword lookup
+QUESTION_WORDS = frozenset(
+    "what which who whom whose when where why how is are was were am do does did can could "
+    "should would will shall may might must has have had explain describe list summarize "
+    "summarise tell show give compare find please".split()
+)
+QUOTED = re.compile(r'"[^"]+"|\u201c[^\u201d]+\u201d')
+## identifier-like words: anything with a digit, acronyms, and joined terms such as
+## "ab-12" or "net_30"
+IDENTIFIER = re.compile(r"\d|^[A-Z]{2,}$|[A-Za-z0-9][-_/.:#][A-Za-z0-9]")
+
+class HybridRetriever(BaseRetriever):
+    """Dense (FAISS) + lexical (BM25) retrieval fused with reciprocal rank fusion.
+
+    mode: "hybrid" fuses both lists, "lexical" uses BM25 only, "dense" FAISS only.
+    In hybrid mode a keyword-like query (a few words, mostly clause numbers, part ids,
+    acronyms or quoted terms) skips the query embedding call when BM25 answers it well:
+    its top score must reach keyword_min_score of BM25Index.max_score for the query.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: FAISS
+    bm25: Optional[BM25Index] = None
+    k: int = 5
+    mode: str = "hybrid"
+    fetch_k: int = 20
+    rrf_k: int = 60
+    keyword_fast_path: bool = True
+    keyword_max_terms: int = 3
+    keyword_min_score: float = 0.3
+
+    def is_keyword_query(self, query: str) -> bool:
+        '''Decided on the raw query: no question mark or leading question/instruction word,
+        at most keyword_max_terms words (a quoted phrase is one) and at least half of them
+        identifier-like or quoted
+        '''
+        text = (query or "").strip()
+        if not text or "?" in text:
+            return False
+        quoted = QUOTED.findall(text)
+        words = [w.strip(".,;:()[]'") for w in QUOTED.sub(" ", text).split()]
+        words = [w for w in words if w]
+        if not 0 < len(quoted) + len(words) <= self.keyword_max_terms:
+            return False
+        if text.split()[0].lower().rstrip(",.:;") in QUESTION_WORDS:
+            return False
+        identifiers = len(quoted) + sum(1 for w in words if IDENTIFIER.search(w))
+        return 2 * identifiers >= len(quoted) + len(words)
+
+    def _search(self, query: str) -> List[Tuple[str, float]]:
+        if self.bm25 is None:
+            return []
+        with span("rag", "bm25_search"):
+            return self.bm25.search(query, self.fetch_k)
+
+    def _lexical(self, query: str) -> List[str]:
+        return [doc_id for doc_id, _ in self._search(query)]
+
+    def _dense(self, vector: List[float]) -> List[str]:
+        with span("rag", "faiss_search"):
+            query_vector = np.asarray([vector], dtype=np.float32)
+            _, idx = self.vectorstore.index.search(query_vector, self.fetch_k)
+        return [self.vectorstore.index_to_docstore_id[i] for i in idx[0] if i != -1]
+
+    def _fuse(self, *rankings: List[str]) -> List[str]:
+        scores: Dict[str, float] = {}
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def _documents(self, doc_ids: List[str]) -> List[Document]:
+        docs = []
+        for doc_id in doc_ids:
+            doc = self.vectorstore.docstore.search(doc_id)
+            ## ids of a BM25 file newer than this store are skipped
+            if isinstance(doc, Document):
+                docs.append(doc)
+            if len(docs) == self.k:
+                break
+        return docs
+
+    def _lexical_only(self, query: str) -> Optional[List[str]]:
+        '''BM25 ranking when the query should not be embedded at all, else None'''
+        if self.mode == "lexical":
+            return self._lexical(query)
+        fast_path = self.mode == "hybrid" and self.keyword_fast_path and self.bm25 is not None
+        if fast_path and self.is_keyword_query(query):
+            hits = self._search(query)
+            ## a weak best hit (missing or rare terms barely matched) goes through dense
+            ## retrieval too
+            if hits and hits[0][1] >= self.keyword_min_score * self.bm25.max_score(query):
+                return [doc_id for doc_id, _ in hits]
+        return None
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        lexical = self._lexical_only(query)
+        if lexical is not None:
+            return self._documents(lexical)
+        with span("rag", "embed_query"):
+            vector = self.vectorstore.embeddings.embed_query(query)
+        dense = self._dense(vector)
+        if self.mode == "dense" or self.bm25 is None:
+            return self._documents(dense)
+        return self._documents(self._fuse(dense, self._lexical(query)))
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun
+                                       ) -> List[Document]:
+        lexical = self._lexical_only(query)
+        if lexical is not None:
+            return self._documents(lexical)
+        with span("rag", "embed_query"):
+            vector = await self.vectorstore.embeddings.aembed_query(query)
+        dense = await run_blocking(self._dense, vector)
+        if self.mode == "dense" or self.bm25 is None:
+            return self._documents(dense)
+        return self._documents(self._fuse(dense, self._lexical(query)))
+
+
+def build_retriever(vectorstore: FAISS, index_dir, k: int = 5,
+                    retriever_cfg: Optional[Dict[str, Any]] = None) -> BaseRetriever:
+    '''Retriever for a session index, configured by the retriever config block'''
+    cfg = retriever_cfg if retriever_cfg is not None else (load_config().get("retriever") or {})
+    return HybridRetriever(
+        vectorstore=vectorstore,
+        bm25=get_bm25_index(index_dir),
+        k=k,
+        mode=str(cfg.get("mode", "hybrid")),
+        fetch_k=max(k, int(cfg.get("fetch_k", 20))),
+        rrf_k=int(cfg.get("rrf_k", 60)),
+        keyword_fast_path=bool(cfg.get("keyword_fast_path", True)),
+        keyword_max_terms=int(cfg.get("keyword_max_terms", 3)),
+        keyword_min_score=float(cfg.get("keyword_min_score", 0.3)),
+    )
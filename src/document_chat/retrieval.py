@@ -1,20 +1,42 @@
 import os
 import sys
 from operator import itemgetter
-import streamlit as st
-from typing import Optional, List
+from typing import Optional, List, AsyncIterator
 
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_community.vectorstores import FAISS
+from langchain_core.runnables import RunnableBranch
 
-from utils.model_loader import ModelLoader
+from utils.model_loader import get_model_loader
+from utils.vectorstore_cache import get_vectorstore_cache
+from utils.faiss_index import apply_search_params, search_params, index_settings, load_store
+from utils.bm25_index import tokenize
+from utils.concurrency import llm_slot
+from utils.metrics import span
+from src.document_chat.hybrid_retriever import build_retriever
+from src.document_chat.context_packing import pack_context, packing_settings
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from prompts.prompt_library import PROMPT_REGISTRY
 from model.models import PromptType
 
+## words that point back into the conversation ("what about its warranty?")
+ANAPHORA = frozenset(
+    "it its it's they them their theirs this that these those he him his she her hers there "
+    "above previous earlier former latter same else also too one ones".split()
+)
+
+
+def needs_rewrite(question: str, chat_history: Optional[List[BaseMessage]]) -> bool:
+    '''True if the question depends on the conversation and must be rewritten before retrieval'''
+    if not chat_history:
+        return False
+    words = (question or "").lower().replace("?", " ").split()
+    ## very short follow-ups ("why?", "and section 5?") cannot stand alone
+    if len(tokenize(question)) <= 2:
+        return True
+    return any(word.strip(".,;:!\"'()") in ANAPHORA for word in words)
+
 
 class ConversationRAG:
     
@@ -23,17 +45,22 @@ class ConversationRAG:
             self.log = CustomLogger().get_logger(__name__)
             ## loading session id
             self.session_id = session_id
+            ## shared model loader (process wide client registry)
+            self.loader = get_model_loader()
             ## llm
             self.llm = self._load_llm()
             ## Prompt
             self.contextualize_prompt = PROMPT_REGISTRY[PromptType.CONTEXTUALIZE_QUESTION.value]
             self.qa_prompt = PROMPT_REGISTRY[PromptType.CONTEXT_QA.value]
-            ## loading retriever
-            if retriever is None:
-                raise ValueError("Retriever is None")
+            ## context assembly (merge, dedup, token budget), None keeps plain concatenation
+            packing_cfg = self.loader.config.get("context_packing") or {}
+            self.packing = (packing_settings(packing_cfg) if packing_cfg.get("enabled", True)
+                            else None)
+            ## loading retriever, chain is built once a retriever is available
             self.retriever = retriever
-            ## build lcel chain
-            self._build_lcel_chain()
+            self.chain = None
+            if self.retriever is not None:
+                self._build_lcel_chain()
             
             self.log.info("ConversationalRAG Initialized", session_id = self.session_id)
             
@@ -41,19 +68,31 @@ class ConversationRAG:
             self.log.error("Failed to initialised ConversationalRAG", error = str(e))
             raise DocumentPortalException("Initialization error in ConversationalRAG", sys)
         
-    def load_retriever_from_faiss(self, index_path:str):
-        """Load a FAISS vectostore from disk and convert to retriever
+    def load_retriever_from_faiss(self, index_path:str, k:int = 5,
+                                  search_kwargs:Optional[dict] = None):
+        """Load a FAISS vectostore (from the process cache, else from disk) and convert to retriever
+        search_kwargs may override the retriever config knobs (nprobe, ef_search)
         """
         try:
             ## load embedding model
-            embedding = ModelLoader().load_embedding_model()
-            ## check if path is a directory path
-            if not os.path.isdir(index_path):
-                raise FileNotFoundError(f"FAISS index directory not found: {index_path}")
-            
-            ## loading index
-            vectore_store = FAISS.load_local(index_path, embedding, allow_dangerous_deserialization=True)
-            self.retriever = vectore_store.as_retriever(search_type ='similarity', search_kwargs={"k":5})
+            embedding = self.loader.load_embedding_model()
+
+            ## loading index, only the first question of a session reads it from disk
+            def _load():
+                ## check if path is a directory path
+                if not os.path.isdir(index_path):
+                    raise FileNotFoundError(f"FAISS index directory not found: {index_path}")
+                ## mmap: vectors are shared through the OS page cache across uvicorn workers
+                with span("rag", "index_load"):
+                    return load_store(index_path, embedding, mmap=mmap)
+
+            mmap = index_settings()["load_mode"] == "mmap"
+            vectore_store = get_vectorstore_cache().get_or_load(index_path, _load, mmapped=mmap)
+            ## IVF nprobe / HNSW efSearch, ignored by index types that have no such knob
+            apply_search_params(vectore_store, {**search_params(), **(search_kwargs or {})})
+            ## BM25 + dense fusion (retriever.mode), keyword-like questions skip the embedding call
+            self.retriever = build_retriever(vectore_store, index_path, k=k)
+            self._build_lcel_chain()
             self.log.info("Loaded retriever from FAISS index", index_path=index_path)
             
             return self.retriever
@@ -66,6 +105,9 @@ class ConversationRAG:
         """Invoke the retriver
         """
         try:
+            if self.chain is None:
+                raise DocumentPortalException("RAG chain not initialized, load a retriever first",
+                                              sys)
             chat_history = chat_history or []
             payload = {"input":user_input, "chat_history":chat_history}
             answer = self.chain.invoke(payload)
@@ -87,10 +129,64 @@ class ConversationRAG:
             self.log.error("Failed to invoke CoversationalRag", error=str(e))
             raise DocumentPortalException("Invocation error in CoversationalRag",sys)
         
+    async def ainvoke(self, user_input: str, chat_history:Optional[List[BaseMessage]]=None) -> str:
+        """Async version of invoke: query embedding and LLM calls are awaited, FAISS search runs
+        in an executor
+        """
+        try:
+            if self.chain is None:
+                raise DocumentPortalException("RAG chain not initialized, load a retriever first",
+                                              sys)
+            payload = {"input":user_input, "chat_history":chat_history or []}
+            async with llm_slot():
+                answer = await self.chain.ainvoke(payload)
+
+            if not answer:
+                self.log.warning("No answer generated", user_input = user_input,
+                                 session_id = self.session_id)
+                return "no answer generated"
+
+            self.log.info(
+                "Chain invoked successfully",
+                session_id = self.session_id,
+                user_input = user_input,
+                answer_preview = answer[:150]
+            )
+
+            return answer
+
+        except Exception as e:
+            self.log.error("Failed to invoke CoversationalRag", error=str(e))
+            raise DocumentPortalException("Invocation error in CoversationalRag",sys)
+
+    async def astream(self, user_input: str,
+                      chat_history:Optional[List[BaseMessage]]=None) -> AsyncIterator[str]:
+        """Stream the answer tokens as the LLM generates them
+        """
+        try:
+            if self.chain is None:
+                raise DocumentPortalException("RAG chain not initialized, load a retriever first",
+                                              sys)
+            payload = {"input":user_input, "chat_history":chat_history or []}
+
+            answer_chars = 0
+            async with llm_slot():
+                async for token in self.chain.astream(payload):
+                    if token:
+                        answer_chars += len(token)
+                        yield token
+
+            self.log.info("Chain streamed successfully", session_id = self.session_id,
+                          user_input = user_input, answer_chars = answer_chars)
+
+        except Exception as e:
+            self.log.error("Failed to stream CoversationalRag", error=str(e))
+            raise DocumentPortalException("Streaming error in CoversationalRag",sys)
+
     def _load_llm(self):
         try:
             ## load llm
-            llm = ModelLoader().load_llm()
+            llm = self.loader.load_llm()
             ## check if llm or not
             if not llm:
                 raise ValueError("LLM could not be loaded")
@@ -102,24 +198,34 @@ class ConversationRAG:
             self.log.error("Failed to Load llm in CoversationalRag", error=str(e))
             raise DocumentPortalException("LLM loading error in CoversationalRag",sys)
     
-    @staticmethod
-    def _format_docs(docs):
-        return "\n\n".join(d.page_content for d in docs)
+    def _format_docs(self, docs):
+        if self.packing is None:
+            return "\n\n".join(d.page_content for d in docs)
+        with span("rag", "pack_context"):
+            return pack_context(docs, **self.packing)
         
     def _build_lcel_chain(self):
         try:
-            ## Will rewrite question based on our chat history
-            question_rewriter = (
-                {
-                    "input":itemgetter("input"),
-                    "chat_history":itemgetter("chat_history")
-                }
-                | self.contextualize_prompt
-                | self.llm
-                | StrOutputParser() 
+            ## Will rewrite question based on our chat history (shared across sessions)
+            question_rewriter = self.loader.get_chain(
+                PromptType.CONTEXTUALIZE_QUESTION.value,
+                lambda llm: (
+                    {
+                        "input":itemgetter("input"),
+                        "chat_history":itemgetter("chat_history")
+                    }
+                    | self.contextualize_prompt
+                    | llm
+                    | StrOutputParser()
+                )
+            )
+            ## the rewrite LLM call only runs for follow-ups that depend on the history
+            standalone_question = RunnableBranch(
+                (lambda x: needs_rewrite(x["input"], x["chat_history"]), question_rewriter),
+                itemgetter("input"),
             )
             ## Retrieve docs for rewriting questions
-            retrieve_docs = question_rewriter | self.retriever | self._format_docs
+            retrieve_docs = standalone_question | self.retriever | self._format_docs
             
             ## feed context + original input + chat history into answer prompt
             self.chain = (
@@ -129,7 +235,7 @@ class ConversationRAG:
                     "chat_history": itemgetter("chat_history")
                 }
                 | self.qa_prompt
-                | self.llm
+                | self.llm.with_config(tags=[f"chain:{PromptType.CONTEXT_QA.value}"])
                 | StrOutputParser()
             )
             
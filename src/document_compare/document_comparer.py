@@ -1,24 +1,28 @@
 import sys
-from dotenv import load_dotenv
+import asyncio
+from typing import AsyncIterator, Any, List, Tuple
 import pandas as pd
+from pydantic import ValidationError
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from model.models import *
 from prompts.prompt_library import PROMPT_REGISTRY
-from utils.model_loader import ModelLoader
+from utils.model_loader import get_model_loader
+from utils.metrics import span
+from utils.concurrency import llm_slot
+from utils.result_cache import result_key
+from src.document_compare.page_diff import PagePair, align_pages, page_change_text, page_sort_key
 from langchain_core.output_parsers import JsonOutputParser
 from langchain.output_parsers import OutputFixingParser
-import pandas as pd
 
 
 class DocumentComparerLLM:
     
     def __init__(self):
-        load_dotenv()
         ## initializing custom logger
         self.log = CustomLogger().get_logger(__file__)
-        ## initializing model
-        self.loader = ModelLoader()
+        ## shared model loader, llm client comes from the process wide registry
+        self.loader = get_model_loader()
         ## loading model
         self.llm = self.loader.load_llm()
         ## Output parser
@@ -26,11 +30,29 @@ class DocumentComparerLLM:
         self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm = self.llm)
         ## Loading Prompt
         self.prompt = PROMPT_REGISTRY['document_comparision']
-        ## Defining the chain
-        self.chain = self.prompt | self.llm | self.parser 
+        ## Defining the chain (built once per llm config)
+        self.chain = self.loader.get_chain('document_comparision',
+                                           lambda llm: self.prompt | llm | self.parser)
+        ## Page level chain: only pages that differ are sent to the LLM, in batches; it is never
+        ## streamed, so malformed JSON is sent back to the LLM for repair by the fixing parser
+        self.page_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_PAGE_COMPARISION.value]
+        self.page_chain = self.loader.get_chain(
+            PromptType.DOCUMENT_PAGE_COMPARISION.value,
+            lambda llm: self.page_prompt | llm | self.fixing_parser)
+        compare_cfg = self.loader.config.get('document_compare') or {}
+        self.pages_per_batch = max(1, int(compare_cfg.get('pages_per_batch', 4)))
+        concurrency = self.loader.config.get('concurrency') or {}
+        self.max_concurrency = int(concurrency.get('max_concurrent_llm_calls', 32))
         ## logging success
         self.log.info("\nDocument Comparer LLM initialized with model and parser", model=self.llm)
     
+    def result_key(self, reference_sha256: str, actual_sha256: str) -> str:
+        '''Result cache key of a page comparison: both documents (in order), page prompt
+        version, llm config'''
+        return result_key("page_comparison", [reference_sha256, actual_sha256],
+                          [PromptType.DOCUMENT_PAGE_COMPARISION.value], self.loader.llm_key(),
+                          {"pages_per_batch": self.pages_per_batch})
+
     def compare_documents(self, combined_docs: str) -> pd.DataFrame:
         '''
         Compares two documents and returns a structured comparision.
@@ -40,17 +62,191 @@ class DocumentComparerLLM:
                 "combined_docs" : combined_docs,
                 "format_instruction" : self.parser.get_format_instructions()
             }
-            self.log.info("Starting document comparision", inputs=inputs)
+            self.log.info("Starting document comparision", input_chars=len(combined_docs))
             
             response = self.chain.invoke(inputs)
             self.log.info("Document comparision completed", response_preview=str(response)[:100])
             
-            return self._format_response(response)
+            return self._format_response(self._valid_rows(self._rows(response)))
         
         except Exception as e:
             self.log.error(f"Error in compare_documents", error=str(e))
             raise DocumentPortalException("An error occured while comparing documents.", sys)
     
+    async def acompare_documents(self, combined_docs: str) -> pd.DataFrame:
+        '''
+        Async version of compare_documents, bounded by the per-worker LLM concurrency limit.
+        '''
+        try:
+            inputs = {
+                "combined_docs" : combined_docs,
+                "format_instruction" : self.parser.get_format_instructions()
+            }
+            self.log.info("Starting document comparision", input_chars=len(combined_docs))
+
+            async with llm_slot():
+                response = await self.chain.ainvoke(inputs)
+            self.log.info("Document comparision completed", response_preview=str(response)[:100])
+
+            return self._format_response(self._valid_rows(self._rows(response)))
+
+        except Exception as e:
+            self.log.error("Error in acompare_documents", error=str(e))
+            raise DocumentPortalException("An error occured while comparing documents.", sys)
+
+    async def astream_rows(self, combined_docs: str) -> AsyncIterator[dict]:
+        '''
+        Streams the comparision, yielding each ChangeFormat row as soon as it is complete.
+        '''
+        try:
+            inputs = {
+                "combined_docs" : combined_docs,
+                "format_instruction" : self.parser.get_format_instructions()
+            }
+            self.log.info("Starting streamed document comparision", input_chars=len(combined_docs))
+
+            ## the parser yields the partially parsed JSON list as tokens arrive,
+            ## every row except the last one in a partial list is already complete
+            emitted = 0
+            rows: list = []
+            async with llm_slot():
+                async for partial in self.chain.astream(inputs):
+                    rows = self._rows(partial)
+                    while emitted < len(rows) - 1:
+                        for row in self._valid_rows(rows[emitted:emitted + 1]):
+                            yield row
+                        emitted += 1
+            for row in self._valid_rows(rows[emitted:]):
+                yield row
+
+            self.log.info("Streamed document comparision completed", rows=len(rows))
+
+        except Exception as e:
+            self.log.error("Error in astream_rows", error=str(e))
+            raise DocumentPortalException("An error occured while streaming the comparision.", sys)
+
+    def _plan_pages(self, ref_pages: List[str],
+                    act_pages: List[str]) -> Tuple[List[dict], List[dict]]:
+        '''Align and diff the pages locally.
+        Returns the NO CHANGE rows for identical pages and the LLM inputs for the changed ones.
+        '''
+        with span("comparer", "page_diff"):
+            pairs = align_pages(ref_pages, act_pages)
+        unchanged = [{"Page": p.label, "changes": "NO CHANGE"} for p in pairs if not p.changed]
+        changed: List[PagePair] = [p for p in pairs if p.changed]
+        size = self.pages_per_batch
+        batches = [changed[i:i + size] for i in range(0, len(changed), size)]
+        inputs = [
+            {
+                "changed_pages": "\n\n".join(page_change_text(p, ref_pages, act_pages)
+                                             for p in batch),
+                "format_instruction": self.parser.get_format_instructions(),
+            }
+            for batch in batches
+        ]
+        self.log.info("Page diff completed", pages=len(pairs), unchanged=len(unchanged),
+                      changed=len(changed), llm_batches=len(inputs))
+        return unchanged, inputs
+
+    def _merge_rows(self, unchanged: List[dict], responses: List[Any]) -> List[dict]:
+        rows = list(unchanged)
+        for response in responses:
+            rows.extend(self._valid_rows(self._rows(response)))
+        rows.sort(key=lambda r: page_sort_key(r["Page"]))
+        return rows
+
+    def compare_pages(self, ref_pages: List[str], act_pages: List[str]) -> pd.DataFrame:
+        '''
+        Page level comparision: identical pages become NO CHANGE rows without an LLM call,
+        changed pages are compared in concurrent batches.
+        '''
+        try:
+            unchanged, inputs = self._plan_pages(ref_pages, act_pages)
+            with span("comparer", "compare_llm"):
+                config = {"max_concurrency": self.max_concurrency}
+                responses = self.page_chain.batch(inputs, config=config) if inputs else []
+            return self._format_response(self._merge_rows(unchanged, responses))
+
+        except Exception as e:
+            self.log.error("Error in compare_pages", error=str(e))
+            raise DocumentPortalException("An error occured while comparing documents.", sys)
+
+    async def _ainvoke_page_batch(self, inputs: dict) -> Any:
+        async with llm_slot():
+            return await self.page_chain.ainvoke(inputs)
+
+    async def acompare_pages(self, ref_pages: List[str], act_pages: List[str]) -> pd.DataFrame:
+        '''
+        Async version of compare_pages.
+        '''
+        try:
+            unchanged, inputs = self._plan_pages(ref_pages, act_pages)
+            with span("comparer", "compare_llm"):
+                responses = await asyncio.gather(*(self._ainvoke_page_batch(i) for i in inputs))
+            return self._format_response(self._merge_rows(unchanged, responses))
+
+        except Exception as e:
+            self.log.error("Error in acompare_pages", error=str(e))
+            raise DocumentPortalException("An error occured while comparing documents.", sys)
+
+    async def astream_page_rows(self, ref_pages: List[str],
+                                act_pages: List[str]) -> AsyncIterator[dict]:
+        '''
+        Streams the page level comparision: NO CHANGE rows first, then the rows of each
+        changed-page batch as soon as its LLM call completes.
+        '''
+        tasks: List[asyncio.Task] = []
+        try:
+            unchanged, inputs = self._plan_pages(ref_pages, act_pages)
+            for row in unchanged:
+                yield row
+            tasks = [asyncio.ensure_future(self._ainvoke_page_batch(i)) for i in inputs]
+            for fut in asyncio.as_completed(tasks):
+                for row in self._valid_rows(self._rows(await fut)):
+                    yield row
+
+        except Exception as e:
+            self.log.error("Error in astream_page_rows", error=str(e))
+            raise DocumentPortalException("An error occured while streaming the comparision.", sys)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _rows(parsed: Any) -> list:
+        '''Rows of a (partial) parsed response, which may come wrapped in an object'''
+        if isinstance(parsed, list):
+            return parsed
+        if isinstance(parsed, dict):
+            for value in parsed.values():
+                if isinstance(value, list):
+                    return value
+        return []
+
+    @staticmethod
+    def _repair_row(row: Any) -> Any:
+        '''Recover Page/changes from keys in another case, a numeric page or a list of changes'''
+        if not isinstance(row, dict):
+            return row
+        fields = {str(k).strip().lower(): v for k, v in row.items()}
+        page, changes = fields.get("page"), fields.get("changes", fields.get("change"))
+        if page is None or changes is None:
+            return row
+        if isinstance(changes, list):
+            changes = "; ".join(str(c) for c in changes)
+        return {"Page": str(page), "changes": str(changes)}
+
+    def _valid_rows(self, rows: list) -> List[dict]:
+        '''ChangeFormat rows of a response: malformed rows are repaired when possible,
+        else skipped'''
+        valid = []
+        for row in rows:
+            try:
+                valid.append(ChangeFormat.model_validate(self._repair_row(row)).model_dump())
+            except ValidationError as e:
+                self.log.warning("Malformed comparision row skipped", row=row, error=str(e))
+        return valid
+
     def _format_response(self,response_parsed:list[dict])->pd.DataFrame:
         '''
         Format the response from the LLM into a structured format.
@@ -58,7 +254,7 @@ class DocumentComparerLLM:
         try:
             ## converting response into dataframe
             df = pd.DataFrame(response_parsed)
-            self.log.info("Response formatted into Dataframe", dataframe=df)
+            self.log.info("Response formatted into Dataframe", rows=len(df))
             return df
             
         except Exception as e:
@@ -0,0 +1,77 @@
+import re
+import difflib
+import hashlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class PagePair:
+    """One aligned page of the reference/actual documents (0-based indexes, None if absent)."""
+    ref_index: Optional[int]
+    act_index: Optional[int]
+    changed: bool
+
+    @property
+    def label(self) -> str:
+        '''Page label used in the comparison rows: the actual page number, or the removed
+        reference page'''
+        if self.act_index is not None:
+            return str(self.act_index + 1)
+        return f"{self.ref_index + 1} (removed)"
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def page_hash(text: str) -> str:
+    '''Whitespace insensitive page fingerprint'''
+    return hashlib.sha1(_normalize(text).encode("utf-8")).hexdigest()
+
+
+def align_pages(ref_pages: List[str], act_pages: List[str]) -> List[PagePair]:
+    '''Align pages by matching page hashes, so inserted or removed pages do not shift
+    every later page into a "change".
+    '''
+    ref_h = [page_hash(p) for p in ref_pages]
+    act_h = [page_hash(p) for p in act_pages]
+    matcher = difflib.SequenceMatcher(None, ref_h, act_h, autojunk=False)
+
+    pairs: List[PagePair] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            pairs.extend(PagePair(i1 + k, j1 + k, False) for k in range(i2 - i1))
+            continue
+        ## replace/insert/delete: pair pages up positionally, leftovers are added or removed pages
+        for k in range(max(i2 - i1, j2 - j1)):
+            i = i1 + k if i1 + k < i2 else None
+            j = j1 + k if j1 + k < j2 else None
+            pairs.append(PagePair(i, j, True))
+    return pairs
+
+
+def page_change_text(pair: PagePair, ref_pages: List[str], act_pages: List[str],
+                     context: int = 2) -> str:
+    '''LLM input for one changed page: a unified diff for modified pages, the full text
+    for pages that only exist in one document.
+    '''
+    if pair.ref_index is None:
+        return f"Page {pair.label} (added in actual document):\n{act_pages[pair.act_index]}"
+    if pair.act_index is None:
+        return f"Page {pair.label} (removed from reference document):\n{ref_pages[pair.ref_index]}"
+    diff = difflib.unified_diff(
+        ref_pages[pair.ref_index].splitlines(),
+        act_pages[pair.act_index].splitlines(),
+        fromfile=f"reference page {pair.ref_index + 1}",
+        tofile=f"actual page {pair.act_index + 1}",
+        n=context,
+        lineterm="",
+    )
+    return f"Page {pair.label}:\n" + "\n".join(diff)
+
+
+def page_sort_key(label: str):
+    '''Sort rows by their leading page number'''
+    match = re.match(r"\s*(\d+)", str(label))
+    return (int(match.group(1)) if match else float("inf"), str(label))
@@ -7,9 +7,8 @@ import hashlib
 import shutil
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterable, Optional, Callable
 
-import fitz
 from langchain.schema import Document
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -17,67 +16,796 @@ from langchain_community.vectorstores import FAISS
 
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
-from utils.model_loader import ModelLoader
+from utils.model_loader import ModelLoader, get_model_loader
+
+from utils.file_io import (new_session_id, save_uploaded_file, save_upload, SavedFile,
+                           UploadTooLargeError, validate_session_id)
+from utils.vectorstore_cache import get_vectorstore_cache
+from utils.job_store import JobCancelled
+from utils.bm25_index import BM25Index, BM25_FILE
+from utils.metrics import span, record_cache, observe_stage
+from utils.blob_store import get_blob_store
+from utils.storage_manager import (get_storage_manager, ANALYSIS, COMPARE, CHAT_UPLOADS,
+                                   FAISS as FAISS_KIND)
+from utils.faiss_index import (index_settings, effective_factory, supports_remove, rebuild_store,
+                               new_store, apply_search_params, search_params, FALLBACK_FACTORY,
+                               index_lock, save_store, load_store)
+from utils.concurrency import run_blocking
+from utils.pdf_extractor import extract_pdf_pages
+from utils.document_ops import iter_documents, LoadReport
+from utils.chunker import (TokenChunker, iter_batches, chunk_config as resolve_chunk_config,
+                           chunking_settings)
+from src.document_chat.hybrid_retriever import build_retriever
+
+## progress(stage, **counters) hook of background jobs; it may raise to abort before the FAISS write
+ProgressFn = Callable[..., None]
+## stages reported once the index is written: too late to cancel, the hook must not raise for them
+POST_WRITE_STAGES = ("written",)
+
+
+def _check_quota(session_id: str, uploaded_files: Iterable):
+    '''Reject uploads (declared sizes) that would take a session over its storage quota'''
+    storage = get_storage_manager()
+    if storage is not None:
+        storage.check_quota(session_id, sum(getattr(f, "size", None) or 0 for f in uploaded_files))
+
+
+def _record_write(kind: str, session_id: str, path):
+    storage = get_storage_manager()
+    if storage is not None:
+        storage.record_write(kind, session_id, path)
+
+
+def _share_files(saved: Iterable[SavedFile]):
+    '''Hard-link saved uploads to the content-addressed copy, one copy on disk per distinct file'''
+    blobs = get_blob_store()
+    if blobs is not None:
+        for s in saved:
+            blobs.link_file(s)
 
-from utils.file_io import _session_id, save_uploaded_file
-from utils.document_ops import load_documents, concat_for_analysis, concat_for_comparison
 
 class FaissManager:
-    def __init__(self):
-        pass
+    """FAISS index with a persisted manifest of chunk fingerprints.
     
-    def _exits(self):
-        pass
+    The manifest (ingested_meta.json, next to index.faiss/index.pkl) records every chunk
+    already in the index and the content hash of every ingested source, so re-ingesting
+    the same or a slightly edited document only embeds the chunks that are new.
     
+    The index type comes from faiss_db.index_factory. Trainable types (IVF, PQ, SQ) start
+    as Flat and are rebuilt once there are enough vectors to train them; the factory
+    actually on disk is recorded in the manifest.
+    
+    Writers embed without holding the index lock, then reload the index and manifest, re-plan
+    and write under index_lock(exclusive=True): concurrent writers to one index (a request and
+    a queued job, or two workers) are serialized and never drop each other's chunks.
+    """
+    META_FILE = "ingested_meta.json"
+
+    def __init__(self, index_dir: Path, model_loader: Optional[ModelLoader] = None):
+        self.log = CustomLogger().get_logger(__name__)
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+
+        ## manifest: rows -> fingerprint: chunk info, sources -> source id: hash + chunk
+        ## fingerprints
+        self.meta_path = self.index_dir / self.META_FILE
+        self._meta: Dict[str, Any] = self._load_meta()
+
+        self.model_loader = model_loader or get_model_loader()
+        self.emb = self.model_loader.load_embedding_model()
+        self.settings = index_settings()
+        emb_cfg = self.model_loader.config.get('embedding_model') or {}
+        self.embed_batch_size = int(emb_cfg.get('batch_size', 256))
+        self.embed_batch_tokens = int(emb_cfg.get('max_batch_tokens', 200000))
+        self.vs: Optional[FAISS] = None
+
+    def _load_meta(self) -> Dict[str, Any]:
+        meta: Dict[str, Any] = {"rows": {}, "sources": {}, "index_factory": FALLBACK_FACTORY}
+        if self.meta_path.exists():
+            try:
+                loaded = json.loads(self.meta_path.read_text(encoding="utf-8")) or {}
+                meta["rows"] = loaded.get("rows", {})
+                meta["sources"] = loaded.get("sources", {})
+                meta["index_factory"] = loaded.get("index_factory", FALLBACK_FACTORY)
+            except Exception as e:
+                self.log.warning("Unreadable FAISS manifest, starting fresh",
+                                 path=str(self.meta_path), error=str(e))
+        return meta
+
+    def _reload(self):
+        '''Manifest and index as the last writer left them; call under index_lock(exclusive=True)'''
+        self._meta = self._load_meta()
+        ## private in-memory copy: this store gets modified, query workers mmap theirs
+        self.vs = (load_store(self.index_dir, self.emb, mmap=False, locked=True)
+                   if self._exists() else None)
+
+    def _target_factory(self, n_vectors: int) -> str:
+        return effective_factory(self.settings["index_factory"], n_vectors,
+                                 self.settings["min_train_vectors"])
+
+    def _rebuild(self, factory: str, drop_ids: Optional[List[str]] = None):
+        current = self._meta["index_factory"]
+        self.vs = rebuild_store(self.vs, factory, current, self.emb, drop_ids=drop_ids)
+        self._meta["index_factory"] = factory
+        self.log.info("FAISS index rebuilt", index_dir=str(self.index_dir), from_factory=current,
+                      to_factory=factory, vectors=self.vs.index.ntotal)
+
+    def _exists(self) -> bool:
+        return (self.index_dir / "index.faiss").exists() and (self.index_dir / "index.pkl").exists()
+
     @staticmethod
-    def _fingerprint():
-        pass
+    def source_id(md: Dict[str, Any]) -> str:
+        '''File name the chunk was taken from'''
+        src = md.get("source_id") or md.get("source") or md.get("file_path") or ""
+        return os.path.basename(str(src))
+
+    @staticmethod
+    def fingerprint(text: str, md: Dict[str, Any]) -> str:
+        '''Stable chunk id: hash of the source identity and the chunk content'''
+        key = f"{FaissManager.source_id(md)}\x00{text}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
     
     def _save_meta(self):
-        pass
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.meta_path)
+
+    def is_source_current(self, source_id: str, source_hash: str,
+                          chunk_config: Optional[Dict[str, Any]] = None) -> bool:
+        '''True if this exact source content was already indexed with the same chunking'''
+        entry = self._meta["sources"].get(source_id)
+        if not entry or entry.get("sha256") != source_hash:
+            return False
+        return chunk_config is None or entry.get("chunk_config") == chunk_config
+
+    def _plan_add(self, docs: List[Document], source_hashes: Optional[Dict[str, str]],
+                  chunk_config: Optional[Dict[str, Any]]
+                  ) -> Tuple[List[Document], List[str], List[str], int]:
+        '''Update the in-memory manifest for docs.
+        Returns (unseen chunks, their ids, stale ids of re-ingested sources, number of
+        chunks seen).
+        '''
+        source_hashes = source_hashes or {}
+        new_docs: List[Document] = []
+        new_ids: List[str] = []
+        seen_by_source: Dict[str, List[str]] = {}
+
+        for d in docs:
+            md = d.metadata or {}
+            sid = self.source_id(md)
+            fp = self.fingerprint(d.page_content, md)
+            fps = seen_by_source.setdefault(sid, [])
+            if fp in fps:
+                continue
+            fps.append(fp)
+            if fp in self._meta["rows"]:
+                continue
+            new_docs.append(d)
+            new_ids.append(fp)
+            self._meta["rows"][fp] = {
+                "source": sid,
+                "source_hash": source_hashes.get(sid),
+                "page": md.get("page"),
+                "start_index": md.get("start_index"),
+                "length": len(d.page_content),
+            }
+
+        ## chunks a re-ingested source no longer produces are stale
+        stale: List[str] = []
+        for sid, fps in seen_by_source.items():
+            previous = self._meta["sources"].get(sid, {}).get("chunks", [])
+            keep = set(fps)
+            stale.extend(fp for fp in previous if fp not in keep)
+            self._meta["sources"][sid] = {
+                "sha256": source_hashes.get(sid),
+                "chunk_config": chunk_config,
+                "chunks": fps,
+            }
+
+        return new_docs, new_ids, stale, sum(len(v) for v in seen_by_source.values())
+
+    def _commit_add(self, new_docs: List[Document], new_ids: List[str],
+                    vectors: List[List[float]], stale: List[str]):
+        '''Apply a planned update with already computed vectors and write index + manifest.
+        Call under index_lock(exclusive=True), with the state loaded by _reload.
+        '''
+        if stale and self.vs is not None:
+            present = set(self.vs.index_to_docstore_id.values())
+            to_delete = [fp for fp in stale if fp in present]
+            if to_delete and supports_remove(self._meta["index_factory"]):
+                self.vs.delete(ids=to_delete)
+            elif to_delete:
+                self._rebuild(self._meta["index_factory"], drop_ids=to_delete)
+            for fp in stale:
+                self._meta["rows"].pop(fp, None)
+
+        if new_docs:
+            texts = [d.page_content for d in new_docs]
+            metadatas = [d.metadata for d in new_docs]
+            if self.vs is None:
+                factory = self._target_factory(len(new_docs))
+                self.vs = new_store(factory, self.emb, texts, vectors, metadatas, new_ids)
+                self._meta["index_factory"] = factory
+            else:
+                self.vs.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=new_ids)
+
+        ## train the configured index type once the corpus is large enough
+        if self.vs is not None:
+            target = self._target_factory(self.vs.index.ntotal)
+            if target != self._meta["index_factory"]:
+                self._rebuild(target)
+
+        if new_docs or stale:
+            self._write()
+        else:
+            self._save_meta()
+
+    def _build_bm25(self) -> BM25Index:
+        '''Lexical index over the same chunks (docstore ids) as the FAISS index'''
+        ids = list(self.vs.index_to_docstore_id.values())
+        return BM25Index.build((doc_id, self.vs.docstore.search(doc_id).page_content)
+                               for doc_id in ids)
     
-    def add_document(self):
-        pass
+    def _write(self):
+        '''Atomically replace index files and manifest; call under index_lock(exclusive=True)'''
+        with span("ingestion", "index_write"):
+            bm25 = self._build_bm25()
+            ## BM25 first: readers that see the new index.faiss also see its BM25 index
+            bm25.save(self.index_dir)
+            save_store(self.vs, self.index_dir)
+            self._save_meta()
+
+    def _apply(self, docs: List[Document], source_hashes: Optional[Dict[str, str]],
+               chunk_config: Optional[Dict[str, Any]],
+               known_vectors: Dict[str, Any]) -> Tuple[int, int, int, int]:
+        '''Re-plan against the index on disk and write it, all under the exclusive write lock, so
+        concurrent writers to one index are serialized and none drops the chunks of another.
+        Chunks only found to be missing now (removed by another writer) are embedded here.
+        Returns (chunks added, chunks embedded here, chunks removed, chunks seen).
+        '''
+        with index_lock(self.index_dir, exclusive=True):
+            self._reload()
+            new_docs, new_ids, stale, seen = self._plan_add(docs, source_hashes, chunk_config)
+            ids, batches = self._to_embed(new_docs, new_ids, known_vectors)
+            if ids:
+                known_vectors.update(zip(ids, (v for texts in batches
+                                               for v in self.emb.embed_documents(texts))))
+            self._commit_add(new_docs, new_ids, [known_vectors[fp] for fp in new_ids], stale)
+        ## queries holding the old store in memory must reload it (other workers notice the
+        ## new file)
+        get_vectorstore_cache().invalidate(str(self.index_dir))
+        return len(new_docs), len(ids), len(stale), seen
+
+    def _to_embed(self, new_docs: List[Document], new_ids: List[str],
+                  known_vectors: Dict[str, Any]) -> Tuple[List[str], List[List[str]]]:
+        '''Ids of the unseen chunks that have no precomputed vector, and their texts in
+        embedding requests'''
+        pending = [(fp, d) for d, fp in zip(new_docs, new_ids) if fp not in known_vectors]
+        batches = iter_batches((d for _, d in pending), self.embed_batch_size,
+                               self.embed_batch_tokens)
+        return [fp for fp, _ in pending], [[d.page_content for d in batch] for batch in batches]
+
+    def add_documents(self, docs: List[Document], source_hashes: Optional[Dict[str, str]] = None,
+                      chunk_config: Optional[Dict[str, Any]] = None,
+                      known_vectors: Optional[Dict[str, Any]] = None) -> int:
+        '''Embed and insert only unseen chunks; chunks dropped from a re-ingested source are
+        removed. known_vectors (chunk id -> vector) are used instead of embedding and receive
+        the new vectors.
+        Returns the number of chunks embedded.
+        '''
+        try:
+            known_vectors = {} if known_vectors is None else known_vectors
+            ## embedding runs without the lock, against the manifest as loaded; _apply re-plans
+            ## under it
+            new_docs, new_ids, _, _ = self._plan_add(docs, source_hashes, chunk_config)
+            ids, batches = self._to_embed(new_docs, new_ids, known_vectors)
+            with span("ingestion", "embed"):
+                known_vectors.update(zip(ids, (v for texts in batches
+                                               for v in self.emb.embed_documents(texts))))
+            added, late, removed, seen = self._apply(docs, source_hashes, chunk_config,
+                                                     known_vectors)
+
+            self.log.info("FAISS index updated incrementally", added=added,
+                          embedded=len(ids) + late,
+                          requests=len(batches), removed=removed, skipped=seen - added,
+                          index_dir=str(self.index_dir))
+            return len(ids) + late
+
+        except Exception as e:
+            self.log.error("Failed to add documents to FAISS index", error=str(e))
+            raise DocumentPortalException("Failed to add documents to FAISS index", sys)
+
+    async def _aembed(self, batches: List[List[str]],
+                      progress: Optional[ProgressFn]) -> List[List[float]]:
+        ## one request per batch; a job reports progress and can be cancelled between them
+        vectors: List[List[float]] = []
+        total = sum(len(texts) for texts in batches)
+        if progress is not None:
+            await run_blocking(progress, "embedding", chunks_embedded=0, chunks_total=total)
+        for texts in batches:
+            vectors.extend(await self.emb.aembed_documents(texts))
+            if progress is not None:
+                await run_blocking(progress, "embedding", chunks_embedded=len(vectors),
+                                   chunks_total=total)
+        return vectors
+
+    async def aadd_documents(self, docs: List[Document],
+                             source_hashes: Optional[Dict[str, str]] = None,
+                             chunk_config: Optional[Dict[str, Any]] = None,
+                             progress: Optional[ProgressFn] = None,
+                             known_vectors: Optional[Dict[str, Any]] = None) -> int:
+        '''Async add_documents: embeddings are awaited, the FAISS write runs on the bounded pool'''
+        try:
+            known_vectors = {} if known_vectors is None else known_vectors
+            new_docs, new_ids, _, _ = self._plan_add(docs, source_hashes, chunk_config)
+            ids, batches = self._to_embed(new_docs, new_ids, known_vectors)
+            with span("ingestion", "embed"):
+                known_vectors.update(zip(ids, await self._aembed(batches, progress)))
+            if progress is not None:
+                ## last cancel checkpoint: nothing is written yet
+                await run_blocking(progress, "writing")
+            added, late, removed, seen = await run_blocking(self._apply, docs, source_hashes,
+                                                            chunk_config, known_vectors)
+            if progress is not None:
+                await run_blocking(progress, "written", vectors_written=added,
+                                   vectors_removed=removed)
+
+            self.log.info("FAISS index updated incrementally", added=added,
+                          embedded=len(ids) + late,
+                          requests=len(batches), removed=removed, skipped=seen - added,
+                          index_dir=str(self.index_dir))
+            return len(ids) + late
+
+        except JobCancelled:
+            raise
+        except Exception as e:
+            self.log.error("Failed to add documents to FAISS index", error=str(e))
+            raise DocumentPortalException("Failed to add documents to FAISS index", sys)
     
-    def load_or_create(self):
-        pass
+    def load_or_create(self, texts: Optional[List[str]] = None,
+                       metadatas: Optional[List[dict]] = None) -> Optional[FAISS]:
+        '''Load the index from disk, or create it from texts. Returns None if neither is
+        possible.'''
+        if self._exists():
+            ## private in-memory copy: this store gets modified, query workers mmap theirs
+            self.vs = load_store(self.index_dir, self.emb, mmap=False)
+            ## index_factory changed in config since this index was written
+            target = self._target_factory(self.vs.index.ntotal)
+            if target != self._meta["index_factory"]:
+                with index_lock(self.index_dir, exclusive=True):
+                    self._reload()
+                    if self.vs is not None:
+                        target = self._target_factory(self.vs.index.ntotal)
+                    if self.vs is not None and target != self._meta["index_factory"]:
+                        self._rebuild(target)
+                        self._write()
+                get_vectorstore_cache().invalidate(str(self.index_dir))
+            elif not (self.index_dir / BM25_FILE).exists():
+                ## index written before lexical search existed
+                bm25 = self._build_bm25()
+                with index_lock(self.index_dir, exclusive=True):
+                    bm25.save(self.index_dir)
+            self.log.info("FAISS index loaded", index_dir=str(self.index_dir),
+                          rows=len(self._meta["rows"]),
+                          index_factory=self._meta["index_factory"])
+            return self.vs
+        if texts:
+            metadatas = metadatas or [{} for _ in texts]
+            self.add_documents([Document(page_content=t, metadata=m)
+                                for t, m in zip(texts, metadatas)])
+        return self.vs
             
 
 class DocumentHandler:
-    def __init__(self):
-        pass
+    """Save and read PDFs for analysis, one directory per session."""
     
-    def save_pdf(self):
-        pass
+    def __init__(self, data_dir: Optional[str] = None, session_id: Optional[str] = None):
+        try:
+            self.log = CustomLogger().get_logger(__name__)
+            self.data_dir = data_dir or os.getenv(
+                "DATA_STORAGE_PATH", os.path.join(os.getcwd(), "data", "document_analysis"))
+            self.session_id = (validate_session_id(session_id) if session_id
+                               else new_session_id("session"))
+            self.session_path = os.path.join(self.data_dir, self.session_id)
+            os.makedirs(self.session_path, exist_ok=True)
+            self.log.info("DocumentHandler initialized", session_id=self.session_id,
+                          session_path=self.session_path)
+        except Exception as e:
+            self.log.error("Failed to initialize DocumentHandler", error=str(e))
+            raise DocumentPortalException("Initialization error in DocumentHandler", sys)
     
-    def read_pdf(self):
-        pass
+    def save_pdf_with_hash(self, uploaded_file) -> SavedFile:
+        '''Stream the upload to disk in chunks, computing its SHA-256 in the same pass'''
+        try:
+            filename = os.path.basename(uploaded_file.name)
+            if not filename.lower().endswith(".pdf"):
+                raise ValueError("Invalid file type. Only PDFs are allowed.")
+            _check_quota(self.session_id, [uploaded_file])
+            saved = save_upload(uploaded_file, Path(self.session_path) / filename)
+            _share_files([saved])
+            _record_write(ANALYSIS, self.session_id, self.session_path)
+            self.log.info("PDF saved successfully", file=filename, save_path=str(saved.path),
+                          size=saved.size, sha256=saved.sha256, session_id=self.session_id)
+            return saved
+        except UploadTooLargeError:
+            raise
+        except Exception as e:
+            self.log.error("Failed to save PDF", error=str(e))
+            raise DocumentPortalException("Failed to save PDF", sys)
+
+    def save_pdf(self, uploaded_file) -> str:
+        '''Save an upload and return its path'''
+        return str(self.save_pdf_with_hash(uploaded_file).path)
+
+    def read_pdf(self, pdf_path: str, file_hash: Optional[str] = None) -> str:
+        '''Text of every page, with page separators'''
+        try:
+            ## pages are streamed (pooled for large files, cached by content hash)
+            with span("ingestion", "parse"):
+                pages = extract_pdf_pages(pdf_path, file_hash=file_hash)
+                text_chunks = [f"\n--- Page {page.number} ---\n{page.text}" for page in pages]
+            text = "\n".join(text_chunks)
+            self.log.info("PDF read successfully", pdf_path=pdf_path, pages=len(text_chunks))
+            return text
+        except Exception as e:
+            self.log.error("Failed to read PDF", error=str(e), pdf_path=pdf_path)
+            raise DocumentPortalException("Failed to read PDF", sys)
+
+    async def asave_pdf(self, uploaded_file) -> str:
+        '''save_pdf off the event loop'''
+        return await run_blocking(self.save_pdf, uploaded_file)
+
+    async def asave_pdf_with_hash(self, uploaded_file) -> SavedFile:
+        '''save_pdf_with_hash off the event loop'''
+        return await run_blocking(self.save_pdf_with_hash, uploaded_file)
+
+    async def aread_pdf(self, pdf_path: str, file_hash: Optional[str] = None) -> str:
+        '''read_pdf off the event loop'''
+        return await run_blocking(self.read_pdf, pdf_path, file_hash)
 
 class DocumentComparator:
-    def __init__(self):
-        pass
+    """Save a reference/actual PDF pair per session and combine their text for comparison."""
+
+    def __init__(self, base_dir: str = "data/document_compare", session_id: Optional[str] = None):
+        self.log = CustomLogger().get_logger(__name__)
+        self.base_dir = Path(base_dir)
+        self.session_id = validate_session_id(session_id) if session_id else new_session_id()
+        self.session_path = self.base_dir / self.session_id
+        self.session_path.mkdir(parents=True, exist_ok=True)
+        self.log.info("DocumentComparator initialized", session_path=str(self.session_path))
+
+    def save_uploads(self, reference_file, actual_file) -> Tuple[SavedFile, SavedFile]:
+        '''Stream both uploads to disk in chunks, hashing them in the same pass'''
+        try:
+            for fobj in (reference_file, actual_file):
+                if not fobj.name.lower().endswith(".pdf"):
+                    raise ValueError("Only PDF files are allowed.")
+            _check_quota(self.session_id, [reference_file, actual_file])
+            ref = save_upload(reference_file,
+                              self.session_path / os.path.basename(reference_file.name))
+            act = save_upload(actual_file, self.session_path / os.path.basename(actual_file.name))
+            _share_files([ref, act])
+            _record_write(COMPARE, self.session_id, self.session_path)
+            self.log.info("Files saved", reference=str(ref.path), actual=str(act.path),
+                          reference_sha256=ref.sha256, actual_sha256=act.sha256,
+                          session=self.session_id)
+            return ref, act
+        except UploadTooLargeError:
+            raise
+        except Exception as e:
+            self.log.error("Error saving PDF files", error=str(e), session=self.session_id)
+            raise DocumentPortalException("Error saving files", sys)
     
-    def save_uploaded_files(self):
-        pass
+    def save_uploaded_files(self, reference_file, actual_file) -> Tuple[Path, Path]:
+        '''Save both uploads and return their paths'''
+        ref, act = self.save_uploads(reference_file, actual_file)
+        return ref.path, act.path
     
-    def read_pdf(self):
-        pass
+    def read_pdf_pages(self, pdf_path: Path, file_hash: Optional[str] = None) -> List[str]:
+        '''Text of every page (empty pages included, so page numbers stay aligned)'''
+        try:
+            with span("ingestion", "parse"):
+                pages = [page.text for page in extract_pdf_pages(str(pdf_path),
+                                                                 file_hash=file_hash)]
+            self.log.info("PDF pages read successfully", file=str(pdf_path), pages=len(pages))
+            return pages
+        except Exception as e:
+            self.log.error("Error reading PDF", file=str(pdf_path), error=str(e))
+            raise DocumentPortalException("Error reading PDF", sys)
     
-    def combine_documents(self):
-        pass
+    def read_pdf(self, pdf_path: Path) -> str:
+        '''Text of the non-empty pages, with page separators'''
+        pages = self.read_pdf_pages(pdf_path)
+        parts = [f"\n --- Page {page_num} --- \n{text}"
+                 for page_num, text in enumerate(pages, start=1) if text.strip()]
+        return "\n".join(parts)
     
-    def clean_old_sessions(self):
-        pass
+    def combine_documents(self) -> str:
+        '''Text of every PDF of the session, one section per file'''
+        try:
+            doc_parts = []
+            for file in sorted(self.session_path.iterdir()):
+                if file.is_file() and file.suffix.lower() == ".pdf":
+                    content = self.read_pdf(file)
+                    doc_parts.append(f"Document: {file.name}\n{content}")
+            combined_text = "\n\n".join(doc_parts)
+            self.log.info("Documents combined", count=len(doc_parts), session=self.session_id)
+            return combined_text
+        except Exception as e:
+            self.log.error("Error combining documents", error=str(e), session=self.session_id)
+            raise DocumentPortalException("Error combining documents", sys)
+
+    async def asave_uploaded_files(self, reference_file, actual_file) -> Tuple[Path, Path]:
+        '''save_uploaded_files off the event loop'''
+        return await run_blocking(self.save_uploaded_files, reference_file, actual_file)
+
+    async def asave_uploads(self, reference_file, actual_file) -> Tuple[SavedFile, SavedFile]:
+        '''save_uploads off the event loop'''
+        return await run_blocking(self.save_uploads, reference_file, actual_file)
+
+    async def acombine_documents(self) -> str:
+        '''combine_documents off the event loop'''
+        return await run_blocking(self.combine_documents)
+
+    async def aread_pdf_pages(self, pdf_path: Path, file_hash: Optional[str] = None) -> List[str]:
+        '''read_pdf_pages off the event loop'''
+        return await run_blocking(self.read_pdf_pages, pdf_path, file_hash)
+
+    def clean_old_sessions(self) -> Dict[str, Any]:
+        '''Evict expired and least recently used sessions now (the API also sweeps in the
+        background)'''
+        storage = get_storage_manager()
+        return storage.sweep() if storage is not None else {}
 
 class ChatIngestor:
-    def __init__(self):
-        pass
+    def __init__(self, temp_base: str = "data", faiss_base: str = "faiss_index",
+                 use_session_dirs: bool = True, session_id: Optional[str] = None):
+        try:
+            self.log = CustomLogger().get_logger(__name__)
+            self.model_loader = get_model_loader()
+
+            self.use_session = use_session_dirs
+            self.session_id = session_id or new_session_id()
+
+            self.temp_base = Path(temp_base)
+            self.temp_base.mkdir(parents=True, exist_ok=True)
+            self.faiss_base = Path(faiss_base)
+            self.faiss_base.mkdir(parents=True, exist_ok=True)
+
+            self.temp_dir = self._resolve_dir(self.temp_base)
+            self.faiss_dir = self._resolve_dir(self.faiss_base)
+
+            self.log.info("ChatIngestor initialized", session_id=self.session_id,
+                          temp_dir=str(self.temp_dir), faiss_dir=str(self.faiss_dir))
+        except Exception as e:
+            self.log.error("Failed to initialize ChatIngestor", error=str(e))
+            raise DocumentPortalException("Initialization error in ChatIngestor", sys)
+
+    def _resolve_dir(self, base: Path) -> Path:
+        if self.use_session:
+            d = base / validate_session_id(self.session_id)
+            d.mkdir(parents=True, exist_ok=True)
+            return d
+        return base
+
+    def _record_index(self):
+        ## only per-session indexes are tracked (and evictable), never the shared base index
+        if self.use_session:
+            _record_write(FAISS_KIND, self.session_id, self.faiss_dir)
+
+    def _split(self, docs: Iterable[Document], chunk_config: Dict[str, Any]) -> List[Document]:
+        '''Split pages into chunks, consuming docs as they are loaded.
+        start_index gives every chunk its offset in the source page.
+        '''
+        chunk_size, chunk_overlap = chunk_config["chunk_size"], chunk_config["chunk_overlap"]
+        if chunk_config.get("unit") == "tokens":
+            chunker = TokenChunker(chunk_size, chunk_overlap,
+                                   chunking_settings().get("encoding", "o200k_base"))
+            chunks = list(chunker.split_documents(docs))
+            observe_stage("ingestion", "split", chunker.seconds)
+        else:
+            docs = list(docs)
+            splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size,
+                                                      chunk_overlap=chunk_overlap,
+                                                      add_start_index=True)
+            with span("ingestion", "split"):
+                chunks = splitter.split_documents(docs)
+        self.log.info("Documents split", chunks=len(chunks), **chunk_config)
+        return chunks
+
+    def save_uploads(self, uploaded_files: Iterable, isolated: bool = False) -> List[SavedFile]:
+        '''Stream uploads into the session temp dir, hashed in the same pass.
+        isolated: write into a fresh sub directory, so a queued job never reads a later upload
+        of the same name.
+        '''
+        target = self.temp_dir / new_session_id("upload") if isolated else self.temp_dir
+        if not self.use_session:
+            saved = save_uploaded_file(uploaded_files, target)
+            _share_files(saved)
+            return saved
+        uploaded_files = list(uploaded_files)
+        _check_quota(self.session_id, uploaded_files)
+        saved = save_uploaded_file(uploaded_files, target)
+        _share_files(saved)
+        _record_write(CHAT_UPLOADS, self.session_id, self.temp_dir)
+        return saved
+
+    async def asave_uploads(self, uploaded_files: Iterable,
+                            isolated: bool = False) -> List[SavedFile]:
+        '''save_uploads off the event loop'''
+        return await run_blocking(self.save_uploads, uploaded_files, isolated)
     
-    def _resolve_dir(self):
-        pass
+    def _prepare(self, saved: List[SavedFile], chunk_size: Optional[int],
+                 chunk_overlap: Optional[int],
+                 progress: Optional[ProgressFn] = None):
+        '''Parse and split every saved file that needs (re)indexing; no embedding calls'''
+        paths = [s.path for s in saved]
+
+        fm = FaissManager(self.faiss_dir, self.model_loader)
+        fm.load_or_create()
+
+        ## unchanged sources (same content hash and chunking) are skipped before parsing
+        chunk_config = resolve_chunk_config(chunk_size, chunk_overlap)
+        ## hashes were computed while the uploads streamed to disk
+        source_hashes = {s.path.name: s.sha256 for s in saved}
+        changed = [p for p in paths
+                   if not fm.is_source_current(p.name, source_hashes[p.name], chunk_config)]
+
+            ## documents seen in any session before: their chunks and vectors come from the blob
+            ## store
+        chunks: List[Document] = []
+        known_vectors: Dict[str, Any] = {}
+        to_parse = changed
+        blobs = get_blob_store()
+        if blobs is not None and changed:
+            to_parse = []
+            with span("ingestion", "reuse"):
+                for p in changed:
+                    entry = blobs.get_chunks(source_hashes[p.name],
+                                             self.model_loader.embedding_key(), chunk_config, p)
+                    if entry is None:
+                        to_parse.append(p)
+                        continue
+                    for d, vector in zip(*entry):
+                        known_vectors[FaissManager.fingerprint(d.page_content, d.metadata)] = vector
+                    chunks.extend(entry[0])
+            record_cache("chunk_store", hits=len(changed) - len(to_parse), misses=len(to_parse))
+
+        if to_parse:
+            ## one broken file does not fail the others (it is reported as files_failed)
+            report = LoadReport()
+            pages = [0]
+
+            def _counted(docs: Iterable[Document]) -> Iterable[Document]:
+                files = 0
+                for d in docs:
+                    pages[0] += 1
+                    ## a file is recorded in the report once the loader moves on to the next one
+                    if progress is not None and report.loaded + len(report.failed) != files:
+                        files = report.loaded + len(report.failed)
+                        progress("parsing", files_parsed=report.loaded,
+                                 files_failed=len(report.failed), pages_parsed=pages[0])
+                    yield d
+
+            ## pages are split while later ones are still being extracted: parse includes the
+            ## split
+            with span("ingestion", "parse"):
+                file_hashes = {str(p): source_hashes[p.name] for p in to_parse}
+                docs = iter_documents(to_parse, file_hashes=file_hashes, report=report)
+                new_chunks = self._split(_counted(docs), chunk_config)
+            if report.failed and not report.loaded:
+                error = next(iter(report.failed.values()))
+                raise DocumentPortalException(f"Error loading documents: {error}", sys)
+            if report.failed:
+                ## pages a file yielded before failing would index it truncated, and recording its
+                ## hash would skip every re-upload: drop them and leave the source as it was
+                failed = {Path(f).name for f in report.failed}
+                new_chunks = [c for c in new_chunks
+                              if FaissManager.source_id(c.metadata) not in failed]
+                source_hashes = {name: sha for name, sha in source_hashes.items()
+                                 if name not in failed}
+                self.log.warning("Chunks of failed files dropped", session_id=self.session_id,
+                                 files=sorted(failed))
+            if not pages[0]:
+                raise ValueError("No valid documents loaded")
+            if progress is not None:
+                progress("parsed", files_parsed=report.loaded, files_failed=len(report.failed),
+                         files_reused=len(changed) - len(to_parse),
+                         files_skipped=len(paths) - len(changed), pages_parsed=pages[0])
+            chunks.extend(new_chunks)
+            if progress is not None:
+                progress("split", chunks=len(chunks))
+        elif changed:
+            self.log.info("All sources reused from the blob store, nothing to parse or embed",
+                          session_id=self.session_id, files=len(changed), chunks=len(chunks))
+        else:
+            self.log.info("All sources already indexed, nothing to embed",
+                          session_id=self.session_id)
+        return fm, chunks, source_hashes, chunk_config, known_vectors
     
-    def _split(self):
-        pass
+    def _store_chunks(self, chunks: List[Document], source_hashes: Dict[str, str],
+                      chunk_config: Dict[str, Any], vectors: Dict[str, Any]):
+        '''Publish the chunks and vectors of newly indexed files for reuse by other sessions'''
+        blobs = get_blob_store()
+        if blobs is None or not chunks:
+            return
+        key = self.model_loader.embedding_key()
+        by_source: Dict[str, Dict[str, Document]] = {}
+        for d in chunks:
+            by_source.setdefault(FaissManager.source_id(d.metadata), {}).setdefault(
+                FaissManager.fingerprint(d.page_content, d.metadata), d)
+        for sid, docs in by_source.items():
+            sha = source_hashes.get(sid)
+            ## chunks already in this index were not embedded again: no complete entry to publish
+            if (sha is None or not all(fp in vectors for fp in docs)
+                    or blobs.has_chunks(sha, key, chunk_config)):
+                continue
+            try:
+                blobs.put_chunks(sha, key, chunk_config, list(docs.values()),
+                                 [vectors[fp] for fp in docs])
+            except Exception as e:
+                self.log.warning("Chunks not stored in the blob store", source=sid, error=str(e))
+
+    def built_retriever(self, uploaded_files: Iterable, *, chunk_size: Optional[int] = None,
+                        chunk_overlap: Optional[int] = None, k: int = 5):
+        '''chunk_size/chunk_overlap are in the configured chunking unit (tokens by default),
+        None for its defaults'''
+        try:
+            saved = self.save_uploads(uploaded_files)
+            fm, chunks, source_hashes, chunk_config, known_vectors = self._prepare(
+                saved, chunk_size, chunk_overlap)
+            if chunks:
+                fm.add_documents(chunks, source_hashes=source_hashes, chunk_config=chunk_config,
+                                 known_vectors=known_vectors)
+                self._store_chunks(chunks, source_hashes, chunk_config, known_vectors)
+                self._record_index()
+
+            if fm.vs is None:
+                raise ValueError("No valid documents loaded")
+
+            apply_search_params(fm.vs, search_params())
+            return build_retriever(fm.vs, fm.index_dir, k=k)
+
+        except UploadTooLargeError:
+            raise
+        except Exception as e:
+            self.log.error("Failed to build retriever", error=str(e))
+            raise DocumentPortalException("Failed to build retriever", sys)
+
+    async def abuilt_retriever(self, uploaded_files: Iterable, *,
+                               chunk_size: Optional[int] = None,
+                               chunk_overlap: Optional[int] = None, k: int = 5):
+        '''Async built_retriever: file I/O, parsing and splitting run on the bounded pool,
+        embeddings are awaited'''
+        try:
+            saved = await self.asave_uploads(uploaded_files)
+            fm = await self.aindex_saved(saved, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+            apply_search_params(fm.vs, search_params())
+            return build_retriever(fm.vs, fm.index_dir, k=k)
+
+        except UploadTooLargeError:
+            raise
+        except Exception as e:
+            self.log.error("Failed to build retriever", error=str(e))
+            raise DocumentPortalException("Failed to build retriever", sys)
     
-    def built_retriever(self):
-        pass
\ No newline at end of file
+    async def aindex_saved(self, saved: List[SavedFile], *, chunk_size: Optional[int] = None,
+                           chunk_overlap: Optional[int] = None,
+                           progress: Optional[ProgressFn] = None) -> FaissManager:
+        '''Index already saved files (parse, split, embed, write); used directly by background
+        jobs. progress is called after every stage and embedding batch, and may raise to abort
+        before the write.
+        '''
+        fm, chunks, source_hashes, chunk_config, known_vectors = await run_blocking(
+            self._prepare, saved, chunk_size, chunk_overlap, progress)
+        if chunks:
+            await fm.aadd_documents(chunks, source_hashes=source_hashes, chunk_config=chunk_config,
+                                    progress=progress, known_vectors=known_vectors)
+            await run_blocking(self._store_chunks, chunks, source_hashes, chunk_config,
+                               known_vectors)
+            await run_blocking(self._record_index)
+
+        if fm.vs is None:
+            raise ValueError("No valid documents loaded")
+        return fm
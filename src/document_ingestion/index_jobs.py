@@ -0,0 +1,138 @@
+import sys
+import asyncio
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+from utils.concurrency import run_blocking
+from utils.file_io import SavedFile
+from utils.job_store import JobStore, JobCancelled, get_job_store, DONE, FAILED, CANCELLED, FINISHED
+from src.document_ingestion.data_ingestion import ChatIngestor, POST_WRITE_STAGES
+
+
+class IndexJobQueue:
+    """Background /chat/index jobs: uploads are saved by the request, everything else
+    (parse, split, embed, FAISS write) runs in a pool of async workers.
+
+    Jobs live in the shared SQLite JobStore, so every uvicorn worker process contributes
+    its pool and any worker can report status. Jobs of the same FAISS directory are
+    serialized by the store's claim; different sessions index in parallel. A running job
+    is heartbeated every heartbeat_s, so only jobs of a dead worker are claimed again.
+    """
+    KIND = "chat_index"
+
+    def __init__(self, store: Optional[JobStore] = None):
+        self.log = CustomLogger().get_logger(__name__)
+        self.store = store or get_job_store()
+        cfg = load_config().get("chat_index_jobs") or {}
+        self.workers = max(1, int(cfg.get("workers", 2)))
+        self.poll_interval_s = float(cfg.get("poll_interval_s", 0.5))
+        self.stale_after_s = float(cfg.get("stale_after_s", 900))
+        self.heartbeat_s = float(cfg.get("heartbeat_s", 30))
+        self._tasks: List[asyncio.Task] = []
+
+    def enqueue(self, ingestor: ChatIngestor, saved: List[SavedFile], *, chunk_size: Optional[int],
+                chunk_overlap: Optional[int]) -> str:
+        '''Record an index job for the saved files and return its id'''
+        try:
+            payload = {
+                "session_id": ingestor.session_id,
+                "temp_base": str(ingestor.temp_base),
+                "faiss_base": str(ingestor.faiss_base),
+                "use_session_dirs": ingestor.use_session,
+                "files": [{"path": str(s.path), "sha256": s.sha256, "size": s.size} for s in saved],
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+            }
+            ## one FAISS directory, one writer at a time
+            return self.store.enqueue(self.KIND, payload, total=len(saved),
+                                      session_key=str(ingestor.faiss_dir.resolve()))
+        except Exception as e:
+            self.log.error("Failed to queue indexing job", error=str(e))
+            raise DocumentPortalException("Failed to queue indexing job", sys)
+
+    def _progress_fn(self, job_id: str):
+        def progress(stage: str, **counters: Any):
+            ## a cancel that arrives after the index write is ignored: the job completes
+            if stage not in POST_WRITE_STAGES and self.store.is_cancel_requested(job_id):
+                raise JobCancelled(job_id)
+            self.store.set_progress(job_id, stage=stage, **counters)
+        return progress
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.heartbeat_s)
+            try:
+                await run_blocking(self.store.heartbeat, job_id)
+            except Exception as e:
+                self.log.warning("Indexing job heartbeat failed", job_id=job_id, error=str(e))
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id, payload = job["job_id"], job["payload"]
+        ## long parses and waits for the index lock make no progress updates: keep the claim alive
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            ingestor = ChatIngestor(
+                temp_base=payload["temp_base"],
+                faiss_base=payload["faiss_base"],
+                use_session_dirs=payload["use_session_dirs"],
+                session_id=payload["session_id"],
+            )
+            saved = [SavedFile(path=Path(f["path"]), sha256=f["sha256"], size=f["size"])
+                     for f in payload["files"]]
+            await ingestor.aindex_saved(saved, chunk_size=payload.get("chunk_size"),
+                                        chunk_overlap=payload.get("chunk_overlap"),
+                                        progress=self._progress_fn(job_id))
+            await run_blocking(self.store.set_status, job_id, DONE)
+            self.log.info("Indexing job finished", job_id=job_id, session_id=payload["session_id"])
+        except JobCancelled:
+            await run_blocking(self.store.set_status, job_id, CANCELLED)
+            self.log.info("Indexing job cancelled", job_id=job_id, session_id=payload["session_id"])
+        except Exception as e:
+            self.log.error("Indexing job failed", job_id=job_id, error=str(e))
+            await run_blocking(self.store.set_status, job_id, FAILED, str(e))
+        finally:
+            heartbeat.cancel()
+
+    async def wait(self, job_id: str) -> Optional[Dict[str, Any]]:
+        '''Poll the store until the job is done, failed or cancelled;
+        its final state (None if unknown)'''
+        while True:
+            job = await run_blocking(self.store.get, job_id)
+            if job is None or job["status"] in FINISHED:
+                return job
+            await asyncio.sleep(self.poll_interval_s)
+
+    async def _worker(self, n: int):
+        while True:
+            try:
+                job = await run_blocking(self.store.claim, self.KIND, self.stale_after_s)
+            except Exception as e:
+                self.log.error("Failed to claim indexing job", worker=n, error=str(e))
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval_s)
+                continue
+            await self._run(job)
+
+    def start(self):
+        '''Start the worker pool on the running event loop'''
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+            self.log.info("Indexing workers started", workers=self.workers)
+
+    async def stop(self):
+        '''Cancel the workers'''
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+@lru_cache(maxsize=1)
+def get_index_job_queue() -> IndexJobQueue:
+    '''Shared IndexJobQueue for the process'''
+    return IndexJobQueue()
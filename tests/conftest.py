@@ -0,0 +1,25 @@
+## offline test environment: fake LLM/embedder, every store in a throwaway directory
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+WORKDIR = Path(tempfile.mkdtemp(prefix="docportal_tests_"))
+os.environ.update(
+    LLM_PROVIDER="fake",
+    EMBEDDING_PROVIDER="fake",
+    FAISS_BASE=str(WORKDIR / "faiss_index"),
+    UPLOAD_BASE=str(WORKDIR / "data"),
+    DATA_STORAGE_PATH=str(WORKDIR / "data" / "document_analysis"),
+    JOB_STORE_PATH=str(WORKDIR / "cache" / "jobs.sqlite"),
+    CHAT_MEMORY_PATH=str(WORKDIR / "cache" / "chat_memory.sqlite"),
+    RESULT_CACHE_PATH=str(WORKDIR / "cache" / "results.sqlite"),
+    STORAGE_DB_PATH=str(WORKDIR / "cache" / "storage.sqlite"),
+    BLOB_STORE_PATH=str(WORKDIR / "cache" / "blobs"),
+)
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+## relative paths of the config (logs, embedding and page caches) land in the work dir
+os.chdir(WORKDIR)
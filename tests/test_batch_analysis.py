@@ -0,0 +1,67 @@
+import time
+import asyncio
+
+import pytest
+
+from src.document_analyzer.batch_analysis import BATCH_KIND, BatchAnalyzer, fail_orphaned_batches
+from utils.job_store import DONE, FAILED, RUNNING, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def _age(store, job_id, seconds):
+    store.db.execute("UPDATE jobs SET updated=updated-? WHERE id=?", (seconds, job_id))
+    store.db.commit()
+
+
+def test_orphaned_batches_are_failed_at_startup(store):
+    orphan = store.create(BATCH_KIND, total=3)
+    store.set_status(orphan, RUNNING)
+    _age(store, orphan, 3600)
+    live = store.create(BATCH_KIND, total=3)
+    store.set_status(live, RUNNING)
+    finished = store.create(BATCH_KIND, total=1)
+    store.set_status(finished, DONE)
+    _age(store, finished, 3600)
+
+    assert fail_orphaned_batches(store) == 1
+    assert store.get(orphan)["status"] == FAILED and store.get(orphan)["error"]
+    assert store.get(live)["status"] == RUNNING
+    assert store.get(finished)["status"] == DONE
+
+
+def _beat(batch, job_id):
+    async def _run():
+        task = asyncio.create_task(batch._heartbeat(job_id))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(_run())
+
+
+def test_heartbeat_keeps_a_running_batch_fresh(store):
+    job_id = store.create(BATCH_KIND, total=1)
+    store.set_status(job_id, RUNNING)
+    _age(store, job_id, 3600)
+    batch = BatchAnalyzer(analyzer=None, store=store)
+    batch.heartbeat_s = 0.01
+
+    _beat(batch, job_id)
+    assert store.get(job_id)["updated"] > time.time() - 5
+    assert fail_orphaned_batches(store) == 0
+
+
+def test_heartbeat_keeps_a_queued_batch_fresh(store):
+    ## submitted, still waiting for run() to start it
+    job_id = store.create(BATCH_KIND, total=1)
+    _age(store, job_id, 3600)
+    batch = BatchAnalyzer(analyzer=None, store=store)
+    batch.heartbeat_s = 0.01
+
+    _beat(batch, job_id)
+    assert fail_orphaned_batches(store) == 0
+    assert store.get(job_id)["status"] == "queued"
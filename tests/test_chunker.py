@@ -0,0 +1,45 @@
+from langchain_core.documents import Document
+
+from utils.chunker import TokenChunker, iter_batches
+
+TEXT = " ".join(f"Sentence {i} of the agreement covers delivery terms." for i in range(60))
+
+
+def test_chunks_fit_and_overlap():
+    ## sentences are ~14 tokens: one of them fits in the overlap
+    chunker = TokenChunker(chunk_size=40, chunk_overlap=20)
+    chunks = list(chunker.split_text(TEXT, {"source": "a.pdf", "page": 2}))
+    assert len(chunks) > 5
+    for doc in chunks:
+        assert doc.metadata["tokens"] <= 40
+        assert doc.metadata["page"] == 2
+        ## start_index points at the chunk text in the page
+        assert TEXT[doc.metadata["start_index"]:].startswith(doc.page_content)
+    for prev, cur in zip(chunks, chunks[1:]):
+        prev_end = prev.metadata["start_index"] + len(prev.page_content)
+        assert cur.metadata["start_index"] < prev_end, "consecutive chunks share the overlap"
+        assert cur.metadata["start_index"] > prev.metadata["start_index"]
+        assert prev.page_content.endswith(cur.page_content[:prev_end - cur.metadata["start_index"]].strip())
+    assert chunks[-1].page_content.endswith("delivery terms.")
+
+
+def test_overlap_is_only_what_fits():
+    ## a whole sentence is larger than the overlap, so none is repeated
+    chunks = list(TokenChunker(chunk_size=40, chunk_overlap=5).split_text(TEXT))
+    for prev, cur in zip(chunks, chunks[1:]):
+        assert cur.metadata["start_index"] >= prev.metadata["start_index"] + len(prev.page_content)
+
+
+def test_no_overlap_covers_text_once():
+    chunker = TokenChunker(chunk_size=40, chunk_overlap=0)
+    chunks = list(chunker.split_text(TEXT))
+    assert " ".join(c.page_content for c in chunks) == TEXT
+
+
+def test_chunks_never_span_pages_and_batches_respect_limits():
+    pages = [Document(page_content=TEXT, metadata={"page": i}) for i in range(3)]
+    chunks = list(TokenChunker(chunk_size=50, chunk_overlap=5).split_documents(pages))
+    assert {c.metadata["page"] for c in chunks} == {0, 1, 2}
+    for batch in iter_batches(chunks, max_chunks=4, max_tokens=120):
+        assert len(batch) <= 4
+        assert len(batch) == 1 or sum(c.metadata["tokens"] for c in batch) <= 120
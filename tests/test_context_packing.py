@@ -0,0 +1,47 @@
+from langchain_core.documents import Document
+
+from src.document_chat.context_packing import pack_context
+
+PAGE = "The supplier shall deliver the goods within thirty days. Payment is due on receipt of the invoice."
+
+
+def _chunk(start: int, end: int, page: int = 0, source: str = "/data/s/contract.pdf") -> Document:
+    return Document(page_content=PAGE[start:end], metadata={"source": source, "page": page, "start_index": start})
+
+
+def test_overlapping_chunks_are_merged_once():
+    context = pack_context([_chunk(40, len(PAGE)), _chunk(0, 56)], max_tokens=1000)
+    assert context == f"[Source: contract.pdf, page 1]\n{PAGE}"
+
+
+def test_near_duplicates_are_dropped():
+    same = "Termination requires ninety days written notice by either party."
+    docs = [Document(page_content=same, metadata={"source": "/a.pdf", "page": 0}),
+            Document(page_content=same + " ", metadata={"source": "/b.pdf", "page": 3})]
+    context = pack_context(docs, max_tokens=1000)
+    assert context.count("ninety days") == 1 and "a.pdf" in context
+
+
+def test_distinct_passages_of_other_sources_are_kept():
+    long = ("Either party may terminate this agreement. The termination fee is 2 percent of the remaining "
+            "contract value and is waived for terminations after 30 days of notice.")
+    short = "Termination fee: 2 percent waived after 30 days."
+    docs = [Document(page_content=long, metadata={"source": "/a.pdf", "page": 0}),
+            Document(page_content=short, metadata={"source": "/b.pdf", "page": 1})]
+    context = pack_context(docs, max_tokens=1000)
+    assert "[Source: b.pdf, page 2]" in context and short in context
+    ## the same clause repeated within a.pdf is still dropped
+    docs.append(Document(page_content="The termination fee is 2 percent of the remaining contract value.",
+                         metadata={"source": "/a.pdf", "page": 4}))
+    assert "page 5" not in pack_context(docs, max_tokens=1000)
+
+
+def test_budget_keeps_best_passages_in_reading_order():
+    docs = [_chunk(0, 56, page=2), _chunk(0, 56, page=0, source="/other.pdf"), _chunk(0, 56, page=0)]
+    context = pack_context(docs, max_tokens=1000, dedup_threshold=1.01)
+    blocks = context.split("\n\n")
+    ## contract.pdf first (it holds the best ranked chunk), its pages in order, then other.pdf
+    assert [b.split("\n")[0] for b in blocks] == [
+        "[Source: contract.pdf, page 1]", "[Source: contract.pdf, page 3]", "[Source: other.pdf, page 1]"]
+    small = pack_context(docs, max_tokens=20, dedup_threshold=1.01)
+    assert small.count("[Source:") == 1 and "page 3" in small
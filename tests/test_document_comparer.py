@@ -0,0 +1,33 @@
+import json
+
+from src.document_compare.document_comparer import DocumentComparerLLM
+
+
+def test_malformed_rows_are_repaired_or_skipped():
+    comparer = DocumentComparerLLM()
+    response = [
+        {"Page": "2", "changes": "Fee raised from 10 to 12"},
+        {"page": 3, "Changes": ["clause 4 removed", "new annex"]},
+        {"Page": "5"},
+        "not a row",
+    ]
+    rows = comparer._merge_rows([{"Page": "1", "changes": "NO CHANGE"}], [response, {"rows": []}])
+    assert rows == [
+        {"Page": "1", "changes": "NO CHANGE"},
+        {"Page": "2", "changes": "Fee raised from 10 to 12"},
+        {"Page": "3", "changes": "clause 4 removed; new annex"},
+    ]
+    df = comparer._format_response(comparer._valid_rows(response))
+    assert list(df["Page"]) == ["2", "3"]
+
+
+def test_unparseable_page_batch_is_repaired_by_the_llm():
+    comparer = DocumentComparerLLM()
+    replies = iter(["not json", json.dumps([{"Page": "1", "changes": "c changed to d"}])])
+    responder = comparer.llm.responder
+    comparer.llm.responder = lambda prompt: next(replies)
+    try:
+        df = comparer.compare_pages(["a b c", "same page"], ["a b d", "same page"])
+    finally:
+        comparer.llm.responder = responder
+    assert df.to_dict("records") == [{"Page": "1", "changes": "c changed to d"}, {"Page": "2", "changes": "NO CHANGE"}]
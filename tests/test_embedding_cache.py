@@ -0,0 +1,126 @@
+import time
+import asyncio
+import sqlite3
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+from exception.custom_exception import DocumentPortalException
+from utils.embedding_cache import CachedEmbeddings, EmbeddingStore
+from utils.fake_models import DeterministicEmbeddings
+
+DIM = 8
+
+
+def _vector(key: str) -> list:
+    seed = sum(key.encode()) * 7919 + len(key)
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32).tolist()
+
+
+def _writer(store_dir: str, prefix: str, n: int, barrier):
+    store = EmbeddingStore(store_dir, DIM, max_entries=100_000)
+    barrier.wait()
+    for i in range(0, n, 50):
+        store.put_many({f"{prefix}{j}": _vector(f"{prefix}{j}") for j in range(i, min(n, i + 50))})
+    store.close()
+
+
+def test_cached_embeddings_match_underlying(tmp_path):
+    underlying = DeterministicEmbeddings(DIM)
+    cached = CachedEmbeddings(underlying, "fake", str(tmp_path), dimensions=DIM)
+    texts = ["alpha", "beta", "alpha", "gamma"]
+    first = cached.embed_documents(texts)
+    again = cached.embed_documents(texts)
+    assert np.allclose(first, underlying.embed_documents(texts), atol=1e-6)
+    assert np.allclose(first, again)
+    assert cached.stats()["hits"] == 4 and cached.stats()["entries"] == 3
+    assert np.allclose(cached.embed_query("alpha"), underlying.embed_query("alpha"), atol=1e-6)
+
+
+def test_lru_eviction_reuses_slots(tmp_path):
+    store = EmbeddingStore(tmp_path, DIM, max_entries=10, evict_fraction=0.2)
+    for i in range(25):
+        store.put_many({f"k{i}": _vector(f"k{i}")})
+    assert len(store) <= 10
+    found = store.get_many([f"k{i}" for i in range(25)])
+    assert "k24" in found
+    for key, vec in found.items():
+        assert np.allclose(vec, _vector(key))
+
+
+def test_reader_sees_slots_grown_by_another_instance(tmp_path):
+    reader = EmbeddingStore(tmp_path, DIM, max_entries=100_000)
+    writer = EmbeddingStore(tmp_path, DIM, max_entries=100_000)
+    writer.put_many({f"w{i}": _vector(f"w{i}") for i in range(3000)})
+    found = reader.get_many(["w0", "w1500", "w2999"])
+    assert set(found) == {"w0", "w1500", "w2999"}
+    assert np.allclose(found["w2999"], _vector("w2999"))
+    ## the reader allocates after the writer: no slot handed out twice
+    reader.put_many({"r0": _vector("r0")})
+    assert np.allclose(writer.get_many(["r0", "w0"])["w0"], _vector("w0"))
+
+
+def test_two_processes_never_share_slots(tmp_path):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(2)
+    procs = [ctx.Process(target=_writer, args=(str(tmp_path), prefix, 1500, barrier)) for prefix in ("ka", "kb")]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(120)
+        assert p.exitcode == 0
+    store = EmbeddingStore(tmp_path, DIM, max_entries=100_000)
+    keys = [f"{prefix}{i}" for prefix in ("ka", "kb") for i in range(1500)]
+    found = store.get_many(keys)
+    assert len(found) == len(keys)
+    for key in keys:
+        assert np.allclose(found[key], _vector(key)), key
+    slots = [row[0] for row in store.db.execute("SELECT slot FROM entries")]
+    assert len(slots) == len(set(slots))
+
+
+def test_lookups_do_not_wait_for_writers(tmp_path):
+    store = EmbeddingStore(tmp_path, DIM, max_entries=100)
+    store.put_many({"a": _vector("a")})
+    ## another process holds the write lock for a long insert
+    writer = sqlite3.connect(str(tmp_path / "index.sqlite"), isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.perf_counter()
+        assert np.allclose(store.get_many(["a", "b"])["a"], _vector("a"))
+        assert time.perf_counter() - start < 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+
+def test_async_calls_match_sync(tmp_path):
+    cached = CachedEmbeddings(DeterministicEmbeddings(DIM), "fake", str(tmp_path), dimensions=DIM)
+    docs = asyncio.run(cached.aembed_documents(["x", "y"]))
+    assert docs == cached.embed_documents(["x", "y"])
+    assert asyncio.run(cached.aembed_query("x")) == cached.embed_query("x")
+    assert cached.stats()["hits"] == 3
+
+
+class _FailingEmbeddings(DeterministicEmbeddings):
+    def embed_documents(self, texts):
+        raise RuntimeError("upstream down")
+
+    def embed_query(self, text):
+        raise RuntimeError("upstream down")
+
+    async def aembed_documents(self, texts):
+        raise RuntimeError("upstream down")
+
+    async def aembed_query(self, text):
+        raise RuntimeError("upstream down")
+
+
+def test_upstream_errors_are_wrapped_by_every_method(tmp_path):
+    cached = CachedEmbeddings(_FailingEmbeddings(DIM), "failing", str(tmp_path), dimensions=DIM)
+    calls = [lambda: cached.embed_documents(["a"]), lambda: cached.embed_query("a"),
+             lambda: asyncio.run(cached.aembed_documents(["a"])), lambda: asyncio.run(cached.aembed_query("a"))]
+    for call in calls:
+        with pytest.raises(DocumentPortalException):
+            call()
@@ -0,0 +1,64 @@
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+
+from src.document_chat.hybrid_retriever import HybridRetriever
+from utils.bm25_index import BM25Index
+from utils.fake_models import DeterministicEmbeddings
+
+TEXTS = {
+    "d0": "Clause 14.2 termination: either party may terminate on 30 days written notice.",
+    "d1": "The supplier is certified to ISO 9001 and keeps quality records.",
+    "d2": "Payment terms are net_30 from the invoice date.",
+    "d3": "Confidential information must not be disclosed to third parties.",
+}
+
+
+def _retriever(**kwargs):
+    embeddings = DeterministicEmbeddings()
+    ids = list(TEXTS)
+    vs = FAISS.from_documents([Document(page_content=TEXTS[i]) for i in ids], embeddings, ids=ids)
+    embeddings.texts_embedded = 0
+    bm25 = BM25Index.build(TEXTS.items())
+    return HybridRetriever(vectorstore=vs, bm25=bm25, k=2, **kwargs), embeddings
+
+
+def test_keyword_query_is_decided_on_the_raw_query():
+    retriever, _ = _retriever()
+    for query in ("clause 14.2", "ISO 9001", "net_30", '"third parties"', "AB-1234"):
+        assert retriever.is_keyword_query(query), query
+    for query in ("What is the termination notice period?", "termination notice period", "explain clause 14.2",
+                  "who is the supplier", "payment terms", "", "clause 14.2 termination notice 30 days"):
+        assert not retriever.is_keyword_query(query), query
+
+
+def test_strong_keyword_hit_skips_the_query_embedding():
+    retriever, embeddings = _retriever()
+    docs = retriever.invoke("ISO 9001")
+    assert docs[0].page_content == TEXTS["d1"]
+    assert embeddings.texts_embedded == 0
+
+
+def test_questions_and_weak_keyword_hits_are_embedded():
+    retriever, embeddings = _retriever()
+    retriever.invoke("What is the termination notice period?")
+    assert embeddings.texts_embedded == 1
+    ## only "x-99" is rare and it matches nothing: the best hit is weak
+    retriever.invoke("ISO x-99")
+    assert embeddings.texts_embedded == 2
+
+
+def test_bm25_ranks_matching_documents_first():
+    bm25 = BM25Index.build(TEXTS.items())
+    hits = bm25.search("termination notice", k=4)
+    assert hits[0][0] == "d0"
+    assert all(score > 0 for _, score in hits)
+    assert 0 < hits[0][1] <= bm25.max_score("termination notice")
+    assert bm25.search("unrelated words", k=4) == []
+
+
+def test_rrf_fusion_prefers_documents_ranked_by_both_lists():
+    retriever, _ = _retriever(rrf_k=60)
+    fused = retriever._fuse(["a", "b", "c"], ["b", "d", "a"])
+    assert fused[:2] == ["b", "a"]
+    assert set(fused) == {"a", "b", "c", "d"}
+    assert fused.index("c") > fused.index("a") and fused.index("d") > fused.index("a")
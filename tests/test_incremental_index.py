@@ -0,0 +1,97 @@
+import asyncio
+
+from langchain_core.documents import Document
+
+import utils.document_ops as document_ops
+from src.document_ingestion.data_ingestion import ChatIngestor, FaissManager
+from utils.file_io import SavedFile
+from utils.pdf_extractor import PageText
+
+
+def _docs(source: str, n: int, prefix: str = "chunk"):
+    return [Document(page_content=f"{prefix} {i} of {source}", metadata={"source": f"/tmp/{source}", "page": 0})
+            for i in range(n)]
+
+
+def _stored_ids(index_dir):
+    fm = FaissManager(index_dir)
+    fm.load_or_create()
+    return set(fm.vs.index_to_docstore_id.values()), fm._meta
+
+
+def test_reingesting_same_source_embeds_nothing(tmp_path):
+    fm = FaissManager(tmp_path)
+    assert fm.add_documents(_docs("a.txt", 5), source_hashes={"a.txt": "h1"}) == 5
+    fm = FaissManager(tmp_path)
+    fm.load_or_create()
+    assert fm.is_source_current("a.txt", "h1")
+    assert fm.add_documents(_docs("a.txt", 5), source_hashes={"a.txt": "h1"}) == 0
+    assert fm.vs.index.ntotal == 5
+
+
+def test_edited_source_embeds_new_and_drops_stale_chunks(tmp_path):
+    fm = FaissManager(tmp_path)
+    fm.add_documents(_docs("a.txt", 5), source_hashes={"a.txt": "h1"})
+    edited = _docs("a.txt", 3) + _docs("a.txt", 2, prefix="new")
+    assert fm.add_documents(edited, source_hashes={"a.txt": "h2"}) == 2
+    ids, meta = _stored_ids(tmp_path)
+    assert len(ids) == 5 and set(meta["rows"]) == ids
+    assert meta["sources"]["a.txt"]["sha256"] == "h2"
+
+
+def test_same_text_in_two_sources_is_two_chunks(tmp_path):
+    fm = FaissManager(tmp_path)
+    fm.add_documents(_docs("a.txt", 2, prefix="same") + [Document(page_content="same 0 of a.txt",
+                                                                   metadata={"source": "/tmp/b.txt"})])
+    assert fm.vs.index.ntotal == 3
+
+
+def test_concurrent_writers_keep_each_others_chunks(tmp_path):
+    FaissManager(tmp_path).add_documents(_docs("base.txt", 2), source_hashes={"base.txt": "h0"})
+    ## both writers load the same snapshot before either commits
+    first, second = FaissManager(tmp_path), FaissManager(tmp_path)
+    first.load_or_create()
+    second.load_or_create()
+    first.add_documents(_docs("a.txt", 3), source_hashes={"a.txt": "ha"})
+    second.add_documents(_docs("b.txt", 4), source_hashes={"b.txt": "hb"})
+
+    ids, meta = _stored_ids(tmp_path)
+    assert len(ids) == 9
+    assert set(meta["rows"]) == ids
+    assert set(meta["sources"]) == {"base.txt", "a.txt", "b.txt"}
+
+
+def test_file_failing_mid_stream_is_not_indexed(tmp_path, monkeypatch):
+    def _failing_pages(path, file_hash=None):
+        for i in range(2):
+            yield PageText(i, f"page {i} of the large contract", {"source": str(path), "page": i})
+        raise RuntimeError("corrupt object stream")
+
+    monkeypatch.setattr(document_ops, "extract_pdf_pages", _failing_pages)
+    ingestor = ChatIngestor(temp_base=str(tmp_path / "data"), faiss_base=str(tmp_path / "faiss"), session_id="s1")
+    big, small = ingestor.temp_dir / "big.pdf", ingestor.temp_dir / "notes.txt"
+    big.write_bytes(b"%PDF-1.7 truncated")
+    small.write_text("delivery within thirty days", encoding="utf-8")
+    saved = [SavedFile(big, "hbig", big.stat().st_size), SavedFile(small, "hsmall", small.stat().st_size)]
+
+    asyncio.run(ingestor.aindex_saved(saved))
+    ids, meta = _stored_ids(ingestor.faiss_dir)
+    assert set(meta["sources"]) == {"notes.txt"}
+    assert {row["source"] for row in meta["rows"].values()} == {"notes.txt"}
+    fm = FaissManager(ingestor.faiss_dir)
+    fm.load_or_create()
+    assert not fm.is_source_current("big.pdf", "hbig")
+
+
+def test_progress_is_reported_per_parsed_file(tmp_path):
+    ingestor = ChatIngestor(temp_base=str(tmp_path / "data"), faiss_base=str(tmp_path / "faiss"), session_id="s2")
+    saved = []
+    for i in range(3):
+        path = ingestor.temp_dir / f"f{i}.txt"
+        path.write_text(f"file {i} text", encoding="utf-8")
+        saved.append(SavedFile(path, f"h{i}", path.stat().st_size))
+    stages = []
+    ingestor._prepare(saved, None, None, progress=lambda stage, **counters: stages.append((stage, counters)))
+    parsing = [c["files_parsed"] for stage, c in stages if stage == "parsing"]
+    assert parsing == [1, 2]
+    assert ("parsed", 3) in [(stage, c.get("files_parsed")) for stage, c in stages]
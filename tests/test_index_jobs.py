@@ -0,0 +1,90 @@
+import time
+import asyncio
+
+import pytest
+
+from src.document_ingestion.index_jobs import IndexJobQueue
+from utils.job_store import CANCELLED, DONE, RUNNING, JobCancelled, JobStore
+
+KIND = "chat_index"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def test_claim_serializes_jobs_of_one_session(store):
+    first = store.enqueue(KIND, {"n": 1}, session_key="s1")
+    second = store.enqueue(KIND, {"n": 2}, session_key="s1")
+    other = store.enqueue(KIND, {"n": 3}, session_key="s2")
+
+    assert store.claim(KIND, stale_after_s=60)["job_id"] == first
+    ## s1 is busy: the next claim skips its second job
+    assert store.claim(KIND, stale_after_s=60)["job_id"] == other
+    assert store.claim(KIND, stale_after_s=60) is None
+    store.set_status(first, DONE)
+    job = store.claim(KIND, stale_after_s=60)
+    assert job["job_id"] == second and job["payload"] == {"n": 2}
+
+
+def test_stale_running_job_is_reclaimed(store):
+    job_id = store.enqueue(KIND, {}, session_key="s1")
+    assert store.claim(KIND, stale_after_s=60)["job_id"] == job_id
+    assert store.claim(KIND, stale_after_s=60) is None
+    time.sleep(0.05)
+    ## its worker stopped reporting progress: runnable again
+    job = store.claim(KIND, stale_after_s=0.01)
+    assert job["job_id"] == job_id and job["status"] == RUNNING
+
+
+def test_heartbeat_keeps_a_slow_job_claimed(store):
+    queue = IndexJobQueue(store)
+    queue.heartbeat_s = 0.02
+    job_id = store.enqueue(KIND, {}, session_key="s1")
+    store.claim(KIND, stale_after_s=60)
+
+    async def _slow_stage():
+        ## a long parse or a wait for the index lock: no progress updates for a while
+        task = asyncio.create_task(queue._heartbeat(job_id))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(_slow_stage())
+    assert store.claim(KIND, stale_after_s=0.2) is None
+
+
+def test_cancel_queued_job_never_runs(store):
+    job_id = store.enqueue(KIND, {}, session_key="s1")
+    assert store.request_cancel(job_id)["status"] == CANCELLED
+    assert store.claim(KIND, stale_after_s=60) is None
+
+
+def test_cancel_only_before_the_write(store):
+    queue = IndexJobQueue(store)
+    job_id = store.enqueue(KIND, {}, session_key="s1")
+    store.claim(KIND, stale_after_s=60)
+    progress = queue._progress_fn(job_id)
+    progress("embedding", chunks_embedded=1)
+    store.request_cancel(job_id)
+    with pytest.raises(JobCancelled):
+        progress("writing")
+    ## once written, progress is still recorded and nothing raises
+    progress("written", vectors_written=3)
+    assert store.get(job_id)["progress"]["vectors_written"] == 3
+
+
+def test_wait_true_runs_through_the_queue():
+    from fastapi.testclient import TestClient
+    from api.main import app
+
+    body = "\n\n".join(f"Section {i}. The warranty covers parts for {i} months." for i in range(40))
+    with TestClient(app) as client:
+        r = client.post("/chat/index", files=[("files", ("policy.txt", body.encode()))],
+                        data={"session_id": "waited", "wait": "true"})
+        assert r.status_code == 200, r.text
+        job = client.get(f"/chat/index/jobs/{r.json()['job_id']}").json()
+        assert job["status"] == DONE and job["progress"]["vectors_written"] > 0
+        r = client.post("/chat/query", data={"question": "What does the warranty cover?", "session_id": "waited"})
+        assert r.status_code == 200, r.text
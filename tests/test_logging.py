@@ -0,0 +1,28 @@
+import os
+import time
+import multiprocessing
+
+from logger.custom_logger import CustomLogger
+
+
+def _log_from_child(marker):
+    CustomLogger().get_logger(__file__).info("Logged by a forked worker", marker=marker)
+
+
+def test_forked_workers_log_to_the_parent_file():
+    logger = CustomLogger()
+    marker = f"child-{time.time_ns()}"
+    child = multiprocessing.get_context("fork").Process(target=_log_from_child, args=(marker,))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+
+    deadline = time.time() + 10
+    text = ""
+    while marker not in text and time.time() < deadline:
+        time.sleep(0.05)
+        if os.path.exists(logger.log_file_path):
+            with open(logger.log_file_path, encoding="utf-8") as f:
+                text = f.read()
+    assert marker in text
+    assert not [name for name in os.listdir(logger.logs_dir) if f"_{child.pid}.log" in name]
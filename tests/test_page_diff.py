@@ -0,0 +1,28 @@
+from src.document_compare.page_diff import align_pages, page_change_text, page_sort_key
+
+
+def test_identical_pages_ignore_whitespace():
+    pairs = align_pages(["a  b\nc", "page two"], ["a b c", "page two "])
+    assert [(p.ref_index, p.act_index, p.changed) for p in pairs] == [(0, 0, False), (1, 1, False)]
+
+
+def test_inserted_page_does_not_shift_later_pages():
+    ref = ["intro", "terms", "signatures"]
+    act = ["intro", "new annex", "terms", "signatures"]
+    pairs = align_pages(ref, act)
+    assert [(p.ref_index, p.act_index, p.changed) for p in pairs] == [
+        (0, 0, False), (None, 1, True), (1, 2, False), (2, 3, False)]
+    assert [p.label for p in pairs if p.changed] == ["2"]
+    assert page_change_text(pairs[1], ref, act).startswith("Page 2 (added in actual document):\nnew annex")
+
+
+def test_modified_and_removed_pages():
+    ref = ["intro", "fee is 10", "old annex", "end"]
+    act = ["intro", "fee is 12", "end"]
+    pairs = align_pages(ref, act)
+    changed = [p for p in pairs if p.changed]
+    assert [(p.ref_index, p.act_index) for p in changed] == [(1, 1), (2, None)]
+    assert changed[1].label == "3 (removed)"
+    diff = page_change_text(changed[0], ref, act)
+    assert "-fee is 10" in diff and "+fee is 12" in diff
+    assert sorted(["10", "3 (removed)", "2"], key=page_sort_key) == ["2", "3 (removed)", "10"]
@@ -0,0 +1,153 @@
+import os
+import time
+
+import pytest
+
+from utils.file_io import InvalidSessionIdError, validate_session_id
+from utils.pdf_extractor import PageTextCache, get_page_cache
+from src.document_chat.chat_memory import get_chat_memory
+from utils.storage_manager import FAISS, CHAT_UPLOADS, StorageManager
+
+
+def _session(root, name, size=1000):
+    d = root / name
+    d.mkdir(parents=True, exist_ok=True)
+    (d / "blob.bin").write_bytes(b"x" * size)
+    return d
+
+
+@pytest.fixture
+def manager(tmp_path):
+    roots = {CHAT_UPLOADS: tmp_path / "data", FAISS: tmp_path / "faiss_index"}
+    for root in roots.values():
+        root.mkdir()
+    m = StorageManager(str(tmp_path / "storage.sqlite"), roots={k: str(v) for k, v in roots.items()},
+                       min_idle_s=0, touch_interval_s=0)
+    m._adopted = True
+    m._active_job_dirs = lambda: set()
+    return m
+
+
+def test_lru_eviction_keeps_recent_and_pinned(manager, tmp_path):
+    root = tmp_path / "data"
+    for name in ("a", "b", "c"):
+        manager.record_write(CHAT_UPLOADS, name, _session(root, name))
+        time.sleep(0.01)
+    manager.touch("a")
+    manager.max_total_bytes = 2500
+    manager.low_watermark = 1.0
+
+    with manager.pin(root / "b"):
+        result = manager.sweep()
+    ## b (least recently used) is pinned, so c goes instead
+    assert result["evicted"] == 1 and result["skipped_in_use"] == 1
+    assert sorted(os.listdir(root)) == ["a", "b"]
+
+
+def test_ttl_eviction(manager, tmp_path):
+    root = tmp_path / "faiss_index"
+    manager.record_write(FAISS, "old", _session(root, "old"))
+    manager.ttl_s = 0
+    assert manager.sweep()["evicted"] == 1
+    assert not (root / "old").exists()
+    assert manager.stats()["sessions"] == 0
+
+
+def test_quota(manager, tmp_path):
+    manager.max_session_bytes = 1500
+    manager.record_write(CHAT_UPLOADS, "a", _session(tmp_path / "data", "a"))
+    manager.check_quota("a", 400)
+    with pytest.raises(Exception, match="quota"):
+        manager.check_quota("a", 600)
+
+
+@pytest.mark.parametrize("path", ["..", ".", ""])
+def test_paths_outside_roots_never_tracked_or_removed(manager, tmp_path, path):
+    target = tmp_path / "faiss_index" / path if path else tmp_path / "faiss_index"
+    manager.record_write(FAISS, "evil", target)
+    manager.ttl_s = 0
+    manager.sweep()
+    assert (tmp_path / "faiss_index").is_dir() and (tmp_path / "storage.sqlite").exists()
+    assert manager.stats()["sessions"] == 0
+
+
+def test_evict_skips_rows_outside_roots(manager, tmp_path):
+    outside = _session(tmp_path, "outside")
+    manager.db.execute("INSERT INTO storage_paths(path, session_id, kind, bytes) VALUES (?,?,?,?)",
+                       (str(outside), "s", CHAT_UPLOADS, 1000))
+    manager.db.execute("INSERT INTO storage_sessions VALUES ('s', 1000, 0, 0)")
+    manager.db.commit()
+    manager.ttl_s = 0
+    manager.sweep()
+    assert outside.exists()
+
+
+@pytest.mark.parametrize("session_id", ["..", ".", "a/b", "../x", "a\\b", "", "-x", "x" * 200])
+def test_invalid_session_ids(session_id):
+    with pytest.raises(InvalidSessionIdError):
+        validate_session_id(session_id)
+
+
+@pytest.mark.parametrize("session_id", ["session_20260101_120000_0a1b2c3d", "A", "my-chat_1"])
+def test_valid_session_ids(session_id):
+    assert validate_session_id(session_id) == session_id
+
+
+def test_api_rejects_traversal_session_id():
+    from fastapi.testclient import TestClient
+    from api.main import app
+
+    client = TestClient(app)
+    r = client.post("/chat/index", files=[("files", ("a.txt", b"hello"))], data={"session_id": "..", "wait": "true"})
+    assert r.status_code == 400
+    r = client.post("/chat/query", data={"question": "q", "session_id": ".."})
+    assert r.status_code == 400
+
+
+def _cache_entry(cache, file_hash, pages, age_s=0.0):
+    writer = cache.writer(file_hash)
+    for text in pages:
+        writer.write(text)
+    writer.commit()
+    if age_s:
+        t = time.time() - age_s
+        os.utime(cache._path(file_hash), (t, t))
+
+
+def test_page_cache_gc_drops_expired_then_least_recently_used(tmp_path):
+    cache = PageTextCache(str(tmp_path / "pages"), ttl_s=3600)
+    _cache_entry(cache, "old", ["x" * 100], age_s=7200)
+    _cache_entry(cache, "b", ["y" * 100], age_s=30)
+    _cache_entry(cache, "c", ["z" * 100], age_s=20)
+    ## reading b makes it the most recently used entry
+    assert list(cache.iter_pages("b")) == ["y" * 100]
+    cache.max_bytes = 150
+
+    result = cache.gc()
+    assert result["removed_entries"] == 2
+    assert "old" not in cache and "c" not in cache and "b" in cache
+
+
+def test_sweep_runs_the_page_cache_gc(manager):
+    cache = get_page_cache()
+    _cache_entry(cache, "expired", ["text"], age_s=cache.ttl_s + 60)
+    cache._last_gc = 0.0
+    result = manager.sweep()
+    assert result["page_cache_gc"]["removed_entries"] >= 1
+    assert "expired" not in cache
+
+
+def test_sweep_expires_chat_histories_and_evicts_them_with_their_session(manager, tmp_path):
+    memory = get_chat_memory()
+    manager.record_write(CHAT_UPLOADS, "chat_evicted", _session(tmp_path / "data", "chat_evicted"))
+    memory.append("chat_evicted", "q", "a")
+    memory.append("chat_idle", "q", "a")
+    memory.db.execute("UPDATE chat_sessions SET updated=updated-? WHERE session_id='chat_idle'", (memory.ttl_s + 60,))
+    memory.db.commit()
+    memory.append("chat_live", "q", "a")
+    manager.ttl_s = 0
+
+    result = manager.sweep()
+    assert result["chat_sessions_expired"] == 1
+    assert memory.history("chat_idle") == [] and memory.history("chat_evicted") == []
+    assert len(memory.history("chat_live")) == 2
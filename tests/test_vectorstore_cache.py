@@ -0,0 +1,22 @@
+from utils.vectorstore_cache import VectorStoreCache
+
+
+def _index_dir(tmp_path, name, size=100):
+    d = tmp_path / name
+    d.mkdir()
+    (d / "index.faiss").write_bytes(b"x" * size)
+    (d / "index.pkl").write_bytes(b"x")
+    return str(d)
+
+
+def test_load_locks_are_dropped_with_their_entries(tmp_path):
+    cache = VectorStoreCache(max_bytes=250)
+    paths = [_index_dir(tmp_path, f"s{i}") for i in range(5)]
+    for path in paths:
+        assert cache.get_or_load(path, lambda: object()) is not None
+    ## two entries fit the budget: the locks of evicted indexes are gone
+    assert len(cache._load_locks) == cache.stats()["entries"] == 2
+    cache.invalidate(paths[-1])
+    assert len(cache._load_locks) == 1
+    cache.clear()
+    assert cache._load_locks == {}
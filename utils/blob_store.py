@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from logger.custom_logger import CustomLogger
+from utils.config_loader import load_config
+from utils.file_io import SavedFile
+
+## metadata that names the session copy of a file, restored from the current path on reuse
+PATH_KEYS = ("source", "file_path")
+
+
+class BlobStore:
+    """Content-addressed store shared by all sessions, keyed by file SHA-256.
+
+    files/  one copy of every uploaded file; session directories hold hard links to it,
+            so the same document uploaded into many sessions takes its disk space once.
+    chunks/ the split chunks of a file and their vectors, per (embedding model, chunking):
+            a session that uploads a known document merges these into its index without
+            parsing, splitting or embedding anything.
+
+    Page text of PDFs is already cached by hash in utils.pdf_extractor. Entries are
+    immutable and written with a rename; gc() removes entries unused for ttl_s (and raw
+    files no session links to any more).
+    """
+
+    def __init__(self, root: str, ttl_s: float = 30 * 24 * 3600, gc_interval_s: float = 6 * 3600):
+        self.log = CustomLogger().get_logger(__name__)
+        self.root = Path(root)
+        self.files_dir = self.root / "files"
+        self.chunks_dir = self.root / "chunks"
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        self.chunks_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self.gc_interval_s = gc_interval_s
+        self._last_gc = 0.0
+
+    def _file_path(self, sha256: str) -> Path:
+        return self.files_dir / sha256[:2] / sha256
+
+    def link_file(self, saved: SavedFile) -> bool:
+        '''Replace a saved upload by a hard link to the stored copy of its content
+        (stored on first sight).
+        False when the filesystem refuses hard links; the session then keeps its own copy.
+        '''
+        blob = self._file_path(saved.sha256)
+        try:
+            if blob.exists():
+                ## link next to the session file, then rename over it: never a missing file
+                tmp = saved.path.with_name(saved.path.name + f".{os.getpid()}.link")
+                os.link(blob, tmp)
+                os.replace(tmp, saved.path)
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                tmp = blob.with_name(blob.name + f".{os.getpid()}.tmp")
+                os.link(saved.path, tmp)
+                os.replace(tmp, blob)
+            os.utime(blob)
+            return True
+        except OSError as e:
+            self.log.warning("Upload not shared with the blob store", path=str(saved.path),
+                             error=str(e))
+            return False
+
+    @staticmethod
+    def _variant(embedding_key: str, chunk_config: Dict[str, Any]) -> str:
+        raw = json.dumps({"embedding": embedding_key, "chunking": chunk_config}, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def _chunk_paths(self, sha256: str, embedding_key: str,
+                     chunk_config: Dict[str, Any]) -> Tuple[Path, Path]:
+        base = self.chunks_dir / sha256[:2] / sha256 / self._variant(embedding_key, chunk_config)
+        return base.with_suffix(".json"), base.with_suffix(".npy")
+
+    def has_chunks(self, sha256: str, embedding_key: str, chunk_config: Dict[str, Any]) -> bool:
+        '''True if chunks are stored for this content, model and chunking'''
+        return self._chunk_paths(sha256, embedding_key, chunk_config)[0].exists()
+
+    def get_chunks(self, sha256: str, embedding_key: str, chunk_config: Dict[str, Any],
+                   source_path) -> Optional[Tuple[List[Document], np.ndarray]]:
+        '''Chunks (metadata pointing at source_path) and their vectors, None when not stored'''
+        meta_path, vec_path = self._chunk_paths(sha256, embedding_key, chunk_config)
+        try:
+            entry = json.loads(meta_path.read_text(encoding="utf-8"))
+            vectors = np.load(vec_path)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        if len(entry["chunks"]) != len(vectors):
+            return None
+        docs = []
+        for chunk in entry["chunks"]:
+            metadata = {**chunk["metadata"], "source": str(source_path)}
+            docs.append(Document(page_content=chunk["text"], metadata=metadata))
+        os.utime(meta_path)
+        return docs, vectors
+
+    def put_chunks(self, sha256: str, embedding_key: str, chunk_config: Dict[str, Any],
+                   docs: Sequence[Document], vectors: Sequence[Sequence[float]]):
+        '''Store the chunks of one file and their vectors (vectors first, the JSON commits
+        the entry)'''
+        meta_path, vec_path = self._chunk_paths(sha256, embedding_key, chunk_config)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        tmp_vec = vec_path.with_name(vec_path.name + suffix)
+        with open(tmp_vec, "wb") as f:
+            np.save(f, np.asarray(vectors, dtype=np.float32))
+        os.replace(tmp_vec, vec_path)
+        chunks = [{"text": d.page_content,
+                   "metadata": {k: v for k, v in (d.metadata or {}).items() if k not in PATH_KEYS}}
+                  for d in docs]
+        tmp_meta = meta_path.with_name(meta_path.name + suffix)
+        entry = {"sha256": sha256, "embedding": embedding_key, "chunk_config": chunk_config,
+                 "chunks": chunks}
+        tmp_meta.write_text(json.dumps(entry, ensure_ascii=False, default=str), encoding="utf-8")
+        os.replace(tmp_meta, meta_path)
+
+    def gc_due(self) -> bool:
+        '''True once gc_interval_s passed since the last gc'''
+        return time.time() - self._last_gc >= self.gc_interval_s
+
+    def gc(self) -> Dict[str, int]:
+        '''Remove chunk entries unused for ttl_s and raw files no session links to that are
+        as old'''
+        self._last_gc = time.time()
+        cutoff = self._last_gc - self.ttl_s
+        removed_files = removed_chunks = freed = 0
+        for path in self.files_dir.glob("*/*"):
+            try:
+                st = path.stat()
+                if st.st_nlink <= 1 and st.st_mtime < cutoff:
+                    path.unlink()
+                    removed_files += 1
+                    freed += st.st_size
+            except FileNotFoundError:
+                continue
+        for meta_path in self.chunks_dir.glob("*/*/*.json"):
+            try:
+                if meta_path.stat().st_mtime >= cutoff:
+                    continue
+                vec_path = meta_path.with_suffix(".npy")
+                vec_bytes = vec_path.stat().st_size if vec_path.exists() else 0
+                freed += meta_path.stat().st_size + vec_bytes
+                ## JSON first: a concurrent reader sees no entry rather than one without vectors
+                meta_path.unlink()
+                vec_path.unlink(missing_ok=True)
+                removed_chunks += 1
+            except FileNotFoundError:
+                continue
+        result = {"removed_files": removed_files, "removed_chunk_entries": removed_chunks,
+                  "freed_bytes": freed}
+        if removed_files or removed_chunks:
+            self.log.info("Blob store garbage collected", **result)
+        return result
+
+
+@lru_cache(maxsize=1)
+def get_blob_store() -> Optional[BlobStore]:
+    '''Shared blob store for the process, None when disabled in config'''
+    cfg = load_config().get("blob_store") or {}
+    if not cfg.get("enabled", True):
+        return None
+    return BlobStore(
+        os.getenv("BLOB_STORE_PATH", cfg.get("path", "cache/blobs")),
+        ttl_s=float(cfg.get("ttl_hours", 720)) * 3600,
+        gc_interval_s=float(cfg.get("gc_interval_hours", 6)) * 3600,
+    )
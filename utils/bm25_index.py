@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from logger.custom_logger import CustomLogger
+
+BM25_FILE = "bm25.json"
+
+## words, numbers and dotted/dashed identifiers ("4.2.1", "ab-1234") stay single terms
+TOKEN = re.compile(r"[a-z0-9]+(?:[.\-/_][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to "
+    "was were what when where which who why will with does do did can".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    '''Lowercased word tokens without stopwords'''
+    return [t for t in TOKEN.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Compact in-memory BM25 inverted index over chunk ids (the FAISS docstore ids).
+
+    Postings are stored per term as parallel (document number, term frequency) lists and
+    persisted as bm25.json next to index.faiss.
+    """
+
+    def __init__(self, doc_ids: List[str], doc_len: List[int],
+                 postings: Dict[str, Tuple[List[int], List[int]]],
+                 k1: float = 1.5, b: float = 0.75):
+        self.doc_ids = doc_ids
+        self.doc_len = doc_len
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avg_len = (sum(doc_len) / len(doc_len)) if doc_len else 0.0
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[str, str]]) -> "BM25Index":
+        '''Index (doc id, text) pairs'''
+        doc_ids: List[str] = []
+        doc_len: List[int] = []
+        postings: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+        for n, (doc_id, text) in enumerate(docs):
+            terms = tokenize(text)
+            doc_ids.append(doc_id)
+            doc_len.append(len(terms))
+            for term, tf in Counter(terms).items():
+                numbers, tfs = postings[term]
+                numbers.append(n)
+                tfs.append(tf)
+        return cls(doc_ids, doc_len, dict(postings))
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def _idf(self, df: int) -> float:
+        return math.log(1 + (len(self.doc_ids) - df + 0.5) / (df + 0.5))
+
+    def max_score(self, query: str) -> float:
+        '''Bound of the search() scores of the query: every term matched, at unbounded frequency.
+        Terms absent from the index count with their (high) idf, so hits missing them rank weak.
+        '''
+        if not self.doc_ids:
+            return 0.0
+        return sum(self._idf(len(self.postings.get(term, ((), ()))[0])) * (self.k1 + 1)
+                   for term in set(tokenize(query)))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        '''Top k (doc id, score) for the query terms, best first; empty if no term matches'''
+        n_docs = len(self.doc_ids)
+        if not n_docs:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            numbers, tfs = posting
+            idf = self._idf(len(numbers))
+            for n, tf in zip(numbers, tfs):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[n] / (self.avg_len or 1.0))
+                scores[n] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.doc_ids[n], score) for n, score in best]
+
+    def save(self, index_dir):
+        '''Write bm25.json atomically (callers hold the index write lock)'''
+        path = Path(index_dir) / BM25_FILE
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        data = {"version": 1, "k1": self.k1, "b": self.b,
+                "doc_ids": self.doc_ids, "doc_len": self.doc_len,
+                "postings": {term: [numbers, tfs]
+                             for term, (numbers, tfs) in self.postings.items()}}
+        tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, index_dir) -> "BM25Index":
+        '''Read the index saved next to a FAISS index'''
+        data = json.loads((Path(index_dir) / BM25_FILE).read_text(encoding="utf-8"))
+        postings = {term: (numbers, tfs) for term, (numbers, tfs) in data["postings"].items()}
+        return cls(data["doc_ids"], data["doc_len"], postings,
+                   k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+
+
+## small LRU of loaded indexes, like the vector store cache they sit next to
+MAX_LOADED = 256
+_loaded: "OrderedDict[str, Tuple[Tuple[int, int], BM25Index]]" = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def get_bm25_index(index_dir) -> Optional[BM25Index]:
+    '''Loaded BM25 index of an index directory (reloaded when the file is replaced),
+    None if absent'''
+    path = Path(index_dir) / BM25_FILE
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key, signature = str(path.resolve()), (st.st_ino, st.st_mtime_ns)
+    with _loaded_lock:
+        entry = _loaded.get(key)
+        if entry is not None and entry[0] == signature:
+            _loaded.move_to_end(key)
+            return entry[1]
+    try:
+        index = BM25Index.load(index_dir)
+    except Exception as e:
+        CustomLogger().get_logger(__name__).warning("Unreadable BM25 index", path=str(path),
+                                                    error=str(e))
+        return None
+    with _loaded_lock:
+        _loaded[key] = (signature, index)
+        _loaded.move_to_end(key)
+        while len(_loaded) > MAX_LOADED:
+            _loaded.popitem(last=False)
+    return index
@@ -0,0 +1,164 @@
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from utils.config_loader import load_config
+from utils.tokens import CHARS_PER_TOKEN, _encoding
+
+## cut points from coarse to fine: paragraph, line, sentence end, word; a piece that still
+## does not fit is halved until it does
+SEPARATORS = (
+    re.compile(r"\n[ \t]*\n\s*"),
+    re.compile(r"\n\s*"),
+    re.compile(r"[.!?][\"')\]]*\s+"),
+    re.compile(r"\s+"),
+)
+
+## (start, end, tokens) of a piece of page text
+Piece = Tuple[int, int, int]
+
+
+class TokenChunker:
+    """Streaming splitter with sizes in tokens, for page Documents as they are extracted.
+
+    Every page is cut at the coarsest boundary that yields pieces of at most chunk_size
+    tokens, and the pieces are packed greedily into chunks, repeating up to chunk_overlap
+    tokens of the previous chunk. Chunks never span pages: they keep the page metadata
+    (source, page) and get start_index (offset in the page text, as add_start_index of the
+    LangChain splitters) and tokens. Tokens are counted with tiktoken, or estimated at
+    CHARS_PER_TOKEN characters per token when it is unavailable.
+    """
+
+    def __init__(self, chunk_size: int = 256, chunk_overlap: int = 48,
+                 encoding_name: str = "o200k_base"):
+        if chunk_size <= 0 or not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(
+                f"Invalid chunking: chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._enc = _encoding(encoding_name)
+        self.tokenizer = encoding_name if self._enc is not None else "estimate"
+        ## time spent splitting, apart from the time the page iterator takes to produce pages
+        self.seconds = 0.0
+        self.pages = 0
+
+    def _count(self, texts: List[str]) -> List[int]:
+        if self._enc is None:
+            return [(len(t) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN for t in texts]
+        return [len(ids) for ids in self._enc.encode_ordinary_batch(texts)]
+
+    @staticmethod
+    def _cut(text: str, start: int, end: int, level: int) -> List[Tuple[int, int]]:
+        if level >= len(SEPARATORS):
+            mid = (start + end) // 2
+            return [(start, mid), (mid, end)]
+        spans, pos = [], start
+        for m in SEPARATORS[level].finditer(text, start, end):
+            if m.end() > pos and m.end() < end:
+                spans.append((pos, m.end()))
+                pos = m.end()
+        spans.append((pos, end))
+        return spans
+
+    def _pieces(self, text: str, start: int, end: int, level: int = 0) -> Iterator[Piece]:
+        spans = self._cut(text, start, end, level)
+        if len(spans) == 1 and 0 < level < len(SEPARATORS):
+            ## no boundary of this kind: the span is known to be too large, skip recounting it
+            yield from self._pieces(text, start, end, level + 1)
+            return
+        for (s, e), n in zip(spans, self._count([text[s:e] for s, e in spans])):
+            if n <= self.chunk_size or e - s <= 1:
+                yield s, e, n
+            else:
+                yield from self._pieces(text, s, e, level + 1)
+
+    def _chunk(self, text: str, start: int, end: int, tokens: int,
+               metadata: Dict[str, Any]) -> Optional[Document]:
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if not stripped:
+            return None
+        offset = start + len(chunk) - len(chunk.lstrip())
+        return Document(page_content=stripped,
+                        metadata={**metadata, "start_index": offset, "tokens": tokens})
+
+    def split_text(self, text: str,
+                   metadata: Optional[Dict[str, Any]] = None) -> Iterator[Document]:
+        '''Chunks of one page'''
+        metadata = metadata or {}
+        window: Deque[Piece] = deque()
+        total = 0
+        for piece in self._pieces(text, 0, len(text)):
+            n = piece[2]
+            if window and total + n > self.chunk_size:
+                chunk = self._chunk(text, window[0][0], window[-1][1], total, metadata)
+                if chunk is not None:
+                    yield chunk
+                ## the tail kept as overlap must leave room for the new piece
+                while window and (total > self.chunk_overlap or total + n > self.chunk_size):
+                    total -= window.popleft()[2]
+            window.append(piece)
+            total += n
+        if window:
+            chunk = self._chunk(text, window[0][0], window[-1][1], total, metadata)
+            if chunk is not None:
+                yield chunk
+
+    def split_documents(self, docs: Iterable[Document]) -> Iterator[Document]:
+        '''Chunks of every page, produced while later pages are still being loaded'''
+        for doc in docs:
+            start = time.perf_counter()
+            chunks = list(self.split_text(doc.page_content, doc.metadata))
+            self.seconds += time.perf_counter() - start
+            self.pages += 1
+            yield from chunks
+
+
+def iter_batches(chunks: Iterable[Document], max_chunks: int,
+                 max_tokens: int) -> Iterator[List[Document]]:
+    '''Group chunks into embedding requests of at most max_chunks chunks and max_tokens tokens'''
+    batch: List[Document] = []
+    tokens = 0
+    for doc in chunks:
+        n = doc.metadata.get("tokens")
+        if n is None:
+            n = (len(doc.page_content) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        if batch and (len(batch) >= max_chunks or tokens + n > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(doc)
+        tokens += n
+    if batch:
+        yield batch
+
+
+@lru_cache(maxsize=1)
+def chunking_settings() -> dict:
+    '''The chunking block of the config'''
+    return load_config().get("chunking") or {}
+
+
+def chunk_config(chunk_size: Optional[int] = None,
+                 chunk_overlap: Optional[int] = None) -> Dict[str, Any]:
+    '''Effective chunking of an ingestion: the request values or the configured defaults.
+    Part of the index manifest and blob store keys, so any change re-chunks the sources.
+    Raises ValueError for an overlap not smaller than the chunk size.
+    '''
+    cfg = chunking_settings()
+    unit = cfg.get("unit", "tokens")
+    config: Dict[str, Any] = {
+        "chunk_size": int(chunk_size if chunk_size is not None else cfg.get("chunk_size", 256)),
+        "chunk_overlap": int(chunk_overlap if chunk_overlap is not None
+                             else cfg.get("chunk_overlap", 48)),
+    }
+    if config["chunk_size"] <= 0 or not 0 <= config["chunk_overlap"] < config["chunk_size"]:
+        raise ValueError(f"chunk_overlap must be in [0, chunk_size): {config}")
+    if unit == "tokens":
+        encoding_name = cfg.get("encoding", "o200k_base")
+        config["unit"] = "tokens"
+        config["tokenizer"] = encoding_name if _encoding(encoding_name) is not None else "estimate"
+    return config
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
+from typing import Any, Callable
+
+from utils.config_loader import load_config
+
+
+@lru_cache(maxsize=1)
+def _concurrency_config() -> dict:
+    return load_config().get("concurrency") or {}
+
+
+@lru_cache(maxsize=1)
+def get_cpu_executor() -> ThreadPoolExecutor:
+    '''Bounded pool for blocking work (PDF parsing, splitting, FAISS load/search/write)'''
+    workers = int(_concurrency_config().get("cpu_workers", 4))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="docportal-cpu")
+
+
+@lru_cache(maxsize=1)
+def get_process_executor() -> ProcessPoolExecutor:
+    '''Process pool for CPU heavy work that holds the GIL (fan-out of large PDF extraction)'''
+    workers = int(_concurrency_config().get("process_workers", 4))
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    '''Run a blocking callable on the bounded pool without blocking the event loop'''
+    loop = asyncio.get_running_loop()
+    ## the caller's context (e.g. the request trace id) carries over to the pool thread
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_cpu_executor(), partial(ctx.run, fn, *args, **kwargs))
+
+
+## one semaphore per event loop (asyncio primitives are bound to the loop that uses them)
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary())
+_semaphore_lock = threading.Lock()
+
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    with _semaphore_lock:
+        sem = _llm_semaphores.get(loop)
+        if sem is None:
+            sem = asyncio.Semaphore(int(_concurrency_config().get("max_concurrent_llm_calls", 32)))
+            _llm_semaphores[loop] = sem
+        return sem
+
+
+@asynccontextmanager
+async def llm_slot():
+    '''Limit the number of in-flight LLM calls per worker'''
+    async with _llm_semaphore():
+        yield
@@ -1,12 +1,18 @@
+import os
+from pathlib import Path
 import yaml
 
-def load_config(config_path: str = "config\config.yaml") ->dict:
+## config/config.yaml relative to the project root, so it resolves from any working directory
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parent.parent / "config" / "config.yaml"
+
+def load_config(config_path: str = None) ->dict:
     '''This function will load the config file (config.yaml)'''
     
+    config_path = config_path or os.getenv("CONFIG_PATH", str(DEFAULT_CONFIG_PATH))
     with open(config_path,'r') as file:
         config = yaml.safe_load(file)
     return config
 
 
 if __name__=='__main__':
-    print(load_config())
\ No newline at end of file
+    print(load_config())
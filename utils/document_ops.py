@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import codecs
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain_community.document_loaders import Docx2txtLoader
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+from utils.concurrency import get_process_executor
+from utils.metrics import observe_stage
+from utils.pdf_extractor import extract_pdf_pages
+
+log = CustomLogger().get_logger(__name__)
+
+## (text, metadata) pairs: what a loader returns, picklable across the process pool
+Parts = List[Tuple[str, Dict[str, Any]]]
+
+
+def _load_pdf(path: str, file_hash: Optional[str]) -> Parts:
+    ## PyMuPDF page streaming, same metadata keys as PyPDFLoader (source, 0-based page);
+    ## inline: a pool worker must not fan out to the pool itself
+    pages = extract_pdf_pages(path, parallel=False, file_hash=file_hash)
+    return [(page.text, page.metadata) for page in pages]
+
+
+def _load_txt(path: str, _file_hash: Optional[str], block_size: int = 1 << 20) -> Parts:
+    ## decoded block by block: no full-size bytes copy next to the text
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            parts.append(decoder.decode(block))
+    parts.append(decoder.decode(b"", final=True))
+    return [("".join(parts), {"source": path})]
+
+
+def _load_docx(path: str, _file_hash: Optional[str]) -> Parts:
+    return [(d.page_content, d.metadata) for d in Docx2txtLoader(path).load()]
+
+
+## file type dispatch
+LOADERS: Dict[str, Callable[[str, Optional[str]], Parts]] = {
+    ".pdf": _load_pdf,
+    ".txt": _load_txt,
+    ".docx": _load_docx,
+}
+
+
+def _load_file(path: str, file_hash: Optional[str]) -> Tuple[Parts, float]:
+    '''Process pool task: load one file, return its parts and the load time'''
+    start = time.perf_counter()
+    parts = LOADERS[Path(path).suffix.lower()](path, file_hash)
+    return parts, time.perf_counter() - start
+
+
+@dataclass
+class LoadReport:
+    """Outcome of a load_documents/iter_documents call: per-file seconds and failures."""
+    seconds: Dict[str, float] = field(default_factory=dict)
+    failed: Dict[str, str] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+
+    @property
+    def loaded(self) -> int:
+        '''Number of files loaded'''
+        return len(self.seconds)
+
+
+@lru_cache(maxsize=1)
+def _loading_config() -> dict:
+    return load_config().get("document_loading") or {}
+
+
+def _record(report: LoadReport, path: str, seconds: float, parts: int):
+    report.seconds[path] = seconds
+    observe_stage("ingestion", f"load{Path(path).suffix.lower()}", seconds)
+    log.debug("Document loaded", path=path, parts=parts, seconds=round(seconds, 4))
+
+
+def iter_documents(paths: Iterable[Path], file_hashes: Optional[Dict[str, str]] = None,
+                   parallel: Optional[bool] = None,
+                   report: Optional[LoadReport] = None) -> Iterator[Document]:
+    '''Yield the Documents of pdf/docx/txt files lazily, file by file in input order.
+
+    Files are loaded concurrently on the process pool, at most in_flight_per_worker per
+    worker ahead of the consumer. PDFs of large_pdf_mb and up are streamed here instead, so
+    their pages fan out over the pool by page range. A file that fails to load is logged
+    and recorded in report.failed; the others are still loaded. file_hashes (path -> SHA-256)
+    spares re-hashing PDFs for the page cache.
+    '''
+    cfg = _loading_config()
+    report = report if report is not None else LoadReport()
+    file_hashes = file_hashes or {}
+    jobs: List[Tuple[str, Optional[str]]] = []
+    for p in paths:
+        path = str(p)
+        if Path(path).suffix.lower() not in LOADERS:
+            log.warning("Unsupported extension skipped", path=path)
+            report.skipped.append(path)
+            continue
+        jobs.append((path, file_hashes.get(path)))
+
+    workers = int((load_config().get("concurrency") or {}).get("process_workers", 4))
+    pooled = parallel if parallel is not None else (
+        workers > 1 and len(jobs) >= int(cfg.get("min_files_for_pool", 4)))
+    large_pdf_bytes = float(cfg.get("large_pdf_mb", 8)) * 1024 * 1024
+    window = max(1, workers * int(cfg.get("in_flight_per_worker", 2)))
+    executor = get_process_executor() if pooled else None
+
+    ## futures of the files ahead of the consumer; None marks a large PDF streamed in place
+    pending: Deque[Tuple[str, Optional[str], Optional[Future]]] = deque()
+    queue = deque(jobs)
+
+    def _submit():
+        while queue and len(pending) < window:
+            path, file_hash = queue.popleft()
+            streamed = (Path(path).suffix.lower() == ".pdf"
+                        and os.path.getsize(path) >= large_pdf_bytes)
+            use_pool = executor is not None and not streamed
+            future = executor.submit(_load_file, path, file_hash) if use_pool else None
+            pending.append((path, file_hash, future))
+
+    _submit()
+    while pending:
+        path, file_hash, future = pending.popleft()
+        try:
+            if future is not None:
+                parts, seconds = future.result()
+                _submit()
+                _record(report, path, seconds, len(parts))
+                for text, metadata in parts:
+                    yield Document(page_content=text, metadata=metadata)
+                continue
+            _submit()
+            start = time.perf_counter()
+            if Path(path).suffix.lower() == ".pdf":
+                ## streamed: pages reach the consumer while later ones are still extracted
+                ## (pages yielded before a failure stay with the consumer, which must drop the
+                ## documents of files listed in report.failed)
+                count = 0
+                for page in extract_pdf_pages(path, file_hash=file_hash):
+                    count += 1
+                    yield Document(page_content=page.text, metadata=page.metadata)
+            else:
+                parts, _ = _load_file(path, file_hash)
+                count = len(parts)
+                for text, metadata in parts:
+                    yield Document(page_content=text, metadata=metadata)
+            _record(report, path, time.perf_counter() - start, count)
+        except Exception as e:
+            report.failed[path] = str(e)
+            log.error("Failed loading document", path=path, error=str(e))
+    log.info("Documents loaded", files=report.loaded, failed=len(report.failed),
+             skipped=len(report.skipped),
+             pooled=pooled, file_seconds=round(sum(report.seconds.values()), 3))
+
+
+def load_documents(paths: Iterable[Path], file_hashes: Optional[Dict[str, str]] = None,
+                   report: Optional[LoadReport] = None) -> List[Document]:
+    '''Load pdf/docx/txt files into LangChain Documents (see iter_documents).
+    Raises only when no file could be loaded at all.
+    '''
+    report = report if report is not None else LoadReport()
+    try:
+        docs = list(iter_documents(paths, file_hashes=file_hashes, report=report))
+    except Exception as e:
+        log.error("Failed loading documents", error=str(e))
+        raise DocumentPortalException("Error loading documents", sys)
+    if report.failed and not report.loaded:
+        error = next(iter(report.failed.values()))
+        raise DocumentPortalException(f"Error loading documents: {error}", sys)
+    return docs
+
+
+def concat_for_analysis(docs: List[Document]) -> str:
+    '''Join documents into a single text, tagging each part with its source'''
+    parts = []
+    for d in docs:
+        src = d.metadata.get("source") or d.metadata.get("file_path") or "unknown"
+        parts.append(f"\n--- SOURCE: {src} ---\n{d.page_content}")
+    return "\n".join(parts)
+
+
+def concat_for_comparison(ref_docs: List[Document], act_docs: List[Document]) -> str:
+    '''Join reference and actual documents into the comparison prompt input'''
+    left = concat_for_analysis(ref_docs)
+    right = concat_for_analysis(act_docs)
+    return f"<<REFERENCE_DOCUMENTS>>\n{left}\n\n<<ACTUAL_DOCUMENTS>>\n{right}"
@@ -0,0 +1,347 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger.custom_logger import CustomLogger
+from utils.metrics import record_cache
+from utils.concurrency import run_blocking
+from exception.custom_exception import DocumentPortalException
+
+
+class EmbeddingStore:
+    """Content-addressed float32 vector store for one (model, dimension) namespace.
+
+    Vectors live in a memory-mapped array (vectors.f32, one row per slot) and a small
+    SQLite table maps text keys to slots and tracks last access for LRU eviction.
+    The store is shared by all workers on the same cache_dir. Inserts and evictions run in
+    BEGIN IMMEDIATE transactions (SQLite's cross-process write lock), so slots are handed
+    out once. Lookups read a WAL snapshot without that lock: an eviction commits (and bumps
+    the evictions counter) before its slots are rewritten, so a lookup that saw the counter
+    change while copying vectors reads again under the lock. last_access is updated in
+    batches, at most every touch_interval_s.
+    """
+
+    def __init__(self, store_dir: Path, dim: int, max_entries: int, evict_fraction: float = 0.05,
+                 touch_interval_s: float = 60.0):
+        self.log = CustomLogger().get_logger(__name__)
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.max_entries = max(1, max_entries)
+        self.evict_batch = max(1, int(self.max_entries * evict_fraction))
+        self.touch_interval_s = touch_interval_s
+        self._lock = threading.RLock()
+        self._touched: Dict[str, float] = {}
+        self._last_touch = time.time()
+
+        self.vectors_path = self.store_dir / "vectors.f32"
+        ## autocommit mode: transactions are opened explicitly by _transaction
+        self.db = sqlite3.connect(str(self.store_dir / "index.sqlite"), check_same_thread=False,
+                                  timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, "
+                        "slot INTEGER NOT NULL, last_access REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        with self._lock, self._transaction():
+            self._ensure_capacity(max(self._next_slot(), 1024))
+
+    @contextmanager
+    def _transaction(self):
+        '''Write transaction, exclusive across processes for its whole duration'''
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def _meta(self, name: str) -> int:
+        ## read inside the transaction every time: other processes write too
+        row = self.db.execute("SELECT value FROM meta WHERE name=?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _next_slot(self) -> int:
+        return self._meta("next_slot")
+
+    def _ensure_capacity(self, n_slots: int):
+        '''Map at least n_slots rows: remap the file if another process grew it, else grow it
+        (doubling, capped at max_entries). Called inside a transaction, so growth never races.
+        '''
+        if n_slots <= self._capacity:
+            return
+        row_bytes = self.dim * 4
+        on_disk = (os.path.getsize(self.vectors_path) // row_bytes
+                   if self.vectors_path.exists() else 0)
+        capacity = on_disk
+        if capacity < n_slots:
+            capacity = max(capacity, 1024)
+            while capacity < n_slots:
+                capacity *= 2
+            capacity = min(max(capacity, n_slots), self.max_entries)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def _select(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        ## stay below SQLite's bound parameter limit
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            rows = self.db.execute(f"SELECT key, slot FROM entries WHERE key IN ({marks})",
+                                   batch).fetchall()
+            if rows:
+                ## slots past the mapped size were allocated by another process
+                self._ensure_capacity(max(slot for _, slot in rows) + 1)
+            for key, slot in rows:
+                found[key] = np.array(self._vectors[slot])
+        return found
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        '''Batched lookup, returns only the keys that are present'''
+        if not keys:
+            return {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            ## deferred: a read snapshot, other workers keep reading and writing
+            self.db.execute("BEGIN")
+            try:
+                evictions = self._meta("evictions")
+                found = self._select(unique)
+            finally:
+                self.db.execute("COMMIT")
+            if found and self._meta("evictions") != evictions:
+                ## slots may have been reused while the vectors were copied
+                with self._transaction():
+                    found = self._select(unique)
+            now = time.time()
+            self._touched.update((k, now) for k in found)
+            if now - self._last_touch >= self.touch_interval_s:
+                with self._transaction():
+                    self._flush_access()
+        return found
+
+    def _flush_access(self):
+        '''Write the buffered last_access times; called inside a transaction'''
+        if self._touched:
+            self.db.executemany("UPDATE entries SET last_access=? WHERE key=?",
+                                [(t, k) for k, t in self._touched.items()])
+            self._touched = {}
+        self._last_touch = time.time()
+
+    def _allocate(self, n: int, partial: bool = False) -> Optional[List[int]]:
+        '''Free or never used slots; None when fewer than n are left, unless partial.
+        Called inside a transaction.
+        '''
+        rows = self.db.execute("SELECT slot FROM free_slots LIMIT ?", (n,)).fetchall()
+        slots = [r[0] for r in rows]
+        next_slot = self._next_slot()
+        fresh = max(0, min(n - len(slots), self.max_entries - next_slot))
+        if len(slots) + fresh < n and not partial:
+            return None
+        if slots:
+            self.db.executemany("DELETE FROM free_slots WHERE slot=?", [(s,) for s in slots])
+        slots.extend(range(next_slot, next_slot + fresh))
+        self.db.execute("INSERT OR REPLACE INTO meta(name, value) VALUES ('next_slot', ?)",
+                        (next_slot + fresh,))
+        return slots
+
+    def _evict(self, n: int):
+        '''Free the slots of the n least recently used entries, committed before any slot
+        is rewritten'''
+        with self._transaction():
+            self._flush_access()
+            victims = self.db.execute("SELECT key, slot FROM entries ORDER BY last_access LIMIT ?",
+                                      (n,)).fetchall()
+            self.db.executemany("DELETE FROM entries WHERE key=?", [(k,) for k, _ in victims])
+            self.db.executemany("INSERT OR IGNORE INTO free_slots(slot) VALUES (?)",
+                                [(s,) for _, s in victims])
+            self.db.execute("INSERT INTO meta(name, value) VALUES ('evictions', 1) "
+                            "ON CONFLICT(name) DO UPDATE SET value=value+1")
+        self.log.info("Embedding cache evicted entries", evicted=len(victims),
+                      store=str(self.store_dir))
+
+    def put_many(self, items: Dict[str, List[float]]):
+        '''Insert vectors for keys not yet stored'''
+        if not items:
+            return
+        keys = list(items)
+        with self._lock:
+            for attempt in range(2):
+                ## keys are re-checked and slots allocated and written under one cross-process lock
+                with self._transaction():
+                    self._flush_access()
+                    existing = set()
+                    for i in range(0, len(keys), 500):
+                        batch = keys[i:i + 500]
+                        marks = ",".join("?" * len(batch))
+                        rows = self.db.execute(
+                            f"SELECT key FROM entries WHERE key IN ({marks})", batch)
+                        existing.update(r[0] for r in rows)
+                    new_keys = [k for k in keys if k not in existing][:self.max_entries]
+                    if not new_keys:
+                        return
+                    slots = self._allocate(len(new_keys), partial=attempt > 0)
+                    if slots is not None:
+                        new_keys = new_keys[:len(slots)]
+                        if not new_keys:
+                            return
+                        self._ensure_capacity(max(slots) + 1)
+                        self._vectors[slots] = np.asarray([items[k] for k in new_keys],
+                                                          dtype=np.float32)
+                        self._vectors.flush()
+                        now = time.time()
+                        self.db.executemany("INSERT OR REPLACE INTO entries"
+                                            "(key, slot, last_access) VALUES (?,?,?)",
+                                            [(k, s, now) for k, s in zip(new_keys, slots)])
+                        return
+                ## full: evict least recently used entries, then allocate again
+                self._evict(max(len(new_keys), self.evict_batch))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        '''Write pending access times'''
+        with self._lock:
+            if self._touched:
+                with self._transaction():
+                    self._flush_access()
+            if self._vectors is not None:
+                self._vectors.flush()
+            self.db.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from a local EmbeddingStore.
+
+    Keys are sha256(model name, dimension, kind, text); embed_documents sends only the
+    cache misses upstream, in one batch.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache_dir: str,
+                 dimensions: Optional[int] = None, max_size_mb: int = 1024):
+        self.log = CustomLogger().get_logger(__name__)
+        self.underlying = underlying
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.max_size_mb = max_size_mb
+        self.root = Path(cache_dir) / re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._store: Optional[EmbeddingStore] = None
+        ## with an unknown dimension reuse the namespace already on disk, if there is exactly one
+        if self.dimensions is None and self.root.is_dir():
+            dims = [int(p.name) for p in self.root.iterdir() if p.is_dir() and p.name.isdigit()]
+            if len(dims) == 1:
+                self.dimensions = dims[0]
+        if self.dimensions is not None:
+            self._open_store(self.dimensions)
+
+    def _open_store(self, dim: int) -> EmbeddingStore:
+        if self._store is None:
+            max_entries = max(1, (self.max_size_mb * 1024 * 1024) // (dim * 4))
+            self._store = EmbeddingStore(self.root / str(dim), dim, max_entries)
+            self.dimensions = dim
+        return self._store
+
+    def _key(self, kind: str, text: str) -> str:
+        raw = f"{self.model_name}\x00{self.dimensions}\x00{kind}\x00{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _lookup(self, kind: str, texts: List[str]):
+        keys = [self._key(kind, t) for t in texts]
+        found = self._store.get_many(keys) if self._store is not None else {}
+        missing = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in found))
+        misses = sum(1 for k in keys if k not in found)
+        with self._lock:
+            self.hits += len(texts) - misses
+            self.misses += misses
+        record_cache(f"embedding_{kind}", hits=len(texts) - misses, misses=misses)
+        return keys, found, missing
+
+    def _store_results(self, kind: str, texts: List[str],
+                       vectors: List[List[float]]) -> Dict[str, np.ndarray]:
+        if not vectors:
+            return {}
+        store = self._open_store(len(vectors[0]))
+        items = {self._key(kind, t): v for t, v in zip(texts, vectors)}
+        store.put_many(items)
+        return {k: np.asarray(v, dtype=np.float32) for k, v in items.items()}
+
+    def _assemble(self, kind, texts, missing, vectors, found) -> List[List[float]]:
+        found.update(self._store_results(kind, missing, vectors))
+        ## keys change if the dimension was learned from this batch
+        return [found[self._key(kind, t)].tolist() for t in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            _, found, missing = self._lookup("doc", texts)
+            vectors = self.underlying.embed_documents(missing) if missing else []
+            return self._assemble("doc", texts, missing, vectors, found)
+        except Exception as e:
+            self.log.error("Cached embed_documents failed", error=str(e))
+            raise DocumentPortalException("Cached embed_documents failed", sys)
+
+    def embed_query(self, text: str) -> List[float]:
+        try:
+            _, found, missing = self._lookup("query", [text])
+            vectors = [self.underlying.embed_query(text)] if missing else []
+            return self._assemble("query", [text], missing, vectors, found)[0]
+        except Exception as e:
+            self.log.error("Cached embed_query failed", error=str(e))
+            raise DocumentPortalException("Cached embed_query failed", sys)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            ## store reads and writes take SQLite locks and msync: off the event loop
+            _, found, missing = await run_blocking(self._lookup, "doc", texts)
+            vectors = await self.underlying.aembed_documents(missing) if missing else []
+            return await run_blocking(self._assemble, "doc", texts, missing, vectors, found)
+        except Exception as e:
+            self.log.error("Cached aembed_documents failed", error=str(e))
+            raise DocumentPortalException("Cached aembed_documents failed", sys)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        try:
+            _, found, missing = await run_blocking(self._lookup, "query", [text])
+            vectors = [await self.underlying.aembed_query(text)] if missing else []
+            return (await run_blocking(self._assemble, "query", [text], missing, vectors, found))[0]
+        except Exception as e:
+            self.log.error("Cached aembed_query failed", error=str(e))
+            raise DocumentPortalException("Cached aembed_query failed", sys)
+
+    def stats(self) -> Dict[str, float]:
+        '''Hit/miss counters of this process and the number of stored vectors'''
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self._store) if self._store is not None else 0,
+        }
@@ -0,0 +1,220 @@
+import os
+import re
+import pickle
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:     ## Windows: no advisory locks, single worker deployments only
+    fcntl = None
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from utils.config_loader import load_config
+
+## index built until a trainable index has enough vectors to be trained
+FALLBACK_FACTORY = "Flat"
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+LOCK_FILE = ".index.lock"
+
+
+def index_settings() -> Dict[str, Any]:
+    '''faiss_db settings: index_factory (FAISS factory string) and optional min_train_vectors'''
+    cfg = load_config().get("faiss_db") or {}
+    return {
+        "index_factory": str(cfg.get("index_factory") or FALLBACK_FACTORY),
+        "min_train_vectors": cfg.get("min_train_vectors"),
+        "load_mode": str(cfg.get("load_mode") or "mmap"),
+    }
+
+
+def needs_training(factory: str) -> bool:
+    '''True if the index factory has to be trained before vectors are added'''
+    return bool(re.search(r"IVF|PQ|SQ\d", factory))
+
+
+def supports_remove(factory: str) -> bool:
+    '''HNSW graphs cannot drop vectors; deleting from them means rebuilding the index'''
+    return "HNSW" not in factory
+
+
+def is_lossless(factory: str) -> bool:
+    '''True if stored vectors can be reconstructed exactly (no PQ/SQ compression)'''
+    return not re.search(r"PQ|SQ", factory)
+
+
+def min_train_vectors(factory: str, configured: Optional[int] = None) -> int:
+    '''Vectors needed before factory can be trained: FAISS wants ~39 points per k-means
+    centroid (IVF lists, 256 PQ codewords); scalar quantizers only learn value ranges.
+    '''
+    if configured:
+        return int(configured)
+    if not needs_training(factory):
+        return 0
+    need = 39 * 256 if "PQ" in factory else 256
+    ivf = re.search(r"IVF(\d+)", factory)
+    if ivf:
+        need = max(need, 39 * int(ivf.group(1)))
+    return need
+
+
+def effective_factory(factory: str, n_vectors: int, configured_min: Optional[int] = None) -> str:
+    '''The configured factory, or Flat while there are too few vectors to train it'''
+    if n_vectors < min_train_vectors(factory, configured_min):
+        return FALLBACK_FACTORY
+    return factory
+
+
+def build_index(factory: str, vectors: np.ndarray) -> faiss.Index:
+    '''Create, train (if required) and fill an index; row i of vectors gets FAISS id i'''
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        index.add(vectors)
+    return index
+
+
+def stored_vectors(vs: FAISS, factory: str, embeddings: Embeddings) -> np.ndarray:
+    '''Vectors currently in a store, in FAISS id order.
+    Lossless indexes are reconstructed in place; compressed ones are re-embedded from the
+    docstore texts (served by the embedding cache when it is enabled).
+    '''
+    n = vs.index.ntotal
+    if n == 0:
+        return np.zeros((0, vs.index.d), dtype=np.float32)
+    if is_lossless(factory):
+        ivf = faiss.try_extract_index_ivf(vs.index)
+        if ivf is not None:
+            ivf.make_direct_map()
+        return vs.index.reconstruct_n(0, n)
+    texts = [vs.docstore.search(vs.index_to_docstore_id[i]).page_content for i in range(n)]
+    return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def rebuild_store(vs: FAISS, factory: str, current_factory: str, embeddings: Embeddings,
+                  drop_ids: Optional[List[str]] = None) -> FAISS:
+    '''Rebuild a store under factory, optionally without the documents in drop_ids'''
+    drop = set(drop_ids or [])
+    vectors = stored_vectors(vs, current_factory, embeddings)
+    keep = [i for i in range(len(vectors)) if vs.index_to_docstore_id[i] not in drop]
+    doc_ids = [vs.index_to_docstore_id[i] for i in keep]
+    docs = {doc_id: vs.docstore.search(doc_id) for doc_id in doc_ids}
+    kept = vectors[keep] if keep else np.zeros((0, vs.index.d), dtype=np.float32)
+    index = build_index(factory, kept)
+    return FAISS(embeddings, index, InMemoryDocstore(docs), dict(enumerate(doc_ids)))
+
+
+def new_store(factory: str, embeddings: Embeddings, texts: List[str], vectors: List[List[float]],
+              metadatas: List[dict], ids: List[str]) -> FAISS:
+    '''Store built with the given factory from precomputed vectors'''
+    arr = np.asarray(vectors, dtype=np.float32)
+    index = build_index(factory, arr)
+    docs = {i: Document(page_content=t, metadata=m) for t, m, i in zip(texts, metadatas, ids)}
+    return FAISS(embeddings, index, InMemoryDocstore(docs), dict(enumerate(ids)))
+
+
+def apply_search_params(vs: FAISS, params: Optional[Dict[str, Any]] = None) -> FAISS:
+    '''Set search-time knobs (nprobe for IVF, efSearch for HNSW) that apply to the index type'''
+    params = params or {}
+    ps = faiss.ParameterSpace()
+    knobs = {"nprobe": params.get("nprobe"), "efSearch": params.get("ef_search")}
+    for name, value in knobs.items():
+        if value is None:
+            continue
+        if name == "nprobe" and faiss.try_extract_index_ivf(vs.index) is None:
+            continue
+        if name == "efSearch" and not _has_hnsw(vs.index):
+            continue
+        ps.set_index_parameter(vs.index, name, int(value))
+    return vs
+
+
+def _has_hnsw(index: faiss.Index) -> bool:
+    index = faiss.downcast_index(index)
+    return hasattr(index, "hnsw")
+
+
+def search_params(retriever_cfg: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    '''Search knobs from the retriever config block'''
+    cfg = retriever_cfg if retriever_cfg is not None else (load_config().get("retriever") or {})
+    return {"nprobe": cfg.get("nprobe"), "ef_search": cfg.get("ef_search")}
+
+
+@contextmanager
+def index_lock(index_dir, exclusive: bool = False, blocking: bool = True):
+    '''Advisory lock shared by all workers: writers hold it exclusively while replacing
+    index files, readers hold it shared while opening them, so nobody sees a half-written pair.
+    With blocking=False a held lock raises BlockingIOError instead of waiting.
+    '''
+    if fcntl is None:
+        yield
+        return
+    path = Path(index_dir) / LOCK_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+", encoding="utf-8") as f:
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        fcntl.flock(f.fileno(), mode | (0 if blocking else fcntl.LOCK_NB))
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def index_signature(index_dir) -> Optional[Tuple[int, int]]:
+    '''(inode, mtime) of the index file; changes whenever a writer replaces it'''
+    try:
+        st = os.stat(Path(index_dir) / INDEX_FILE)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def save_store(vs: FAISS, index_dir):
+    '''Write index.faiss/index.pkl (LangChain's save_local layout) to temp files and rename
+    them into place. Readers that memory-mapped the old file keep its inode until they reload.
+    Call under index_lock(exclusive=True).
+    '''
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    tmp_index = index_dir / f"{INDEX_FILE}.{os.getpid()}.tmp"
+    tmp_docs = index_dir / f"{DOCSTORE_FILE}.{os.getpid()}.tmp"
+    faiss.write_index(vs.index, str(tmp_index))
+    with open(tmp_docs, "wb") as f:
+        pickle.dump((vs.docstore, vs.index_to_docstore_id), f)
+    os.replace(tmp_docs, index_dir / DOCSTORE_FILE)
+    os.replace(tmp_index, index_dir / INDEX_FILE)
+
+
+def _read_index(path: str, mmap: bool) -> faiss.Index:
+    if not mmap:
+        return faiss.read_index(path)
+    ## flat codes (Flat, HNSW storage, SQ) need MMAP_IFC, IVF inverted lists need MMAP
+    try:
+        flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+def load_store(index_dir, embeddings: Embeddings, mmap: bool = False,
+               locked: bool = False) -> FAISS:
+    '''Load a saved store. With mmap=True the vectors stay in the OS page cache, shared by
+    every worker process, and the index is read-only (use mmap=False to modify it).
+    locked: the caller already holds index_lock (a writer reloading under its exclusive lock).
+    '''
+    index_dir = Path(index_dir)
+    with (nullcontext() if locked else index_lock(index_dir)):
+        index = _read_index(str(index_dir / INDEX_FILE), mmap)
+        with open(index_dir / DOCSTORE_FILE, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
@@ -0,0 +1,138 @@
+import time
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils.tokens import count_tokens
+
+
+class DeterministicEmbeddings(Embeddings):
+    """Offline stand-in for a remote embedding model.
+    
+    Vectors are derived from a hash of the text, so equal texts always get equal
+    vectors; `texts_embedded` counts how many texts reached the model. Each request
+    costs `latency_s` plus texts / `texts_per_second` (0 means instant).
+    """
+
+    def __init__(self, size: int = 64, latency_s: float = 0.0, texts_per_second: float = 0.0):
+        self.size = size
+        self.latency_s = latency_s
+        self.texts_per_second = texts_per_second
+        self.texts_embedded = 0
+
+    def _request_seconds(self, n_texts: int) -> float:
+        return self.latency_s + (n_texts / self.texts_per_second if self.texts_per_second else 0.0)
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vec = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vec / np.linalg.norm(vec)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.texts_embedded += len(texts)
+        time.sleep(self._request_seconds(len(texts)))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.texts_embedded += 1
+        time.sleep(self._request_seconds(1))
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.texts_embedded += len(texts)
+        await asyncio.sleep(self._request_seconds(len(texts)))
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.texts_embedded += 1
+        await asyncio.sleep(self._request_seconds(1))
+        return self._vector(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline stand-in chat model with a simple latency model.
+    
+    Each call costs `latency_s`, plus prompt tokens / `prompt_tokens_per_second` (prefill)
+    plus reply tokens / `tokens_per_second` (generation); a rate of 0 means instant.
+    `responder` maps the rendered prompt text to the reply.
+    """
+
+    responder: Callable[[str], str] = lambda prompt: "ok"
+    latency_s: float = 0.0
+    prompt_tokens_per_second: float = 0.0
+    tokens_per_second: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @staticmethod
+    def _prompt_text(messages: List[BaseMessage]) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _prefill_seconds(self, prompt: str) -> float:
+        seconds = self.latency_s
+        if self.prompt_tokens_per_second:
+            seconds += count_tokens(prompt) / self.prompt_tokens_per_second
+        return seconds
+
+    def _token_seconds(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _reply_tokens(self, reply: str) -> List[str]:
+        ## whitespace delimited pieces, whitespace kept so the chunks join back to the reply
+        pieces: List[str] = []
+        for word in reply.split(" "):
+            pieces.append(word if not pieces else " " + word)
+        return pieces
+
+    def _reply_seconds(self, prompt: str, reply: str) -> float:
+        reply_tokens = len(self._reply_tokens(reply))
+        return self._prefill_seconds(prompt) + self._token_seconds() * reply_tokens
+
+    def _respond(self, messages: List[BaseMessage]):
+        self.calls += 1
+        prompt = self._prompt_text(messages)
+        return prompt, self.responder(prompt)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt, reply = self._respond(messages)
+        time.sleep(self._reply_seconds(prompt, reply))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt, reply = self._respond(messages)
+        await asyncio.sleep(self._reply_seconds(prompt, reply))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        prompt, reply = self._respond(messages)
+        time.sleep(self._prefill_seconds(prompt))
+        for token in self._reply_tokens(reply):
+            time.sleep(self._token_seconds())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        prompt, reply = self._respond(messages)
+        await asyncio.sleep(self._prefill_seconds(prompt))
+        for token in self._reply_tokens(reply):
+            await asyncio.sleep(self._token_seconds())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,136 @@
+import os
+import re
+import sys
+import uuid
+import hashlib
+from pathlib import Path
+from datetime import datetime
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+
+log = CustomLogger().get_logger(__name__)
+
+
+## session ids name directories: letters, digits, "_" and "-" only,
+## so never a separator, "." or ".."
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,127}$")
+
+
+class InvalidSessionIdError(ValueError):
+    """A client supplied session id that is not safe as a directory name"""
+
+
+def validate_session_id(session_id: str) -> str:
+    '''Return session_id, raise InvalidSessionIdError unless it matches SESSION_ID_RE'''
+    if not isinstance(session_id, str) or not SESSION_ID_RE.match(session_id):
+        raise InvalidSessionIdError(f"Invalid session id: {session_id!r}")
+    return session_id
+
+
+def new_session_id(prefix: str = "session") -> str:
+    '''Generate a unique, time ordered session id'''
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    '''SHA-256 of a file's content, read in fixed size chunks'''
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadTooLargeError(ValueError):
+    """An upload exceeded the configured size limit"""
+
+
+@dataclass
+class SavedFile:
+    """A file written to disk with the content hash computed while writing it"""
+    path: Path
+    sha256: str
+    size: int
+
+
+@lru_cache(maxsize=1)
+def _upload_limits():
+    cfg = load_config().get("uploads") or {}
+    max_bytes = int(cfg.get("max_file_mb", 200)) * 1024 * 1024
+    chunk_size = int(cfg.get("chunk_size_kb", 1024)) * 1024
+    return max_bytes, chunk_size
+
+
+def _iter_blocks(uploaded_file, chunk_size: int) -> Iterator[bytes]:
+    '''Read an upload in fixed size blocks: from .stream() when available, else from .getbuffer()'''
+    if hasattr(uploaded_file, "stream"):
+        src = uploaded_file.stream()
+        yield from iter(lambda: src.read(chunk_size), b"")
+    else:
+        buf = memoryview(uploaded_file.getbuffer())
+        for start in range(0, len(buf), chunk_size):
+            yield buf[start:start + chunk_size]
+
+
+def save_upload(uploaded_file, target_path: Path, max_bytes: Optional[int] = None) -> SavedFile:
+    '''Copy an upload to target_path in fixed size chunks, hashing it in the same pass.
+    Peak memory is one chunk whatever the file size; files over max_bytes are rejected
+    up front when their size is declared, otherwise as soon as the limit is crossed.
+    '''
+    default_max, chunk_size = _upload_limits()
+    max_bytes = default_max if max_bytes is None else max_bytes
+    name = os.path.basename(getattr(uploaded_file, "name", "file"))
+    declared = getattr(uploaded_file, "size", None)
+    if max_bytes and declared is not None and declared > max_bytes:
+        raise UploadTooLargeError(f"{name} is {declared} bytes, limit is {max_bytes} bytes")
+
+    target_path = Path(target_path)
+    tmp = target_path.with_name(target_path.name + ".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as out:
+            for block in _iter_blocks(uploaded_file, chunk_size):
+                size += len(block)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLargeError(
+                        f"{name} exceeds the upload limit of {max_bytes} bytes")
+                digest.update(block)
+                out.write(block)
+        os.replace(tmp, target_path)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    return SavedFile(target_path, digest.hexdigest(), size)
+
+
+def save_uploaded_file(uploaded_files: Iterable, target_dir: Path) -> List[SavedFile]:
+    '''Stream uploaded files into target_dir, returning their paths and content hashes'''
+    try:
+        target_dir = Path(target_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        saved: List[SavedFile] = []
+        for uf in uploaded_files:
+            name = os.path.basename(getattr(uf, "name", "file"))
+            ext = Path(name).suffix.lower()
+            if ext not in SUPPORTED_EXTENSIONS:
+                log.warning("Unsupported file skipped", filename=name)
+                continue
+            saved_file = save_upload(uf, target_dir / name)
+            saved.append(saved_file)
+            log.info("File saved for ingestion", filename=name, saved_as=str(saved_file.path),
+                     size=saved_file.size, sha256=saved_file.sha256)
+        return saved
+    except UploadTooLargeError:
+        raise
+    except Exception as e:
+        log.error("Failed to save uploaded files", error=str(e))
+        raise DocumentPortalException("Failed to save uploaded files", sys)
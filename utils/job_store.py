@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+
+## job lifecycle
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised from a job's progress checkpoint once it has been cancelled."""
+
+
+class JobStore:
+    """Persistent job records and per-job result streams in SQLite.
+
+    Job status and results are shared through the database, so any uvicorn worker can
+    answer a poll. Queued jobs (enqueue/claim) are picked up by whichever worker claims
+    them first, one running job per session key at a time.
+    """
+
+    def __init__(self, db_path: str):
+        self.log = CustomLogger().get_logger(__name__)
+        self._lock = threading.Lock()
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, "
+                            "kind TEXT NOT NULL, status TEXT NOT NULL, "
+                            "total INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0, "
+                            "failed INTEGER NOT NULL DEFAULT 0, progress TEXT, error TEXT, "
+                            "created REAL NOT NULL, updated REAL NOT NULL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS job_results "
+                            "(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                            "job_id TEXT NOT NULL, item TEXT NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_job_results_job "
+                            "ON job_results(job_id, id)")
+            ## queue columns, added in place to stores created before the queue existed
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+            added = (("session_key", "TEXT"), ("payload", "TEXT"),
+                     ("cancel_requested", "INTEGER NOT NULL DEFAULT 0"))
+            for name, ddl in added:
+                if name not in columns:
+                    self.db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {ddl}")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue "
+                            "ON jobs(kind, status, created)")
+            self.db.commit()
+        except Exception as e:
+            self.log.error("Failed to open job store", error=str(e), db_path=db_path)
+            raise DocumentPortalException("Failed to open job store", sys)
+
+    def create(self, kind: str, total: int = 0, status: str = QUEUED) -> str:
+        '''Insert a new job and return its id'''
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self.db.execute("INSERT INTO jobs(id, kind, status, total, progress, created, updated) "
+                            "VALUES (?,?,?,?,?,?,?)",
+                            (job_id, kind, status, total, json.dumps({}), now, now))
+            self.db.commit()
+        self.log.info("Job created", job_id=job_id, kind=kind, total=total)
+        return job_id
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], session_key: Optional[str] = None,
+                total: int = 0) -> str:
+        '''Queue a job for the worker pool; jobs sharing a session_key never run concurrently'''
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self.db.execute("INSERT INTO jobs(id, kind, status, total, progress, created, updated, "
+                            "session_key, payload) VALUES (?,?,?,?,?,?,?,?,?)",
+                            (job_id, kind, QUEUED, total, json.dumps({}), now, now, session_key,
+                             json.dumps(payload)))
+            self.db.commit()
+        self.log.info("Job queued", job_id=job_id, kind=kind, session_key=session_key)
+        return job_id
+
+    def claim(self, kind: str, stale_after_s: float) -> Optional[Dict[str, Any]]:
+        '''Atomically mark the oldest runnable job of kind as running and return it (with
+        payload). Running jobs without a progress update for stale_after_s (their worker died)
+        are runnable again.
+        '''
+        now = time.time()
+        stale = now - stale_after_s
+        with self._lock:
+            ## IMMEDIATE: the write lock is taken up front, so two workers cannot claim the same job
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT id, payload FROM jobs j WHERE kind=? AND "
+                    "(status=? OR (status=? AND updated<?)) AND cancel_requested=0 AND "
+                    "(session_key IS NULL OR NOT EXISTS (SELECT 1 FROM jobs r "
+                    "WHERE r.kind=j.kind AND r.status=? AND r.updated>=? "
+                    "AND r.session_key=j.session_key AND r.id<>j.id)) "
+                    "ORDER BY created LIMIT 1",
+                    (kind, QUEUED, RUNNING, stale, RUNNING, stale)).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE jobs SET status=?, updated=? WHERE id=?",
+                                    (RUNNING, now, row[0]))
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+        if row is None:
+            return None
+        job = self.get(row[0])
+        job["payload"] = json.loads(row[1] or "{}")
+        return job
+
+    def active_session_keys(self, kind: str) -> List[str]:
+        '''Session keys of queued or running jobs of kind'''
+        with self._lock:
+            rows = self.db.execute("SELECT DISTINCT session_key FROM jobs WHERE kind=? "
+                                   "AND status IN (?,?) AND session_key IS NOT NULL",
+                                   (kind, QUEUED, RUNNING)).fetchall()
+        return [row[0] for row in rows]
+
+    def request_cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        '''Cancel a queued job now; flag a running one so its worker stops at the next checkpoint'''
+        with self._lock:
+            now = time.time()
+            self.db.execute("UPDATE jobs SET status=?, updated=? WHERE id=? AND status=?",
+                            (CANCELLED, now, job_id, QUEUED))
+            self.db.execute("UPDATE jobs SET cancel_requested=1, updated=? WHERE id=? AND status=?",
+                            (now, job_id, RUNNING))
+            self.db.commit()
+        return self.get(job_id)
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        '''True if a cancel was requested for the job'''
+        with self._lock:
+            row = self.db.execute("SELECT cancel_requested FROM jobs WHERE id=?",
+                                  (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None):
+        '''Set the job status, keeping the previous error unless a new one is given'''
+        with self._lock:
+            self.db.execute("UPDATE jobs SET status=?, error=COALESCE(?, error), updated=? "
+                            "WHERE id=?",
+                            (status, error, time.time(), job_id))
+            self.db.commit()
+
+    def heartbeat(self, job_id: str):
+        '''Mark a queued or running job as alive without changing its progress'''
+        with self._lock:
+            self.db.execute("UPDATE jobs SET updated=? WHERE id=? AND status IN (?,?)",
+                            (time.time(), job_id, QUEUED, RUNNING))
+            self.db.commit()
+
+    def fail_stale(self, kind: str, stale_after_s: float, error: str) -> int:
+        '''Mark queued or running jobs of kind without an update for stale_after_s as failed;
+        returns their count. For jobs that are not claimed from the queue, whose worker runs
+        them to completion or not at all.
+        '''
+        now = time.time()
+        with self._lock:
+            cursor = self.db.execute("UPDATE jobs SET status=?, error=?, updated=? "
+                                     "WHERE kind=? AND status IN (?,?) AND updated<?",
+                                     (FAILED, error, now, kind, QUEUED, RUNNING,
+                                      now - stale_after_s))
+            self.db.commit()
+        if cursor.rowcount:
+            self.log.warning("Stale jobs marked failed", kind=kind, jobs=cursor.rowcount)
+        return cursor.rowcount
+
+    def set_progress(self, job_id: str, **progress: Any):
+        '''Merge stage counters into the job's progress record'''
+        with self._lock:
+            row = self.db.execute("SELECT progress FROM jobs WHERE id=?", (job_id,)).fetchone()
+            merged = {**json.loads(row[0] or "{}"), **progress} if row else progress
+            self.db.execute("UPDATE jobs SET progress=?, updated=? WHERE id=?",
+                            (json.dumps(merged), time.time(), job_id))
+            self.db.commit()
+
+    def add_result(self, job_id: str, item: Dict[str, Any], failed: bool = False):
+        '''Append one finished item and count it as done (or failed)'''
+        with self._lock:
+            self.db.execute("INSERT INTO job_results(job_id, item) VALUES (?,?)",
+                            (job_id, json.dumps(item, ensure_ascii=False)))
+            column = "failed" if failed else "done"
+            self.db.execute(f"UPDATE jobs SET {column}={column}+1, updated=? WHERE id=?",
+                            (time.time(), job_id))
+            self.db.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        '''The job row as a dict, or None if unknown'''
+        with self._lock:
+            row = self.db.execute("SELECT id, kind, status, total, done, failed, progress, error, "
+                                  "created, updated, session_key, cancel_requested FROM jobs "
+                                  "WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "kind", "status", "total", "done", "failed", "progress", "error",
+                "created", "updated", "session_key", "cancel_requested")
+        job = dict(zip(keys, row))
+        job["progress"] = json.loads(job["progress"] or "{}")
+        return job
+
+    def results(self, job_id: str, after: int = 0,
+                limit: int = 500) -> List[Tuple[int, Dict[str, Any]]]:
+        '''Results appended after result id `after`, oldest first'''
+        with self._lock:
+            rows = self.db.execute("SELECT id, item FROM job_results WHERE job_id=? AND id>? "
+                                   "ORDER BY id LIMIT ?", (job_id, after, limit)).fetchall()
+        return [(rid, json.loads(item)) for rid, item in rows]
+
+
+@lru_cache(maxsize=1)
+def get_job_store() -> JobStore:
+    '''Shared job store for the process (same database file for every worker)'''
+    cfg = load_config().get("jobs") or {}
+    return JobStore(os.getenv("JOB_STORE_PATH", cfg.get("path", "cache/jobs.sqlite")))
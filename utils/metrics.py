@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from utils.config_loader import load_config
+from utils.tokens import count_tokens
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Histogram
+except ImportError:
+    ## metrics are optional: without prometheus_client every instrument below is a no-op
+    prometheus_client = None
+
+ENABLED = prometheus_client is not None and bool(
+    (load_config().get("metrics") or {}).get("enabled", True))
+
+## stage latencies span sub-millisecond searches to multi-minute ingestion jobs
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+if ENABLED:
+    STAGE_SECONDS = Histogram("docportal_stage_seconds", "Duration of pipeline stages",
+                              ["component", "stage"], buckets=STAGE_BUCKETS)
+    HTTP_SECONDS = Histogram("docportal_http_request_seconds", "Duration of API requests",
+                             ["method", "route", "status"], buckets=STAGE_BUCKETS)
+    LLM_SECONDS = Histogram("docportal_llm_call_seconds", "Duration of LLM calls",
+                            ["model", "chain"], buckets=STAGE_BUCKETS)
+    LLM_CALLS = Counter("docportal_llm_calls_total", "LLM calls", ["model", "chain", "status"])
+    LLM_TOKENS = Counter("docportal_llm_tokens_total",
+                         "LLM tokens (usage reported by the provider, else estimated)",
+                         ["model", "chain", "kind"])
+    LLM_COST = Counter("docportal_llm_cost_usd_total",
+                       "Estimated LLM cost from the configured token prices",
+                       ["model", "chain"])
+    CACHE_EVENTS = Counter("docportal_cache_events_total", "Cache lookups", ["cache", "result"])
+else:
+    STAGE_SECONDS = HTTP_SECONDS = LLM_SECONDS = None
+    LLM_CALLS = LLM_TOKENS = LLM_COST = CACHE_EVENTS = None
+
+
+@contextmanager
+def span(component: str, stage: str):
+    '''Time a pipeline stage into docportal_stage_seconds{component, stage}'''
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(component, stage).observe(time.perf_counter() - start)
+
+
+def observe_stage(component: str, stage: str, seconds: float):
+    '''Record a stage duration measured elsewhere (e.g. inside a pool worker)'''
+    if ENABLED:
+        STAGE_SECONDS.labels(component, stage).observe(seconds)
+
+
+def observe_http(method: str, route: str, status: int, seconds: float):
+    '''Record the duration of one API request'''
+    if ENABLED:
+        HTTP_SECONDS.labels(method, route, str(status)).observe(seconds)
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0):
+    '''Count cache hits/misses (lookups of n keys count n times)'''
+    if not ENABLED:
+        return
+    if hits:
+        CACHE_EVENTS.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_EVENTS.labels(cache, "miss").inc(misses)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """LangChain callback recording latency, token usage and cost of every call of one LLM client.
+
+    The chain label is taken from the run's "chain:<name>" tag (set by ModelLoader.get_chain
+    and ConversationRAG), so rewrite, answer, map and reduce calls are told apart.
+    """
+
+    def __init__(self, model: str, input_cost_per_1m: float = 0.0, output_cost_per_1m: float = 0.0):
+        self.model = model
+        self.input_cost_per_1m = input_cost_per_1m
+        self.output_cost_per_1m = output_cost_per_1m
+        self._runs: Dict[UUID, Tuple[float, str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chain(tags: Optional[List[str]]) -> str:
+        ## innermost chain wins (tags are inherited from enclosing runs)
+        for tag in reversed(tags or []):
+            if tag.startswith("chain:"):
+                return tag[6:]
+        return "other"
+
+    def _start(self, run_id: UUID, tags: Optional[List[str]], prompts: Any):
+        with self._lock:
+            self._runs[run_id] = (time.perf_counter(), self._chain(tags), prompts)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID,
+                            tags: Optional[List[str]] = None, **kwargs):
+        self._start(run_id, tags, messages)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID,
+                     tags: Optional[List[str]] = None, **kwargs):
+        self._start(run_id, tags, prompts)
+
+    @staticmethod
+    def _usage(response: LLMResult) -> Optional[Tuple[int, int]]:
+        output = response.llm_output or {}
+        usage = output.get("token_usage") or output.get("usage")
+        if usage and "prompt_tokens" in usage:
+            return int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0)
+        prompt = completion = 0
+        found = False
+        for generations in response.generations:
+            for g in generations:
+                meta = getattr(getattr(g, "message", None), "usage_metadata", None)
+                if meta:
+                    found = True
+                    prompt += int(meta.get("input_tokens") or 0)
+                    completion += int(meta.get("output_tokens") or 0)
+        return (prompt, completion) if found else None
+
+    @staticmethod
+    def _estimate(prompts: Any, response: LLMResult) -> Tuple[int, int]:
+        '''Token counts from the text when the provider reports no usage'''
+        texts: List[str] = []
+        for p in prompts or []:
+            if isinstance(p, str):
+                texts.append(p)
+            else:
+                texts.extend(str(m.content) for m in p)
+        completion = "".join(g.text for generations in response.generations for g in generations)
+        return count_tokens("\n".join(texts)), count_tokens(completion)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None or not ENABLED:
+            return
+        start, chain, prompts = run
+        LLM_SECONDS.labels(self.model, chain).observe(time.perf_counter() - start)
+        LLM_CALLS.labels(self.model, chain, "ok").inc()
+        prompt_tokens, completion_tokens = (self._usage(response)
+                                            or self._estimate(prompts, response))
+        LLM_TOKENS.labels(self.model, chain, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(self.model, chain, "completion").inc(completion_tokens)
+        cost = (prompt_tokens * self.input_cost_per_1m
+                + completion_tokens * self.output_cost_per_1m) / 1e6
+        if cost:
+            LLM_COST.labels(self.model, chain).inc(cost)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None and ENABLED:
+            LLM_CALLS.labels(self.model, run[1], "error").inc()
+
+
+def render_latest() -> Tuple[bytes, str]:
+    '''Prometheus exposition of this process, or of all workers in multiprocess mode'''
+    if prometheus_client is None:
+        raise RuntimeError("prometheus_client is not installed")
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
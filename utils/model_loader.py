@@ -1,10 +1,16 @@
 import os
 import sys
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, Tuple
 from dotenv import load_dotenv
 
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from utils.config_loader import load_config
+from utils.embedding_cache import CachedEmbeddings
+from utils.fake_models import FakeChatModel, DeterministicEmbeddings
+from utils.metrics import LLMMetricsHandler
 
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
@@ -12,27 +18,85 @@ from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 
 
 
+## API key each provider needs; the offline "fake" provider needs none
+PROVIDER_API_KEYS = {
+    'openai': 'OPENAI_API_KEY',
+    'google': 'GOOGLE_API_KEY',
+    'groq': 'GROQ_API_KEY',
+    'fake': None,
+}
+
+
 class ModelLoader():
+    """A utility class to load embedding models and LLM models.
+    
+    Config, env validation and the model clients are process-wide: every ModelLoader
+    instance shares the same registry, so clients (and their pooled HTTP connections)
+    are built once per provider/model config and reused by every request.
+    """
+    ## process wide registry shared by all instances
+    _config: dict = {}
+    _api_keys: dict = {}
+    _clients: Dict[Tuple, Any] = {}
+    _chains: Dict[Tuple, Any] = {}
+    _lock = threading.RLock()
+
     def __init__(self):
-        """A utility class to load embedding models and LLM models.
-        """
         self.log = CustomLogger().get_logger(__name__)
-        load_dotenv()
-        ## check that environment variables are loaded
-        self._validate_env()
-        ## loading all the config
-        self.config = load_config()
-        ## logging success
-        self.log.info("Configuration loaded successfully", config_keys=list(self.config.keys()))
-    
-    def _validate_env(self):
+        with ModelLoader._lock:
+            if not ModelLoader._config:
+                load_dotenv()
+                ## loading all the config
+                config = load_config()
+                ## check that environment variables of the selected providers are loaded
+                self._validate_env(config)
+                ModelLoader._api_keys = self.api_keys
+                ModelLoader._config = config
+                ## logging success
+                self.log.info("Configuration loaded successfully",
+                              config_keys=list(ModelLoader._config.keys()))
+        self.config = ModelLoader._config
+        self.api_keys = ModelLoader._api_keys
+
+    @classmethod
+    def _get_or_create(cls, key: Tuple, factory: Callable[[], Any]) -> Any:
+        '''Return the registered object for key, building it once with factory'''
+        obj = cls._clients.get(key)
+        if obj is None:
+            with cls._lock:
+                obj = cls._clients.get(key)
+                if obj is None:
+                    obj = factory()
+                    cls._clients[key] = obj
+        return obj
+
+    @classmethod
+    def reset(cls):
+        '''Drop the cached config, clients and chains (e.g. after a config change)'''
+        with cls._lock:
+            cls._config = {}
+            cls._api_keys = {}
+            cls._clients.clear()
+            cls._chains.clear()
+        get_model_loader.cache_clear()
+
+    @staticmethod
+    def _providers(config: dict) -> Tuple[str, str]:
+        '''(llm provider, embedding provider) selected by env and config'''
+        llm_block = (config.get('llm') or {}).get(os.getenv('LLM_PROVIDER', 'openai')) or {}
+        embedding_provider = (os.getenv('EMBEDDING_PROVIDER')
+                              or config['embedding_model'].get('provider', 'openai'))
+        return llm_block.get('provider', os.getenv('LLM_PROVIDER', 'openai')), embedding_provider
+
+    def _validate_env(self, config: dict):
         '''A function to validate environment variable and ensures API key exists'''
-        ## first we will define all the keys which we know should be loaded
-        required_vars=['GOOGLE_API_KEY','GROQ_API_KEY','OPENAI_API_KEY']
+        ## only the keys of the providers in use are required (none for the offline fake provider)
+        required_vars = sorted({PROVIDER_API_KEYS.get(p, f"{p.upper()}_API_KEY")
+                                for p in self._providers(config)} - {None})
         ## get all the api keys from the environment
-        self.api_keys = {key:os.getenv(key) for key in required_vars}
+        self.api_keys = {key:os.getenv(key) for key in PROVIDER_API_KEYS.values() if key}
         ## list out any api key which are missing
-        missing = [k for k,v in self.api_keys.items() if not v]
+        missing = [k for k in required_vars if not self.api_keys.get(k)]
         ## if any api key is missing will log and raise the custom exception
         if missing:
             self.log.error("Missing environmentvariables", missing_vars = missing)
@@ -42,21 +106,58 @@ class ModelLoader():
     def load_embedding_model(self):
         '''Load and return embedding model'''
         try:
-            self.log.info('Loading the embedding model...')
             model_name = self.config['embedding_model']['model_name']
-            return OpenAIEmbeddings(model=model_name)
+            provider = self._providers(self.config)[1]
+            key = ('embedding', provider, model_name)
+
+            def _build():
+                self.log.info('Loading the embedding model...', model_name=model_name,
+                              provider=provider)
+                if provider == 'fake':
+                    ## offline stand-in for benchmarks, no network calls
+                    fake_cfg = self.config['embedding_model'].get('fake') or {}
+                    model = DeterministicEmbeddings(
+                        size=int(fake_cfg.get('dimensions', 64)),
+                        latency_s=float(fake_cfg.get('latency_s', 0.0)),
+                        texts_per_second=float(fake_cfg.get('texts_per_second', 0.0)),
+                    )
+                    return self._with_embedding_cache(model, f"fake-{model.size}")
+                return self._with_embedding_cache(OpenAIEmbeddings(model=model_name), model_name)
+
+            return self._get_or_create(key, _build)
         except Exception as e:
             self.log.error('Error loading embedding model', error=str(e))
             raise DocumentPortalException('Failed to load embedding model',sys)
     
-    def load_llm(self):
-        '''Load the LLM models dynamically based on provider in cofig and return it'''
+    def _with_embedding_cache(self, model, model_name: str):
+        '''Wrap embeddings with the on-disk embedding cache when it is enabled in config'''
+        cache_cfg = self.config.get('embedding_cache') or {}
+        if not cache_cfg.get('enabled', False):
+            return model
+        self.log.info("Embedding cache enabled", cache_dir=cache_cfg.get('cache_dir'),
+                      max_size_mb=cache_cfg.get('max_size_mb'))
+        return CachedEmbeddings(
+            model,
+            model_name=model_name,
+            cache_dir=cache_cfg.get('cache_dir', 'cache/embeddings'),
+            dimensions=self.config['embedding_model'].get('dimensions'),
+            max_size_mb=cache_cfg.get('max_size_mb', 1024),
+        )
+
+    def embedding_key(self) -> str:
+        '''Identity of the embedding model; stored vectors are only reused under the same key'''
+        provider = self._providers(self.config)[1]
+        emb_cfg = self.config['embedding_model']
+        if provider == 'fake':
+            return f"fake:{int((emb_cfg.get('fake') or {}).get('dimensions', 64))}"
+        return f"{provider}:{emb_cfg['model_name']}:{emb_cfg.get('dimensions')}"
+
+    def _llm_key(self) -> Tuple:
+        '''Registry key of the LLM selected by LLM_PROVIDER and the llm config block'''
         ## loading the complete llm block from yaml file
         llm_block = self.config['llm']
         
-        self.log.info("Loading LLM...")
-        
-        ## If we have defined the LLM provider it will take that else it will take google
+        ## If we have defined the LLM provider it will take that else it will take openai
         provider_key = os.getenv('LLM_PROVIDER','openai')
         
         if provider_key not in llm_block:
@@ -64,6 +165,37 @@ class ModelLoader():
             raise ValueError(f"Provider '{provider_key}' not found in cofig")
         
         llm_config = llm_block[provider_key]
+        return ('llm', provider_key, llm_config.get('provider'), llm_config.get('model_name'),
+                llm_config.get('temperature'), llm_config.get('max_output_tokens'))
+
+    def llm_key(self) -> Tuple:
+        '''Provider, model and sampling settings of the current LLM (e.g. for result cache keys)'''
+        return self._llm_key()
+
+    def load_llm(self):
+        '''Load the LLM models dynamically based on provider in cofig and return it'''
+        key = self._llm_key()
+        return self._get_or_create(key, lambda: self._build_llm(key[1]))
+
+    def get_chain(self, name: str, builder: Callable[[Any], Any]):
+        '''Return a prebuilt LCEL chain for the current LLM, building it once with builder(llm)'''
+        key = ('chain', name) + self._llm_key()
+        chain = ModelLoader._chains.get(key)
+        if chain is None:
+            with ModelLoader._lock:
+                chain = ModelLoader._chains.get(key)
+                if chain is None:
+                    ## the tag labels this chain's LLM calls in the metrics
+                    chain = builder(self.load_llm()).with_config(tags=[f"chain:{name}"])
+                    ModelLoader._chains[key] = chain
+                    self.log.info("LCEL chain registered", chain=name)
+        return chain
+
+    def _build_llm(self, provider_key: str):
+        '''Build a new LLM client for the given provider block'''
+        self.log.info("Loading LLM...")
+
+        llm_config = self.config['llm'][provider_key]
         provider = llm_config.get('provider')
         model_name = llm_config.get('model_name')
         temperature = llm_config.get('temperature')
@@ -71,11 +203,19 @@ class ModelLoader():
         
         self.log.info("Loading LLM", provider=provider,model_name=model_name, temperature=temperature, max_tokens= max_tokens)
         
+        ## latency, token and cost metrics of every call of this client
+        callbacks = [LLMMetricsHandler(
+            model_name,
+            input_cost_per_1m=float(llm_config.get('input_cost_per_1m_tokens') or 0.0),
+            output_cost_per_1m=float(llm_config.get('output_cost_per_1m_tokens') or 0.0),
+        )]
+
         if provider == 'openai':
             llm = ChatOpenAI(
                 model = model_name,
                 temperature=temperature,
-                max_tokens = max_tokens
+                max_tokens = max_tokens,
+                callbacks = callbacks
             )
             return llm
         
@@ -83,13 +223,30 @@ class ModelLoader():
             llm = ChatGoogleGenerativeAI(
                 model = model_name,
                 temperature=temperature,
-                max_output = max_tokens
+                max_output = max_tokens,
+                callbacks = callbacks
+            )
+            return llm
+
+        elif provider == 'fake':
+            ## offline stand-in for benchmarks, no network calls
+            llm = FakeChatModel(
+                latency_s = llm_config.get('latency_s', 0.0),
+                prompt_tokens_per_second = llm_config.get('prompt_tokens_per_second', 0.0),
+                tokens_per_second = llm_config.get('tokens_per_second', 0.0),
+                callbacks = callbacks,
             )
             return llm
         
         else:
             self.log.error("Unsupported LLM provider", provider = provider)
             raise ValueError(f'Unsupported LLM Provider : {provider}')
+
+
+@lru_cache(maxsize=1)
+def get_model_loader() -> ModelLoader:
+    '''Shared ModelLoader for the process'''
+    return ModelLoader()
         
 
 if __name__=='__main__':
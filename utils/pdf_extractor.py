@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import fitz
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+from utils.concurrency import get_process_executor
+from utils.file_io import file_sha256
+from utils.metrics import record_cache
+
+log = CustomLogger().get_logger(__name__)
+
+
+@dataclass
+class PageText:
+    """Text of one PDF page. `index` is 0-based like PyPDFLoader's `page` metadata."""
+    index: int
+    text: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def number(self) -> int:
+        '''1-based page number'''
+        return self.index + 1
+
+
+class PageTextCache:
+    """Extracted page texts on disk, one JSON-lines file (a page per line) per PDF content hash.
+
+    Reads refresh an entry's mtime; gc() (run by the storage sweep) removes entries unused
+    for ttl_s, then the least recently used ones while the cache is larger than max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, ttl_s: float = 30 * 24 * 3600, max_bytes: int = 0,
+                 gc_interval_s: float = 6 * 3600):
+        self.log = CustomLogger().get_logger(__name__)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.gc_interval_s = gc_interval_s
+        self._last_gc = 0.0
+
+    def _path(self, file_hash: str) -> Path:
+        return self.cache_dir / f"{file_hash}.jsonl"
+
+    def __contains__(self, file_hash: str) -> bool:
+        return self._path(file_hash).exists()
+
+    def iter_pages(self, file_hash: str) -> Iterator[str]:
+        '''Cached page texts of the file, in page order'''
+        path = self._path(file_hash)
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            for line in f:
+                yield json.loads(line)
+
+    def writer(self, file_hash: str) -> "_PageCacheWriter":
+        '''Writer filling the cache entry of file_hash'''
+        return _PageCacheWriter(self._path(file_hash))
+
+    def gc_due(self) -> bool:
+        '''True once gc_interval_s passed since the last gc'''
+        return time.time() - self._last_gc >= self.gc_interval_s
+
+    def gc(self) -> Dict[str, int]:
+        '''Remove entries unused for ttl_s, then the oldest ones down to max_bytes
+        (0: no size bound)'''
+        self._last_gc = time.time()
+        cutoff = self._last_gc - self.ttl_s
+        removed = freed = 0
+        entries = []
+        ## temp files of writers that died mid-extraction are removed once as old as the TTL
+        for path in self.cache_dir.glob("*.tmp"):
+            try:
+                st = path.stat()
+                if st.st_mtime < cutoff:
+                    path.unlink()
+                    freed += st.st_size
+            except FileNotFoundError:
+                continue
+        for path in self.cache_dir.glob("*.jsonl"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort(key=lambda e: e[0])
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if mtime >= cutoff and not (self.max_bytes and total > self.max_bytes):
+                break
+            ## an open reader keeps its file handle, the next lookup is a miss
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            removed += 1
+            freed += size
+            total -= size
+        result = {"removed_entries": removed, "freed_bytes": freed, "total_bytes": total}
+        if removed:
+            self.log.info("Page text cache garbage collected", **result)
+        return result
+
+
+class _PageCacheWriter:
+    """Appends pages to a temp file that only replaces the cache entry once complete."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        self._f = open(self.tmp, "w", encoding="utf-8")
+
+    def write(self, text: str):
+        '''Append the text of the next page'''
+        self._f.write(json.dumps(text, ensure_ascii=False) + "\n")
+
+    def commit(self):
+        '''Publish the complete entry'''
+        self._f.close()
+        os.replace(self.tmp, self.path)
+
+    def discard(self):
+        '''Drop the partial entry'''
+        self._f.close()
+        if self.tmp.exists():
+            self.tmp.unlink()
+
+
+@lru_cache(maxsize=1)
+def _extraction_config() -> dict:
+    return load_config().get("pdf_extraction") or {}
+
+
+@lru_cache(maxsize=1)
+def get_page_cache() -> Optional[PageTextCache]:
+    '''Shared page text cache, None when disabled in config'''
+    cfg = _extraction_config()
+    if not cfg.get("page_cache", True):
+        return None
+    return PageTextCache(
+        cfg.get("page_cache_dir", "cache/pages"),
+        ttl_s=float(cfg.get("page_cache_ttl_hours", 720)) * 3600,
+        max_bytes=int(float(cfg.get("page_cache_max_mb", 2048)) * 1024 * 1024),
+        gc_interval_s=float(cfg.get("page_cache_gc_interval_hours", 6)) * 3600,
+    )
+
+
+def _page_metadata(path: str, index: int, total_pages: int) -> Dict[str, Any]:
+    return {"source": str(path), "page": index, "total_pages": total_pages}
+
+
+def pdf_page_count(path: str) -> int:
+    '''Number of pages, without extracting any text'''
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def iter_pdf_pages(path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[PageText]:
+    '''Yield pages one at a time; only the current page is held in memory'''
+    with fitz.open(path) as doc:
+        if doc.needs_pass:
+            raise ValueError(f"PDF is encrypted: {Path(path).name}")
+        total = doc.page_count
+        stop = total if stop is None else min(stop, total)
+        for index in range(start, stop):
+            page = doc.load_page(index)
+            text = page.get_text()
+            page = None
+            yield PageText(index, text, _page_metadata(path, index, total))
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    '''Process pool task: text of pages [start, stop)'''
+    return [(p.index, p.text) for p in iter_pdf_pages(path, start, stop)]
+
+
+def _iter_pooled(path: str, total: int, pages_per_task: int) -> Iterator[PageText]:
+    '''Fan page ranges out over the process pool and yield pages in order.
+    At most two ranges per worker are in flight, so memory stays bounded for huge files.
+    '''
+    executor = get_process_executor()
+    window = 2 * int((load_config().get("concurrency") or {}).get("process_workers", 4))
+    ranges = deque((s, min(s + pages_per_task, total)) for s in range(0, total, pages_per_task))
+    pending = deque()
+    while ranges or pending:
+        while ranges and len(pending) < window:
+            start, stop = ranges.popleft()
+            pending.append(executor.submit(_extract_range, str(path), start, stop))
+        for index, text in pending.popleft().result():
+            yield PageText(index, text, _page_metadata(path, index, total))
+
+
+def extract_pdf_pages(path: str, use_cache: bool = True, parallel: Optional[bool] = None,
+                      file_hash: Optional[str] = None) -> Iterator[PageText]:
+    '''Stream the pages of a PDF.
+
+    Served from the page text cache when this exact file (by SHA-256) was extracted
+    before; large files (min_pages_for_pool and up) are extracted in parallel on the
+    process pool, small ones inline. `parallel=False` forces inline extraction.
+    Pass `file_hash` when the SHA-256 is already known (e.g. computed during upload).
+    '''
+    try:
+        cfg = _extraction_config()
+        cache = get_page_cache() if use_cache else None
+        if cache is not None and file_hash is None:
+            file_hash = file_sha256(path)
+
+        if cache is not None and file_hash in cache:
+            record_cache("pdf_pages", hits=1)
+            total = pdf_page_count(path)
+            for index, text in enumerate(cache.iter_pages(file_hash)):
+                yield PageText(index, text, _page_metadata(path, index, total))
+            log.info("PDF pages served from cache", path=str(path), pages=total)
+            return
+
+        if cache is not None:
+            record_cache("pdf_pages", misses=1)
+        total = pdf_page_count(path)
+        pooled = parallel is not False and total >= int(cfg.get("min_pages_for_pool", 64))
+        pages = (_iter_pooled(path, total, int(cfg.get("pages_per_task", 32))) if pooled
+                 else iter_pdf_pages(path))
+
+        ## pages are written to the cache as they stream, the entry is published only when complete
+        writer = cache.writer(file_hash) if cache is not None else None
+        try:
+            for page in pages:
+                if writer is not None:
+                    writer.write(page.text)
+                yield page
+        except BaseException:
+            if writer is not None:
+                writer.discard()
+            raise
+        if writer is not None:
+            writer.commit()
+        log.info("PDF pages extracted", path=str(path), pages=total, pooled=pooled)
+
+    except ValueError:
+        raise
+    except Exception as e:
+        log.error("Failed to extract PDF pages", path=str(path), error=str(e))
+        raise DocumentPortalException("Failed to extract PDF pages", sys)
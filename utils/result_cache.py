@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+from utils.metrics import record_cache
+from prompts.prompt_library import PROMPT_REGISTRY
+
+
+def prompt_version(name: str) -> str:
+    '''Short hash of a registered prompt template, changes whenever its text changes'''
+    return hashlib.sha256(PROMPT_REGISTRY[name].pretty_repr().encode("utf-8")).hexdigest()[:16]
+
+
+def result_key(kind: str, content_hashes: Iterable[str], prompt_names: Iterable[str],
+               model_key: Iterable[Any], settings: Optional[Dict[str, Any]] = None) -> str:
+    '''Cache key of an LLM result: input documents, prompt versions, model and
+    output-affecting settings'''
+    payload = {
+        "kind": kind,
+        "content": list(content_hashes),
+        "prompts": {name: prompt_version(name) for name in prompt_names},
+        "model": [str(part) for part in model_key],
+        "settings": settings or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Persistent JSON result cache in SQLite with TTL expiry and LRU eviction by total size.
+
+    Safe to share between threads and between worker processes using the same file.
+    """
+
+    def __init__(self, db_path: str, ttl_s: float, max_bytes: int):
+        self.log = CustomLogger().get_logger(__name__)
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, kind TEXT, "
+                            "value TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, "
+                            "last_access REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_results_access ON results(last_access)")
+            self.db.commit()
+        except Exception as e:
+            self.log.error("Failed to open result cache", error=str(e), db_path=db_path)
+            raise DocumentPortalException("Failed to open result cache", sys)
+
+    def get(self, key: str) -> Optional[Any]:
+        '''Cached value of key, or None if absent or older than ttl_s'''
+        now = time.time()
+        with self._lock:
+            row = self.db.execute("SELECT value, created FROM results WHERE key=?",
+                                  (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_s:
+                if row is not None:
+                    self.db.execute("DELETE FROM results WHERE key=?", (key,))
+                    self.db.commit()
+                self.misses += 1
+                record_cache("result", misses=1)
+                return None
+            self.db.execute("UPDATE results SET last_access=? WHERE key=?", (now, key))
+            self.db.commit()
+            self.hits += 1
+        record_cache("result", hits=1)
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any, kind: str = ""):
+        '''Store value under key, evicting the least recently used entries over max_bytes'''
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO results(key, kind, value, size, created, "
+                            "last_access) VALUES (?,?,?,?,?,?)",
+                            (key, kind, data, len(data), now, now))
+            self._evict(now)
+            self.db.commit()
+
+    def _evict(self, now: float):
+        self.db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl_s,))
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        ## oldest access first until back under budget
+        evicted = 0
+        rows = self.db.execute("SELECT key, size FROM results ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM results WHERE key=?", (key,))
+            total -= size
+            evicted += 1
+        self.log.info("Result cache evicted entries", evicted=evicted, size_bytes=total)
+
+    def clear(self):
+        '''Drop every cached result'''
+        with self._lock:
+            self.db.execute("DELETE FROM results")
+            self.db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        '''Entry count, bytes and hit/miss counters'''
+        with self._lock:
+            entries, size = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+@lru_cache(maxsize=1)
+def get_result_cache() -> Optional[ResultCache]:
+    '''Shared result cache for the process, None when disabled in config'''
+    cfg = load_config().get("result_cache") or {}
+    if not cfg.get("enabled", False):
+        return None
+    return ResultCache(
+        db_path=os.getenv("RESULT_CACHE_PATH", cfg.get("path", "cache/results.sqlite")),
+        ttl_s=float(cfg.get("ttl_hours", 168)) * 3600,
+        max_bytes=int(cfg.get("max_size_mb", 256)) * 1024 * 1024,
+    )
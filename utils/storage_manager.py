@@ -0,0 +1,446 @@
+import os
+import re
+import sys
+import time
+import shutil
+import asyncio
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+try:
+    import fcntl
+except ImportError:     ## Windows: no advisory locks, single worker deployments only
+    fcntl = None
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.config_loader import load_config
+from utils.concurrency import run_blocking
+from utils.faiss_index import index_lock
+from utils.file_io import UploadTooLargeError
+from utils.blob_store import get_blob_store
+from utils.job_store import get_job_store
+from utils.pdf_extractor import get_page_cache
+from utils.vectorstore_cache import get_vectorstore_cache
+
+## kinds of per-session directories
+ANALYSIS, COMPARE, CHAT_UPLOADS, FAISS = "analysis", "compare", "chat_uploads", "faiss"
+
+## directory names produced by utils.file_io.new_session_id, the only ones adopted by the
+## startup scan
+SESSION_DIR_RE = re.compile(r"^[A-Za-z]+_\d{8}_\d{6}_[0-9a-f]{8}$")
+
+SWEEP_LOCK_FILE = ".storage_sweep.lock"
+
+
+class QuotaExceededError(UploadTooLargeError):
+    """An upload would take a session over its storage quota"""
+
+
+def _chat_memory():
+    ## chat histories are keyed by the same session ids; imported lazily, utils does not
+    ## depend on src
+    from src.document_chat.chat_memory import get_chat_memory
+    return get_chat_memory()
+
+
+def dir_size(path) -> int:
+    '''Bytes of the regular files below path (0 when it does not exist).
+    Hard-linked files (shared through the blob store) are charged pro rata to their links.
+    '''
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    total += dir_size(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    total += st.st_size // max(1, st.st_nlink)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return total
+
+
+@contextmanager
+def _try_lock(path: Path):
+    '''Non-blocking exclusive advisory lock, yields whether it was acquired'''
+    if fcntl is None:
+        yield True
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+", encoding="utf-8") as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class StorageManager:
+    """Size and last access of every per-session directory (uploads and FAISS indexes).
+
+    Writers report the directory they wrote (record_write), queries report reads (touch);
+    both are throttled SQLite updates shared by all workers. A background sweep evicts
+    sessions idle for longer than the TTL, then the least recently used ones while the
+    total is over max_total_bytes. Sweeps read the session table through its last_access
+    index and never walk the file tree, so their cost does not grow with the number of
+    sessions kept. A session is never evicted while it was used within min_idle_s, is
+    pinned by this process, has a queued or running index job, or one of its indexes is
+    locked by a reader/writer in another worker.
+    """
+
+    def __init__(self, db_path: str, roots: Optional[Dict[str, str]] = None,
+                 max_total_bytes: int = 0, max_session_bytes: int = 0,
+                 ttl_s: float = 168 * 3600, min_idle_s: float = 600,
+                 low_watermark: float = 0.9, max_evictions_per_sweep: int = 200,
+                 touch_interval_s: float = 60):
+        self.log = CustomLogger().get_logger(__name__)
+        self.db_path = db_path
+        self.roots = {kind: Path(path) for kind, path in (roots or {}).items()}
+        self.max_total_bytes = max_total_bytes
+        self.max_session_bytes = max_session_bytes
+        self.ttl_s = ttl_s
+        self.min_idle_s = min_idle_s
+        self.low_watermark = low_watermark
+        self.max_evictions_per_sweep = max_evictions_per_sweep
+        self.touch_interval_s = touch_interval_s
+        self._lock = threading.Lock()
+        self._pins: Counter = Counter()
+        self._touched: Dict[str, float] = {}
+        self._adopted = False
+        self.last_sweep: Dict[str, Any] = {}
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS storage_sessions "
+                            "(session_id TEXT PRIMARY KEY, bytes INTEGER NOT NULL DEFAULT 0, "
+                            "created REAL NOT NULL, last_access REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_storage_sessions_access "
+                            "ON storage_sessions(last_access)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS storage_paths "
+                            "(path TEXT PRIMARY KEY, session_id TEXT NOT NULL, "
+                            "kind TEXT NOT NULL, bytes INTEGER NOT NULL DEFAULT 0)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_storage_paths_session "
+                            "ON storage_paths(session_id)")
+            self.db.commit()
+        except Exception as e:
+            self.log.error("Failed to open storage manager", error=str(e), db_path=db_path)
+            raise DocumentPortalException("Failed to open storage manager", sys)
+
+    @staticmethod
+    def _key(path) -> str:
+        return os.path.realpath(path)
+
+    def _inside_roots(self, key: str) -> bool:
+        '''Whether a resolved path lies strictly below one of the session roots (never a root
+        or above it)'''
+        for root in self.roots.values():
+            root_key = self._key(root)
+            if key != root_key and os.path.commonpath([key, root_key]) == root_key:
+                return True
+        return False
+
+    def session_bytes(self, session_id: str) -> int:
+        '''Bytes recorded for the session'''
+        with self._lock:
+            row = self.db.execute("SELECT bytes FROM storage_sessions WHERE session_id=?",
+                                  (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def check_quota(self, session_id: str, incoming_bytes: int = 0):
+        '''Raise QuotaExceededError when incoming_bytes more would take the session over its
+        quota'''
+        if not self.max_session_bytes:
+            return
+        used = self.session_bytes(session_id)
+        if used + incoming_bytes > self.max_session_bytes:
+            raise QuotaExceededError(f"Session {session_id} would use {used + incoming_bytes} "
+                                     f"bytes, quota is {self.max_session_bytes} bytes")
+
+    def record_write(self, kind: str, session_id: str, path):
+        '''Re-measure one session directory after a write (only that directory is walked)'''
+        try:
+            key = self._key(path)
+            if not self._inside_roots(key):
+                ## only directories below a root are ever evicted: refuse to track anything else
+                self.log.warning("Session storage outside the storage roots not tracked",
+                                 session_id=session_id,
+                                 path=key)
+                return
+            size = dir_size(key)
+            now = time.time()
+            with self._lock:
+                row = self.db.execute("SELECT bytes FROM storage_paths WHERE path=?",
+                                      (key,)).fetchone()
+                delta = size - (row[0] if row else 0)
+                self.db.execute("INSERT INTO storage_paths(path, session_id, kind, bytes) "
+                                "VALUES (?,?,?,?) ON CONFLICT(path) DO UPDATE SET "
+                                "bytes=excluded.bytes", (key, session_id, kind, size))
+                self.db.execute("INSERT INTO storage_sessions(session_id, bytes, created, "
+                                "last_access) VALUES (?,?,?,?) ON CONFLICT(session_id) "
+                                "DO UPDATE SET bytes=bytes+?, last_access=excluded.last_access",
+                                (session_id, delta, now, now, delta))
+                self.db.commit()
+                self._touched[session_id] = now
+        except Exception as e:
+            ## accounting is best effort, the write itself already succeeded
+            self.log.error("Failed to record session storage", error=str(e),
+                           session_id=session_id, path=str(path))
+
+    def touch(self, session_id: str):
+        '''Mark a session as used; the database is written at most once per touch_interval_s'''
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(session_id, 0.0) < self.touch_interval_s:
+                return
+            self._touched[session_id] = now
+            try:
+                self.db.execute("UPDATE storage_sessions SET last_access=? WHERE session_id=?",
+                                (now, session_id))
+                self.db.commit()
+            except Exception as e:
+                self.log.error("Failed to touch session", error=str(e), session_id=session_id)
+
+    @contextmanager
+    def pin(self, path):
+        '''Protect a directory from eviction for the duration of the block (this process)'''
+        key = self._key(path)
+        with self._lock:
+            self._pins[key] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if self._pins[key] <= 0:
+                    del self._pins[key]
+
+    def adopt_existing(self) -> int:
+        '''Register session directories written before tracking existed (one listing per root)'''
+        with self._lock:
+            known = {row[0] for row in self.db.execute("SELECT path FROM storage_paths")}
+        adopted = 0
+        for kind, root in self.roots.items():
+            if not root.is_dir():
+                continue
+            for entry in os.scandir(root):
+                if not entry.is_dir(follow_symlinks=False) or not SESSION_DIR_RE.match(entry.name):
+                    continue
+                key = self._key(entry.path)
+                if key in known:
+                    continue
+                size = dir_size(key)
+                last_access = entry.stat().st_mtime
+                with self._lock:
+                    self.db.execute("INSERT OR IGNORE INTO storage_paths(path, session_id, kind, "
+                                    "bytes) VALUES (?,?,?,?)",
+                                    (key, entry.name, kind, size))
+                    self.db.execute("INSERT INTO storage_sessions(session_id, bytes, created, "
+                                    "last_access) VALUES (?,?,?,?) "
+                                    "ON CONFLICT(session_id) DO UPDATE SET bytes=bytes+?, "
+                                    "last_access=MAX(last_access, excluded.last_access)",
+                                    (entry.name, size, last_access, last_access, size))
+                    self.db.commit()
+                adopted += 1
+        if adopted:
+            self.log.info("Existing session directories adopted", sessions=adopted)
+        return adopted
+
+    def _active_job_dirs(self) -> Set[str]:
+        try:
+            return set(get_job_store().active_session_keys("chat_index"))
+        except Exception as e:
+            self.log.error("Failed to read active index jobs", error=str(e))
+            return set()
+
+    def _evict(self, session_id: str, last_access: float, busy: Set[str]) -> Optional[int]:
+        '''Remove every directory of a session, None when it is in use'''
+        with self._lock:
+            paths = self.db.execute("SELECT path, kind FROM storage_paths WHERE session_id=?",
+                                    (session_id,)).fetchall()
+            if any(path in self._pins or path in busy for path, _ in paths):
+                return None
+            ## claimed only if nobody used the session since it was selected
+            claimed = self.db.execute("DELETE FROM storage_sessions "
+                                      "WHERE session_id=? AND last_access=?",
+                                      (session_id, last_access)).rowcount
+            self.db.commit()
+        if not claimed:
+            return None
+        freed = 0
+        kept = []
+        for path, kind in paths:
+            if not self._inside_roots(path):
+                ## tracked before the roots changed (or tampered with): forget it, never delete it
+                self.log.warning("Evicted session path outside the storage roots left in place",
+                                 path=path)
+                continue
+            if kind == FAISS and os.path.isdir(path):
+                ## readers/writers of other workers hold the index lock: leave the index for a
+                ## later sweep
+                try:
+                    with index_lock(path, exclusive=True, blocking=False):
+                        size = dir_size(path)
+                        shutil.rmtree(path, ignore_errors=True)
+                except BlockingIOError:
+                    kept.append((path, kind))
+                    continue
+                get_vectorstore_cache().invalidate(path)
+            else:
+                size = dir_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+            freed += size
+        with self._lock:
+            marks = ",".join("?" * len(kept))
+            self.db.execute(f"DELETE FROM storage_paths WHERE session_id=? "
+                            f"AND path NOT IN ({marks})", (session_id, *[path for path, _ in kept]))
+            if kept:
+                ## the locked index stays tracked (as just used) and is retried later
+                now = time.time()
+                self.db.execute("INSERT INTO storage_sessions(session_id, bytes, created, "
+                                "last_access) VALUES (?,?,?,?)",
+                                (session_id, sum(dir_size(p) for p, _ in kept), now, now))
+            self.db.commit()
+        ## the history of a chat over an evicted index is of no use any more (kept while the
+        ## index is)
+        try:
+            memory = _chat_memory() if not kept else None
+            if memory is not None:
+                memory.clear(session_id)
+        except Exception as e:
+            self.log.warning("Chat history of evicted session not removed", session_id=session_id,
+                             error=str(e))
+        self.log.info("Session storage evicted", session_id=session_id, freed_bytes=freed,
+                      paths=len(paths) - len(kept), kept_locked=len(kept))
+        return freed
+
+    def sweep(self) -> Dict[str, Any]:
+        '''Evict expired sessions, then least recently used ones down to
+        low_watermark * max_total_bytes.
+        Only one worker sweeps at a time; the others skip.
+        '''
+        start = time.perf_counter()
+        with _try_lock(Path(self.db_path).parent / SWEEP_LOCK_FILE) as acquired:
+            if not acquired:
+                return {"skipped": True}
+            if not self._adopted:
+                self.adopt_existing()
+                self._adopted = True
+            now = time.time()
+            with self._lock:
+                total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) "
+                                        "FROM storage_sessions").fetchone()[0]
+                ## oldest first, through the last_access index; recently used sessions are
+                ## never candidates
+                candidates = self.db.execute("SELECT session_id, last_access, bytes "
+                                             "FROM storage_sessions WHERE last_access<? "
+                                             "ORDER BY last_access LIMIT ?",
+                                             (now - self.min_idle_s,
+                                              self.max_evictions_per_sweep)).fetchall()
+            target = (int(self.max_total_bytes * self.low_watermark) if self.max_total_bytes
+                      else None)
+            over_quota = self.max_total_bytes and total > self.max_total_bytes
+            busy = self._active_job_dirs() if candidates else set()
+            evicted = skipped = freed = 0
+            for session_id, last_access, size in candidates:
+                expired = last_access < now - self.ttl_s
+                if not expired and not (over_quota and total > target):
+                    break
+                result = self._evict(session_id, last_access, busy)
+                if result is None:
+                    skipped += 1
+                    continue
+                evicted += 1
+                freed += result
+                total -= size
+            self.last_sweep = {"at": now, "evicted": evicted, "skipped_in_use": skipped,
+                               "freed_bytes": freed, "total_bytes": total,
+                               "seconds": round(time.perf_counter() - start, 4)}
+            ## shared blobs no session references any more; walks the blob store, so only
+            ## every gc_interval
+            blobs = get_blob_store()
+            if blobs is not None and blobs.gc_due():
+                self.last_sweep["blob_gc"] = blobs.gc()
+            pages = get_page_cache()
+            if pages is not None and pages.gc_due():
+                self.last_sweep["page_cache_gc"] = pages.gc()
+            memory = _chat_memory()
+            if memory is not None:
+                self.last_sweep["chat_sessions_expired"] = memory.purge_expired()
+        if evicted or skipped:
+            self.log.info("Storage sweep finished", **self.last_sweep)
+        return self.last_sweep
+
+    async def run_sweeper(self, interval_s: float):
+        '''Background task: sweep every interval_s until cancelled'''
+        while True:
+            try:
+                await run_blocking(self.sweep)
+            except Exception as e:
+                self.log.error("Storage sweep failed", error=str(e))
+            await asyncio.sleep(interval_s)
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        '''Usage totals, per kind bytes and the largest sessions'''
+        with self._lock:
+            sessions, total, oldest = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0), MIN(last_access) "
+                "FROM storage_sessions").fetchone()
+            by_kind = dict(self.db.execute("SELECT kind, SUM(bytes) FROM storage_paths "
+                                           "GROUP BY kind").fetchall())
+            largest = self.db.execute("SELECT session_id, bytes, last_access FROM storage_sessions "
+                                      "ORDER BY bytes DESC LIMIT ?", (top,)).fetchall()
+            pinned = len(self._pins)
+        return {
+            "sessions": sessions,
+            "total_bytes": total,
+            "max_total_bytes": self.max_total_bytes,
+            "max_session_bytes": self.max_session_bytes,
+            "bytes_by_kind": by_kind,
+            "oldest_access": oldest,
+            "pinned_paths": pinned,
+            "largest_sessions": [{"session_id": s, "bytes": b, "last_access": a}
+                                 for s, b, a in largest],
+            "last_sweep": self.last_sweep,
+        }
+
+
+def storage_roots(cfg: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    '''Per-kind base directories, with the same env overrides the writers use'''
+    roots = dict((cfg or {}).get("roots") or {})
+    env = {ANALYSIS: "DATA_STORAGE_PATH", CHAT_UPLOADS: "UPLOAD_BASE", FAISS: "FAISS_BASE"}
+    for kind, var in env.items():
+        if os.getenv(var):
+            roots[kind] = os.environ[var]
+    return roots
+
+
+@lru_cache(maxsize=1)
+def get_storage_manager() -> Optional[StorageManager]:
+    '''Shared storage manager for the process, None when disabled in config'''
+    cfg = load_config().get("storage") or {}
+    if not cfg.get("enabled", True):
+        return None
+    return StorageManager(
+        os.getenv("STORAGE_DB_PATH", cfg.get("path", "cache/storage.sqlite")),
+        roots=storage_roots(cfg),
+        max_total_bytes=int(float(cfg.get("max_total_gb", 0)) * 1024 ** 3),
+        max_session_bytes=int(float(cfg.get("max_session_mb", 0)) * 1024 ** 2),
+        ttl_s=float(cfg.get("ttl_hours", 168)) * 3600,
+        min_idle_s=float(cfg.get("min_idle_minutes", 10)) * 60,
+        low_watermark=float(cfg.get("low_watermark", 0.9)),
+        max_evictions_per_sweep=int(cfg.get("max_evictions_per_sweep", 200)),
+        touch_interval_s=float(cfg.get("touch_interval_s", 60)),
+    )
@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+## average characters per token for English text, used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception:
+        ## tiktoken missing or its encoding files cannot be fetched (offline)
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = "o200k_base") -> int:
+    '''Number of tokens in text, estimated from its length if no tokenizer is available'''
+    enc = _encoding(encoding_name)
+    if enc is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(enc.encode(text, disallowed_special=()))
@@ -0,0 +1,157 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from logger.custom_logger import CustomLogger
+from utils.config_loader import load_config
+from utils.faiss_index import index_signature
+from utils.metrics import record_cache
+
+
+class VectorStoreCache:
+    """Process-level LRU cache of loaded FAISS vector stores, keyed by index directory.
+
+    Entry size is estimated from the index files on disk; once the memory budget is
+    exceeded the least recently used stores are dropped. Writers call invalidate() after
+    rewriting an index so the next query reloads it; writes from other worker processes are
+    noticed because the index file signature (inode, mtime) no longer matches.
+    Memory-mapped stores are charged only for their docstore, the vectors live in the
+    shared page cache.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.log = CustomLogger().get_logger(__name__)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[FAISS, int, Optional[Tuple[int, int]]]]" = (
+            OrderedDict())
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(index_path: str) -> str:
+        return os.path.realpath(index_path)
+
+    @staticmethod
+    def _estimate_bytes(index_path: str, mmapped: bool = False) -> int:
+        total = 0
+        for name in (("index.pkl",) if mmapped else ("index.faiss", "index.pkl")):
+            path = os.path.join(index_path, name)
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    def _drop_load_lock(self, key: str):
+        '''Forget the load lock of an index that left the cache (called under self._lock).
+        A lock being held stays: its loader is about to put the index back.
+        '''
+        lock = self._load_locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._load_locks[key]
+
+    def __contains__(self, index_path: str) -> bool:
+        with self._lock:
+            return self._key(index_path) in self._entries
+
+    def get(self, index_path: str):
+        '''Cached store of index_path, or None if absent or changed on disk'''
+        key = self._key(index_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                record_cache("vectorstore", misses=1)
+                return None
+            if entry[2] != index_signature(index_path):
+                ## replaced on disk, possibly by another worker
+                self._entries.pop(key)
+                self._total_bytes -= entry[1]
+                record_cache("vectorstore", misses=1)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_cache("vectorstore", hits=1)
+            return entry[0]
+
+    def get_or_load(self, index_path: str, loader: Callable[[], FAISS],
+                    mmapped: bool = False) -> FAISS:
+        '''Return the cached store for index_path, loading it once with loader() on a miss'''
+        vs = self.get(index_path)
+        if vs is not None:
+            return vs
+        key = self._key(index_path)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        ## one loader per index, concurrent queries for the same session wait for it
+        with load_lock:
+            vs = self.get(index_path)
+            if vs is not None:
+                return vs
+            ## signature taken before loading, so a write racing the load forces a reload
+            signature = index_signature(index_path)
+            vs = loader()
+            self.put(index_path, vs, mmapped=mmapped, signature=signature)
+            with self._lock:
+                self.misses += 1
+            return vs
+
+    def put(self, index_path: str, vs: FAISS, mmapped: bool = False,
+            signature: Optional[Tuple[int, int]] = None):
+        '''Cache a loaded store, evicting least recently used entries over the budget'''
+        key = self._key(index_path)
+        size = self._estimate_bytes(index_path, mmapped)
+        signature = signature or index_signature(index_path)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = (vs, size, signature)
+            self._total_bytes += size
+            ## evict least recently used, but always keep the entry just added
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                self._drop_load_lock(evicted_key)
+                self.log.info("Vector store evicted from cache", index_path=evicted_key,
+                              size_bytes=evicted_size)
+
+    def invalidate(self, index_path: str):
+        '''Drop the cached store of index_path'''
+        key = self._key(index_path)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._drop_load_lock(key)
+            if entry is not None:
+                self._total_bytes -= entry[1]
+                self.log.info("Vector store invalidated", index_path=key)
+
+    def clear(self):
+        '''Drop every cached store'''
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            for key in list(self._load_locks):
+                self._drop_load_lock(key)
+
+    def stats(self) -> Dict[str, int]:
+        '''Entry count, bytes and hit/miss counters'''
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_vectorstore_cache() -> VectorStoreCache:
+    '''Shared vector store cache for the process, sized from config'''
+    cfg = load_config().get("vectorstore_cache") or {}
+    return VectorStoreCache(max_bytes=int(cfg.get("max_memory_mb", 2048)) * 1024 * 1024)